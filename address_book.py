@@ -0,0 +1,117 @@
+"""
+Address book for the migration: cached header decoding and contact records.
+
+A mailbox has a few hundred distinct correspondents but tens of thousands of
+From/To headers, and decoding one (getaddresses, RFC 2047 decoding, charset
+fallbacks, formataddr) costs far more than a dictionary lookup. HeaderCache
+keeps the decoded form of the most recent raw header values (bounded LRU),
+and AddressBook interns one Contact per e-mail address, counting the
+messages it appears in, for the contacts summary written at the end of a run.
+"""
+import sys
+import csv
+import logging
+from collections import OrderedDict
+
+
+CACHE_SIZE = 8192  # distinct raw header values kept decoded
+
+
+class HeaderCache:
+    """Bounded LRU cache of decoded header values, keyed on (kind, raw value)."""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, kind, raw, decode):
+        """Return decode(raw), computed once per distinct raw value while it stays in the cache."""
+        key = (kind, raw)
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            value = self._entries[key] = decode(raw)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return value
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return f"{lookups} lookups, {rate:.1f}% hits, {len(self._entries)} cached values"
+
+
+def intern_address(name, email):
+    """(name, email) with both strings interned: repeated correspondents share one copy."""
+    return sys.intern(name), sys.intern(email)
+
+
+class Contact:
+    __slots__ = ("email", "name", "sent", "received")
+
+    def __init__(self, email, name=""):
+        self.email = email
+        self.name = name
+        self.sent = 0      # messages with this address as sender
+        self.received = 0  # messages with this address among the To recipients
+
+    @property
+    def messages(self):
+        return self.sent + self.received
+
+
+class AddressBook:
+    """One Contact per e-mail address (case-insensitive), with message counts."""
+
+    def __init__(self):
+        self._contacts = {}
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def contact(self, name, email):
+        if not email:
+            return None
+        key = email.lower()
+        contact = self._contacts.get(key)
+        if contact is None:
+            contact = self._contacts[key] = Contact(email, name)
+        elif name and not contact.name:
+            contact.name = name
+        return contact
+
+    def record(self, sender, recipients):
+        """Count one message: sender is a (name, email) pair, recipients a sequence of pairs."""
+        if sender:
+            contact = self.contact(*sender)
+            if contact:
+                contact.sent += 1
+        for name, email in recipients:
+            contact = self.contact(name, email)
+            if contact:
+                contact.received += 1
+
+    def contacts(self):
+        """Contacts, most frequent first."""
+        return sorted(self._contacts.values(), key=lambda c: (-c.messages, c.email.lower()))
+
+    def write_csv(self, path):
+        """Write the contacts summary (address, display name, message counts)."""
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(["email", "name", "messages", "sent", "received"])
+            for contact in self.contacts():
+                writer.writerow([contact.email, contact.name, contact.messages, contact.sent, contact.received])
+        logging.info(f"Contacts summary: {len(self._contacts)} addresses written to {path}")
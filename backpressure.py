@@ -0,0 +1,182 @@
+"""
+Adaptive back-pressure for the Outlook writer.
+
+Replaces the fixed "sleep 0.1 s every 10 messages": the controller measures
+the latency of every item written through COM and the errors Outlook returns
+when it is overloaded (RPC server busy / call rejected, out of memory or
+system resources, MAPI timeouts). The pause between items is 0 while Outlook
+keeps up; it doubles (up to MAX_DELAY) each time the recent latency drifts
+well above the healthy baseline or a busy error is seen, and halves again
+once the latency is back to normal.
+
+Every change of delay is logged with the figures that triggered it, so the
+thresholds can be tuned from migration.log.
+"""
+import time
+import logging
+
+
+# HRESULTs of an overloaded Outlook / MAPI session (signed 32-bit, as pywintypes reports them)
+BUSY_HRESULTS = {
+    -2147418111: "RPC_E_CALL_REJECTED",           # 0x80010001
+    -2147417846: "RPC_E_SERVERCALL_RETRYLATER",   # 0x8001010A
+    -2147023174: "RPC_S_SERVER_UNAVAILABLE",      # 0x800706BA
+    -2147023170: "RPC_S_CALL_FAILED",             # 0x800706BE
+    -2147024882: "E_OUTOFMEMORY",                 # 0x8007000E
+    -2147221234: "MAPI_E_NOT_ENOUGH_RESOURCES",   # 0x8004010E
+    -2147220735: "MAPI_E_TIMEOUT",                # 0x80040401
+}
+BUSY_MESSAGES = ("call was rejected", "server is busy", "out of memory or system resources",
+                 "not enough memory", "rpc server is unavailable")
+
+WINDOW = 20              # items per evaluation
+WARMUP = 50              # items measured before the baseline latency is trusted
+DEGRADED_FACTOR = 2.0    # recent latency above baseline * factor = degraded...
+DEGRADED_MIN = 0.05      # ...and at least this much slower (seconds): ignores jitter on fast items
+INITIAL_DELAY = 0.05     # first pause (seconds) when degradation starts
+MAX_DELAY = 5.0          # pause ceiling (seconds)
+MIN_DELAY = 0.01         # pauses below this are dropped to 0
+BUSY_RETRIES = 3         # attempts after the first at a write Outlook refused as busy
+
+
+def _signed32(value):
+    return value - (1 << 32) if value >= 0x80000000 else value
+
+
+def busy_error_name(error):
+    """
+    Name of the overload condition an exception reports (e.g.
+    "RPC_E_CALL_REJECTED"), or None for an ordinary error.
+    """
+    codes = []
+    hresult = getattr(error, 'hresult', None)
+    if isinstance(hresult, int):
+        codes.append(hresult)
+    args = getattr(error, 'args', ())
+    if args and isinstance(args[0], int):
+        codes.append(args[0])
+    # com_error(hresult, text, excepinfo, argerror): excepinfo[5] is the scode of DISP_E_EXCEPTION
+    if len(args) > 2 and isinstance(args[2], tuple) and len(args[2]) > 5 and isinstance(args[2][5], int):
+        codes.append(args[2][5])
+    for code in codes:
+        name = BUSY_HRESULTS.get(_signed32(code & 0xFFFFFFFF))
+        if name:
+            return name
+    text = str(error).lower()
+    for message in BUSY_MESSAGES:
+        if message in text:
+            return message
+    return None
+
+
+class BackPressure:
+    """
+    Exponential back-off driven by per-item latency and busy errors.
+
+    Call record() after every item (with the exception if it failed), then
+    pause() before the next one. A write that failed with a busy error is
+    retried (up to busy_retries times) after the pause. A disabled controller
+    (backends that do not go through COM) records nothing and never sleeps.
+    """
+
+    def __init__(self, enabled=True, window=WINDOW, warmup=WARMUP, degraded_factor=DEGRADED_FACTOR,
+                 degraded_min=DEGRADED_MIN, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY,
+                 busy_retries=BUSY_RETRIES, sleep=time.sleep):
+        self.enabled = enabled
+        self.window = window
+        self.warmup = warmup
+        self.degraded_factor = degraded_factor
+        self.degraded_min = degraded_min
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.busy_retries = busy_retries
+        self._sleep = sleep
+
+        self.delay = 0.0
+        self.baseline = None      # healthy per-item latency (slow moving average)
+        self._measured = 0
+        self._window_latencies = []
+
+        # Totals for the end-of-run summary
+        self.items = 0
+        self.busy_errors = 0
+        self.retries = 0          # busy writes attempted again
+        self.pauses = 0
+        self.paused_seconds = 0.0
+        self.peak_delay = 0.0
+        self.backoffs = 0
+
+    def record(self, latency, error=None):
+        """Account one item written in `latency` seconds (error: the exception if it failed)."""
+        if not self.enabled:
+            return
+        self.items += 1
+        busy = busy_error_name(error) if error is not None else None
+        if busy:
+            self.busy_errors += 1
+            # Do not wait for the end of the window: Outlook is refusing calls now
+            self._back_off(f"{busy} error")
+            self._reset_window()
+            return
+        self._window_latencies.append(latency)
+        if len(self._window_latencies) >= self.window:
+            self._evaluate()
+
+    def _reset_window(self):
+        self._window_latencies = []
+
+    def _evaluate(self):
+        latencies = sorted(self._window_latencies)
+        median = latencies[len(latencies) // 2]
+        self._reset_window()
+        self._measured += len(latencies)
+
+        if self._measured <= self.warmup or self.baseline is None:
+            # Warm-up: the fastest window wins (the first items pay Outlook's cold start)
+            self.baseline = median if self.baseline is None else min(self.baseline, median)
+            return
+        if median > self.baseline * self.degraded_factor and median - self.baseline > self.degraded_min:
+            # Degraded windows still nudge the baseline, so a lasting slowdown
+            # (e.g. a PST that has grown large) eventually becomes the new normal
+            self.baseline = 0.98 * self.baseline + 0.02 * median
+            self._back_off(f"median latency {median * 1000:.0f} ms > {self.degraded_factor:g}x "
+                           f"baseline {self.baseline * 1000:.0f} ms")
+            return
+        # Healthy window: it feeds the baseline, and any pause is relaxed
+        self.baseline = 0.9 * self.baseline + 0.1 * median
+        if self.delay > 0:
+            previous = self.delay
+            self.delay = self.delay / 2 if self.delay / 2 >= MIN_DELAY else 0.0
+            logging.info(f"Back-pressure: Outlook recovered (median {median * 1000:.0f} ms, "
+                         f"baseline {self.baseline * 1000:.0f} ms), pause {previous:.2f}s -> {self.delay:.2f}s")
+
+    def _back_off(self, reason):
+        previous = self.delay
+        self.delay = min(self.max_delay, max(self.initial_delay, self.delay * 2))
+        self.peak_delay = max(self.peak_delay, self.delay)
+        self.backoffs += 1
+        if self.delay != previous:
+            logging.info(f"Back-pressure: {reason}, pause {previous:.2f}s -> {self.delay:.2f}s")
+        else:
+            logging.debug(f"Back-pressure: {reason}, pause kept at {self.delay:.2f}s")
+
+    def should_retry(self, error, attempt):
+        """True if a write that failed with error on its attempt-th retry (0: first try) is worth another try."""
+        if attempt >= self.busy_retries or not busy_error_name(error):
+            return False
+        self.retries += 1
+        return True
+
+    def pause(self):
+        """Sleep for the current delay (no-op while Outlook keeps up)."""
+        if not self.enabled or self.delay <= 0:
+            return
+        self.pauses += 1
+        self.paused_seconds += self.delay
+        self._sleep(self.delay)
+
+    def summary(self):
+        return (f"{self.pauses} pauses ({self.paused_seconds:.1f}s), {self.busy_errors} busy errors "
+                f"({self.retries} writes retried), "
+                f"{self.backoffs} back-offs, peak pause {self.peak_delay:.2f}s, "
+                f"baseline latency {(self.baseline or 0) * 1000:.0f} ms")
@@ -0,0 +1,104 @@
+"""
+Throughput benchmark for the mmap MBOX framing engine (mbox_scanner.py)
+against the standard mailbox.mbox parser.
+
+Also checks that both return byte-for-byte identical messages, so it can be
+run on any export (inline images, attachments...) as a golden comparison.
+
+Usage:
+    python bench_mbox_scanner.py "fichier.mbox"
+    python bench_mbox_scanner.py "fichier.mbox" --no-verify
+"""
+import os
+import sys
+import time
+import mailbox
+import argparse
+
+from mbox_scanner import MboxScanner
+
+
+def _report(label, elapsed, count, size):
+    mb = size / (1024 * 1024)
+    rate_mb = mb / elapsed if elapsed > 0 else 0
+    rate_msg = count / elapsed if elapsed > 0 else 0
+    print(f"  {label:<32} {elapsed:8.2f}s  {rate_mb:9.1f} MB/s  {rate_msg:10.0f} msgs/s")
+
+
+def bench_framing(mbox_path, size):
+    """Boundary detection only (no MIME parsing)."""
+    t0 = time.perf_counter()
+    mbox = mailbox.mbox(mbox_path, create=False)
+    count = len(mbox)  # builds the table of contents
+    mbox.close()
+    _report("mailbox.mbox (table of contents)", time.perf_counter() - t0, count, size)
+
+    t0 = time.perf_counter()
+    with MboxScanner(mbox_path) as scanner:
+        count = sum(1 for _ in scanner.spans())
+    _report("MboxScanner.spans()", time.perf_counter() - t0, count, size)
+    return count
+
+
+def bench_parsing(mbox_path, size):
+    """Framing + full MIME parse of every message."""
+    t0 = time.perf_counter()
+    mbox = mailbox.mbox(mbox_path, create=False)
+    count = sum(1 for _ in mbox)
+    mbox.close()
+    _report("mailbox.mbox (iterate + parse)", time.perf_counter() - t0, count, size)
+
+    t0 = time.perf_counter()
+    with MboxScanner(mbox_path) as scanner:
+        count = sum(1 for start, stop in scanner.spans() if scanner.message(start, stop) is not None)
+    _report("MboxScanner (iterate + parse)", time.perf_counter() - t0, count, size)
+
+
+def verify(mbox_path):
+    """Compare spans, raw bytes and parsed messages with mailbox.mbox. Returns mismatch count."""
+    mbox = mailbox.mbox(mbox_path, create=False)
+    expected = [mbox._lookup(key) for key in mbox.keys()]
+    mismatches = 0
+    with MboxScanner(mbox_path) as scanner:
+        spans = list(scanner.spans())
+        if spans != expected:
+            print(f"  Span mismatch: {len(spans)} messages vs {len(expected)} for mailbox.mbox")
+            mbox.close()
+            return max(1, abs(len(spans) - len(expected)))
+        for key, (start, stop) in enumerate(spans):
+            if scanner.message_bytes(start, stop) != mbox.get_bytes(key):
+                print(f"  Raw bytes differ for message {key}")
+                mismatches += 1
+                continue
+            ours, theirs = scanner.message(start, stop), mbox.get_message(key)
+            if ours.as_bytes() != theirs.as_bytes() or ours.get_from() != theirs.get_from():
+                print(f"  Parsed message differs for message {key}")
+                mismatches += 1
+    mbox.close()
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du parseur MBOX mmap contre mailbox.mbox")
+    parser.add_argument("mbox", help="Chemin du fichier .mbox")
+    parser.add_argument("--no-verify", action="store_false", dest="verify", help="Ne pas comparer les messages octet par octet")
+    args = parser.parse_args()
+
+    size = os.path.getsize(args.mbox)
+    print(f"{args.mbox} ({size / (1024 * 1024):.1f} MB)")
+    print("Framing:")
+    count = bench_framing(args.mbox, size)
+    print("Framing + parsing:")
+    bench_parsing(args.mbox, size)
+
+    if args.verify:
+        print("Verification against mailbox.mbox:")
+        mismatches = verify(args.mbox)
+        if mismatches:
+            print(f"  FAILED: {mismatches} message(s) differ")
+            sys.exit(1)
+        print(f"  OK: {count} messages identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Compare the Outlook item creation strategies of mbox_to_pst.py
+(save-move, direct, batch-move, eml).
+
+Messages are decoded once up front, then written with each strategy into its
+own PST; the benchmark reports the write throughput and checks the Draft
+status of every item that reached the target folder.
+
+Runs against the in-memory fake_outlook by default (Linux: measures the
+script's own overhead), or against the real Outlook with --outlook. The
+Draft check is only meaningful with --outlook: the fake clears the Draft
+status whenever the flags are set before the first Save(), so every strategy
+passes it there, including "direct", which real Outlook may still leave as a
+draft without the Move().
+
+Usage:
+    python bench_strategies.py "fichier.mbox" --limit 200
+    python bench_strategies.py "fichier.mbox" --outlook --pst-dir "E:\\bench"
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from mbox_index import open_index
+from mbox_to_pst import STRATEGIES, OutlookBackend, iter_prepared_messages
+from fake_outlook import FakeOutlookApplication
+
+
+def load_messages(mbox_path, limit):
+    mbox_index = open_index(mbox_path)
+    stop_at = min(limit, len(mbox_index)) if limit else len(mbox_index)
+    return [prepared for _, prepared in iter_prepared_messages(mbox_index, 0, stop_at)
+            if not isinstance(prepared, Exception)]
+
+
+def bench_strategy(name, messages, pst_path, outlook, move_batch):
+    """Write messages with one strategy. Returns (elapsed, items in target, drafts)."""
+    backend = OutlookBackend(pst_path, "Benchmark", outlook, strategy=name, move_batch=move_batch)
+    if not backend.open():
+        return None
+    try:
+        t0 = time.perf_counter()
+        for prepared in messages:
+            backend.write(prepared)
+        backend.flush()
+        elapsed = time.perf_counter() - t0
+
+        items = backend.target_folder.Items
+        count = items.Count
+        drafts = sum(1 for index in range(1, count + 1) if not items.Item(index).Sent)
+    finally:
+        backend.close()
+    return elapsed, count, drafts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des stratégies de création des éléments Outlook")
+    parser.add_argument("mbox", help="Chemin du fichier .mbox")
+    parser.add_argument("--limit", type=int, default=200, help="Nombre de messages écrits par stratégie")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES),
+                        help="Stratégies à comparer, séparées par des virgules")
+    parser.add_argument("--move-batch", type=int, default=50, help="Taille des lots pour batch-move")
+    parser.add_argument("--outlook", action="store_true", help="Utiliser Outlook (Windows) au lieu de fake_outlook")
+    parser.add_argument("--pst-dir", default=None, help="Dossier des PST de test (défaut : dossier temporaire)")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.strategies.split(",") if name.strip()]
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        parser.error(f"unknown strategies: {', '.join(unknown)}")
+
+    messages = load_messages(args.mbox, args.limit)
+    print(f"{args.mbox}: {len(messages)} messages per strategy ({'Outlook' if args.outlook else 'fake_outlook'})")
+
+    pst_dir = args.pst_dir or tempfile.mkdtemp(prefix="bench_strategies_")
+    os.makedirs(pst_dir, exist_ok=True)
+    if args.outlook:
+        import win32com.client
+        outlook = win32com.client.Dispatch("Outlook.Application")
+
+    failed = False
+    if not args.outlook:
+        print("  (drafts: not meaningful against fake_outlook, only checked with --outlook)")
+    print(f"  {'strategy':<12} {'time':>9} {'msgs/s':>9} {'items':>7} {'drafts':>7}")
+    for name in names:
+        pst_path = os.path.join(pst_dir, f"bench_{name}_{int(time.time())}.pst")
+        result = bench_strategy(name, messages, pst_path, outlook if args.outlook else FakeOutlookApplication(),
+                                args.move_batch)
+        if result is None:
+            print(f"  {name:<12} could not open the PST")
+            failed = True
+            continue
+        elapsed, count, drafts = result
+        rate = len(messages) / elapsed if elapsed > 0 else 0
+        drafts_checked = args.outlook
+        status = "" if count == len(messages) and (drafts == 0 or not drafts_checked) else "  <-- FAILED"
+        failed = failed or bool(status)
+        drafts_column = f"{drafts:7d}" if drafts_checked else f"{'n/a':>7}"
+        print(f"  {name:<12} {elapsed:8.2f}s {rate:9.1f} {count:7d} {drafts_column}{status}")
+
+    print(f"PST files: {pst_dir}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
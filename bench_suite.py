@@ -0,0 +1,171 @@
+"""
+Reproducible throughput benchmarks for mbox_to_pst.py, runnable on Linux.
+
+Runs on a synthetic Takeout corpus (make_takeout_corpus.py, generated on
+the fly from --seed unless an MBOX is given), so two commits can be compared
+on exactly the same input:
+
+    stream_mbox     framing + MIME parse with the mmap scanner (stream_mbox)
+    mailbox         framing + MIME parse with the standard mailbox.mbox
+    headers         header decoding and address normalization only
+    prepare         prepare_message() on pre-parsed messages (headers, bodies, attachments)
+    loop            the full mbox_to_pst() loop against fake_outlook, with a latency model
+    loop-pst        the full mbox_to_pst() loop with the direct PST backend
+
+Usage:
+    python bench_suite.py                                  # 20 MB corpus, every benchmark
+    python bench_suite.py --generate-mb 200 --seed 1
+    python bench_suite.py export.mbox --only headers,prepare
+    python bench_suite.py --latency outlook --limit 200 --json results.json
+"""
+import os
+import json
+import time
+import logging
+import mailbox
+import argparse
+import tempfile
+
+from make_takeout_corpus import write_corpus
+from mbox_index import open_index
+from fake_outlook import FakeOutlookApplication, LatencyModel
+import mbox_to_pst
+from mbox_to_pst import stream_mbox, decode_mime_header, parse_sender, normalize_addresses, prepare_message
+
+
+BENCHMARKS = ("stream_mbox", "mailbox", "headers", "prepare", "loop", "loop-pst")
+
+
+def _report(label, elapsed, count, size=None, extra=""):
+    rate_msg = count / elapsed if elapsed > 0 else 0
+    rate_mb = f"{size / (1024 * 1024) / elapsed:9.1f} MB/s" if size and elapsed > 0 else " " * 14
+    print(f"  {label:<12} {elapsed:8.2f}s  {rate_mb}  {rate_msg:10.0f} msgs/s  {extra}")
+    return {"elapsed_s": round(elapsed, 4), "messages": count, "msgs_per_s": round(rate_msg, 1)}
+
+
+def bench_stream_mbox(mbox_path, size, **_):
+    t0 = time.perf_counter()
+    count = sum(1 for _ in stream_mbox(mbox_path))
+    return _report("stream_mbox", time.perf_counter() - t0, count, size)
+
+
+def bench_mailbox(mbox_path, size, **_):
+    t0 = time.perf_counter()
+    mbox = mailbox.mbox(mbox_path, create=False)
+    count = sum(1 for _ in mbox)
+    mbox.close()
+    return _report("mailbox", time.perf_counter() - t0, count, size)
+
+
+def _load_messages(mbox_path, limit):
+    mbox_index = open_index(mbox_path)
+    stop_at = min(limit, len(mbox_index)) if limit else len(mbox_index)
+    return [message for _, _, message in mbox_index.iter_messages(0, stop_at)]
+
+
+def bench_headers(mbox_path, size, messages, **_):
+    headers = [(message['subject'], message['from'] or "", message['to'] or "", message.get_all('X-Gmail-Labels', []))
+               for message in messages]
+    t0 = time.perf_counter()
+    for subject, sender, to, labels in headers:
+        decode_mime_header(subject)
+        parse_sender(sender)
+        normalize_addresses(to)
+        for label in labels:
+            decode_mime_header(label)
+    return _report("headers", time.perf_counter() - t0, len(headers))
+
+
+def bench_prepare(mbox_path, size, messages, **_):
+    t0 = time.perf_counter()
+    attachments = sum(len(prepare_message(message, i).attachments) for i, message in enumerate(messages))
+    return _report("prepare", time.perf_counter() - t0, len(messages), extra=f"{attachments} attachments")
+
+
+def _run_loop(mbox_path, limit, workdir, **options):
+    """Run mbox_to_pst() from scratch in workdir (state, journal and PST stay there)."""
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        t0 = time.perf_counter()
+        mbox_to_pst.mbox_to_pst(os.path.abspath(os.path.join(previous, mbox_path)), "bench.pst", resume=False,
+                                limit=limit, **options)
+        elapsed = time.perf_counter() - t0
+    finally:
+        os.chdir(previous)
+    return elapsed
+
+
+def bench_loop(mbox_path, size, limit, latency, workdir, **_):
+    outlook = FakeOutlookApplication(latency=latency)
+    elapsed = _run_loop(mbox_path, limit, workdir, outlook=outlook)
+    items = outlook.store(os.path.join(workdir, "bench.pst")).folder("Gmail Archive").Items.Count
+    result = _report("loop", elapsed, items,
+                     extra=f"simulated Outlook time {latency.simulated:.1f}s, {latency.busy_errors} busy errors")
+    result.update(simulated_s=round(latency.simulated, 3), busy_errors=latency.busy_errors)
+    return result
+
+
+def bench_loop_pst(mbox_path, size, limit, workdir, **_):
+    elapsed = _run_loop(mbox_path, limit, workdir, backend="pst")
+    reader = mbox_to_pst.pst_file.PstReader(os.path.join(workdir, "bench.pst"))
+    items = len(list(reader.message_nids(reader.find_folder(["Gmail Archive"]))))
+    return _report("loop-pst", elapsed, items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks reproductible (sans Outlook)")
+    parser.add_argument("mbox", nargs="?", default=None, help="MBOX à utiliser (défaut : corpus synthétique généré)")
+    parser.add_argument("--generate-mb", type=float, default=20, help="Taille du corpus synthétique en Mo (défaut : 20)")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du corpus synthétique")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="Benchmarks à lancer, séparés par des virgules")
+    parser.add_argument("--limit", type=int, default=500,
+                        help="Messages traités par headers, prepare et les boucles complètes (défaut : 500)")
+    parser.add_argument("--latency", choices=list(LatencyModel.PRESETS), default="fast",
+                        help="Modèle de latence de fake_outlook pour la boucle complète (défaut : fast)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplie toutes les latences simulées")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Dispersion log-normale des latences (défaut : 0.3)")
+    parser.add_argument("--growth", type=float, default=0.0,
+                        help="Ralentissement par élément stocké (ex. 0.0001 = +10 %% tous les 1000 éléments)")
+    parser.add_argument("--busy-rate", type=float, default=0.0, help="Probabilité d'une erreur « appel rejeté » par appel")
+    parser.add_argument("--json", default=None, help="Enregistrer les résultats dans ce fichier JSON")
+    args = parser.parse_args()
+
+    # Keep the migration's progress lines out of the results
+    logging.getLogger().setLevel(logging.WARNING)
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="bench_suite_")
+    mbox_path = args.mbox
+    if mbox_path is None:
+        mbox_path = os.path.join(workdir, f"takeout_{args.generate_mb:g}mb_seed{args.seed}.mbox")
+        generator, _ = write_corpus(mbox_path, size_mb=args.generate_mb, seed=args.seed)
+        print(f"Synthetic corpus: {generator.count} messages ({generator.duplicates} duplicates)")
+    size = os.path.getsize(mbox_path)
+    print(f"{mbox_path} ({size / (1024 * 1024):.1f} MB)")
+
+    messages = _load_messages(mbox_path, args.limit) if {"headers", "prepare"} & set(names) else None
+    functions = {"stream_mbox": bench_stream_mbox, "mailbox": bench_mailbox, "headers": bench_headers,
+                 "prepare": bench_prepare, "loop": bench_loop, "loop-pst": bench_loop_pst}
+    results = {}
+    for name in names:
+        latency = LatencyModel.preset(args.latency, scale=args.latency_scale, jitter=args.jitter,
+                                      growth=args.growth, busy_rate=args.busy_rate, seed=args.seed)
+        run_dir = tempfile.mkdtemp(prefix=f"{name}_", dir=workdir)
+        results[name] = functions[name](mbox_path=mbox_path, size=size, messages=messages, limit=args.limit,
+                                        latency=latency, workdir=run_dir)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mbox": mbox_path, "size": size, "seed": args.seed, "latency": args.latency,
+                       "limit": args.limit, "results": results}, f, indent=2)
+        print(f"Results: {args.json}")
+    print(f"Work files: {workdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Year/Month subfolders of the target folder (--date-folders).
+
+A single "Gmail Archive" folder with tens of thousands of items gets slower
+to write to as the run goes on (Items.Add, Save and Move all touch the
+folder's contents table) and Outlook views on it are sluggish. Each message
+is routed instead to a subfolder named after its date:
+
+    Gmail Archive/2019            (mode "year")
+    Gmail Archive/2019/03         (mode "month")
+    Gmail Archive/Undated         (no usable date)
+
+FolderCache keeps every folder object it has found or created, so routing a
+message to a folder already used costs a dictionary lookup, not a COM call.
+"""
+import logging
+
+
+DATE_FOLDER_MODES = ("year", "month")
+UNDATED_FOLDER = "Undated"
+
+
+def date_folder_path(date, mode):
+    """Subfolder names below the target folder for a message date (datetime or None)."""
+    if date is None:
+        return (UNDATED_FOLDER,)
+    if mode == "month":
+        return (str(date.year), f"{date.month:02d}")
+    return (str(date.year),)
+
+
+class FolderCache:
+    """
+    Folder of each subfolder path, found or created once by child(parent,
+    name) and then served from memory.
+    """
+
+    def __init__(self, root, child):
+        self._child = child
+        self._folders = {(): root}
+        self.lookups = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._folders) - 1
+
+    def folder(self, path):
+        self.lookups += 1
+        folder = self._folders.get(path)
+        if folder is None:
+            folder = self._resolve(path)
+        return folder
+
+    def _resolve(self, path):
+        folder = self._folders.get(path)
+        if folder is None:
+            self.misses += 1
+            folder = self._folders[path] = self._child(self._resolve(path[:-1]), path[-1])
+            logging.debug(f"Date folder: {'/'.join(path)}")
+        return folder
+
+    def summary(self):
+        return f"{len(self)} subfolders, {self.lookups} messages routed, {self.misses} folder lookups"
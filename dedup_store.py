@@ -0,0 +1,156 @@
+"""
+Persistent Message-ID dedup store.
+
+Keeps the 64-bit Message-ID hashes (mbox_index.message_id_hash) of every
+message already written to the target PST, so a resumed run still skips the
+duplicates of messages imported before the restart. Hashes are fixed-width
+integers in a sorted array('Q') (8 bytes per message, looked up by binary
+search) plus a small set of recent additions merged into the array in bulk:
+memory stays flat whatever the archive size.
+
+With sharded output (several PST files), the store also records the shard
+each message went to (2 more bytes per message, only once a message has
+gone to a shard other than 0), so dedup and lookups span every shard.
+
+The store is saved next to the PST ("<file>.pst.dedup") at each checkpoint,
+atomically (temp file + rename).
+"""
+import os
+import sys
+import struct
+import heapq
+import logging
+from array import array
+from bisect import bisect_left
+
+
+DEDUP_SUFFIX = ".dedup"
+DEDUP_MAGIC = b'MIDS'
+DEDUP_VERSION = 1          # hashes only
+DEDUP_VERSION_SHARDS = 2   # hashes, then one shard number (uint16) per hash
+MERGE_THRESHOLD = 65536  # recent hashes kept in a set before merging into the sorted array
+
+_HEADER = struct.Struct('<4sIQ')  # magic, version, count
+
+
+def dedup_path_for(pst_path):
+    return pst_path + DEDUP_SUFFIX
+
+
+class DedupStore:
+    """Set of 64-bit Message-ID hashes backed by a sorted array."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._sorted = array('Q')
+        self._shards = None   # array('H') parallel to _sorted, once a shard other than 0 is used
+        self._recent = {}     # hash -> shard
+
+    def __len__(self):
+        return len(self._sorted) + len(self._recent)
+
+    def __contains__(self, msg_hash):
+        """True if a message with this Message-ID hash is already in the target PST."""
+        if msg_hash in self._recent:
+            return True
+        pos = bisect_left(self._sorted, msg_hash)
+        return pos < len(self._sorted) and self._sorted[pos] == msg_hash
+
+    def add(self, msg_hash, shard=0):
+        """Record a hash (0, i.e. no Message-ID, is ignored) and the shard its message went to."""
+        if not msg_hash or msg_hash in self:
+            return
+        self._recent[msg_hash] = shard
+        if shard and self._shards is None:
+            self._shards = array('H', bytes(2 * len(self._sorted)))
+        if len(self._recent) >= MERGE_THRESHOLD:
+            self._merge()
+
+    def shard_of(self, msg_hash):
+        """Shard of the message with this hash (0 without sharding), or None if it is not in the store."""
+        if msg_hash in self._recent:
+            return self._recent[msg_hash]
+        pos = bisect_left(self._sorted, msg_hash)
+        if pos < len(self._sorted) and self._sorted[pos] == msg_hash:
+            return self._shards[pos] if self._shards is not None else 0
+        return None
+
+    def _merge(self):
+        if not self._recent:
+            return
+        if self._shards is None:
+            self._sorted = array('Q', heapq.merge(self._sorted, sorted(self._recent)))
+        else:
+            merged = list(heapq.merge(zip(self._sorted, self._shards), sorted(self._recent.items())))
+            self._sorted = array('Q', (msg_hash for msg_hash, _ in merged))
+            self._shards = array('H', (shard for _, shard in merged))
+        self._recent = {}
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path=None):
+        """Write the store atomically (temp file + rename)."""
+        path = path or self.path
+        self._merge()
+        tmp_path = path + ".tmp"
+        data = self._sorted
+        shards = self._shards
+        if sys.byteorder != 'little':
+            data = array('Q', data)
+            data.byteswap()
+            if shards is not None:
+                shards = array('H', shards)
+                shards.byteswap()
+        with open(tmp_path, 'wb') as f:
+            version = DEDUP_VERSION if shards is None else DEDUP_VERSION_SHARDS
+            f.write(_HEADER.pack(DEDUP_MAGIC, version, len(data)))
+            data.tofile(f)
+            if shards is not None:
+                shards.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a store from disk. Returns an empty store if missing or unreadable."""
+        store = cls(path)
+        if not os.path.exists(path):
+            return store
+        try:
+            with open(path, 'rb') as f:
+                magic, version, count = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != DEDUP_MAGIC or version not in (DEDUP_VERSION, DEDUP_VERSION_SHARDS):
+                    raise ValueError("unknown format")
+                data = array('Q')
+                data.fromfile(f, count)
+                shards = None
+                if version == DEDUP_VERSION_SHARDS:
+                    shards = array('H')
+                    shards.fromfile(f, count)
+        except (OSError, ValueError, EOFError, struct.error) as e:
+            logging.warning(f"Ignoring unreadable dedup store {path}: {e}")
+            return store
+        if sys.byteorder != 'little':
+            data.byteswap()
+            if shards is not None:
+                shards.byteswap()
+        store._sorted = data
+        store._shards = shards
+        return store
+
+
+def open_dedup_store(pst_path, reset=False):
+    """
+    Return the DedupStore of a target PST: the saved one, or an empty one when
+    reset is True (migration restarted from scratch) or nothing was saved yet.
+    """
+    path = dedup_path_for(pst_path)
+    if reset:
+        return DedupStore(path)
+    store = DedupStore.load(path)
+    if len(store):
+        logging.info(f"Loaded dedup store: {len(store)} Message-IDs already imported")
+    return store
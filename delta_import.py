@@ -0,0 +1,125 @@
+"""
+Delta import (--delta): import only the messages a PST does not hold yet.
+
+A fresh Takeout export taken a few months after the first migration holds
+the whole mailbox again. Before the first message is written, the Message-ID
+(PR_INTERNET_MESSAGE_ID), subject and submit time of every item already in
+the target folder tree are read in bulk from the folder contents tables,
+without opening any item:
+
+    - Outlook: Folder.GetTable() restricted to those columns, one table per
+      folder (outlook_categories.iter_table_rows);
+    - --backend pst: the contents table rows PstWriter loads when it opens
+      the file (all three are among its columns).
+
+The Message-ID hashes go into the dedup store, so the header fast path skips
+the messages already imported on their index entry: they are never read nor
+parsed, and the run only writes (and spends time on) the new ones.
+
+Items without a Message-ID (messages without the header, or PSTs written
+through Outlook by a version that did not set it) are keyed on their subject
+and date instead, like migration_verify.item_key. That key needs the decoded
+message: those messages are parsed, and the writer drops the ones that match
+(match()) before writing them.
+
+    seed = DeltaSeed(dedup_store)
+    seed.add(backend.existing_messages())
+    logging.info(seed.summary())
+    ...
+    if seed.match(prepared, msg_hash):
+        continue
+"""
+import time
+import logging
+
+from mbox_index import header_message_id_hash
+from migration_verify import item_key
+from outlook_categories import iter_folders, iter_table_rows
+
+
+PR_INTERNET_MESSAGE_ID = "http://schemas.microsoft.com/mapi/proptag/0x1035001F"
+PR_CLIENT_SUBMIT_TIME = "http://schemas.microsoft.com/mapi/proptag/0x00390040"
+
+
+def outlook_messages(root_folder):
+    """(Message-ID or None, subject, submit time) of every item below root_folder, read through folder tables."""
+    for folder in iter_folders(root_folder):
+        yield from iter_table_rows(folder, (PR_INTERNET_MESSAGE_ID, "Subject", PR_CLIENT_SUBMIT_TIME))
+
+
+def timestamp_of(date):
+    return date.timestamp() if hasattr(date, "timestamp") else None
+
+
+class DeltaSeed:
+    """
+    Message-ID hashes of the items already in the target, added to a dedup
+    store; (subject, date) keys of the items without one.
+    """
+
+    def __init__(self, dedup_store):
+        self.dedup_store = dedup_store
+        self.items = 0
+        self.without_message_id = 0
+        self.without_key = 0    # no Message-ID, no date either: cannot be matched
+        self.added = 0          # not in the dedup store yet (e.g. no .dedup file next to the PST)
+        self.matched = 0        # messages matched on their subject and date
+        self.seconds = 0.0
+        self.fallback = {}      # (subject, timestamp) -> [shard] of the items without Message-ID
+
+    def add(self, messages):
+        """Record (message_id, subject, date, shard) tuples; returns self."""
+        t0 = time.perf_counter()
+        dedup_store = self.dedup_store
+        for message_id, subject, date, shard in messages:
+            self.items += 1
+            msg_hash = header_message_id_hash(message_id) if isinstance(message_id, str) else 0
+            if msg_hash:
+                if msg_hash not in dedup_store:
+                    dedup_store.add(msg_hash, shard)
+                    self.added += 1
+                continue
+            self.without_message_id += 1
+            timestamp = timestamp_of(date)
+            if timestamp is None:
+                self.without_key += 1
+            else:
+                self.fallback.setdefault(item_key("", subject, timestamp), []).append(shard)
+        self.seconds += time.perf_counter() - t0
+        if self.without_message_id * 2 > self.items:
+            logging.warning(f"Delta import: {self.without_message_id} of the {self.items} items already in the PST "
+                            f"have no Message-ID (PST written by an older version?): they are matched on their "
+                            f"subject and date, so every message of the MBOX is parsed to compare them")
+        return self
+
+    def match(self, prepared, msg_hash):
+        """
+        True if a decoded message is an item without Message-ID already in the
+        PST (each item matches one message); its hash then joins the dedup store.
+        """
+        if not self.fallback:
+            return False
+        timestamp = timestamp_of(prepared.date)
+        if timestamp is None:
+            return False
+        key = item_key("", prepared.subject, timestamp)
+        shards = self.fallback.get(key)
+        if not shards:
+            return False
+        shard = shards.pop(0)
+        if not shards:
+            del self.fallback[key]
+        self.dedup_store.add(msg_hash, shard)
+        self.matched += 1
+        return True
+
+    def to_dict(self):
+        """Counts for the --profile JSON."""
+        return {"items": self.items, "without_message_id": self.without_message_id, "without_key": self.without_key,
+                "added": self.added, "matched_by_subject_date": self.matched, "seconds": round(self.seconds, 3)}
+
+    def summary(self):
+        rate = self.items / self.seconds if self.seconds > 0 else 0.0
+        return (f"{self.items} items already in the PST, {self.added} Message-IDs added to the dedup store, "
+                f"{self.without_message_id} without Message-ID (matched on subject and date, "
+                f"{self.without_key} without a date either) ({self.seconds:.2f}s, {rate:.0f} items/sec)")
@@ -0,0 +1,633 @@
+"""
+In-process fake of the Outlook object model used by mbox_to_pst.py.
+
+Implements just enough of Outlook.Application / Namespace / Store / Folder /
+MailItem / Attachment / PropertyAccessor / Categories / Table for the migration code
+to run unchanged on Linux, without win32com. Items, properties and
+attachment payloads are kept in memory so results can be inspected:
+
+    outlook = FakeOutlookApplication()
+    mbox_to_pst("in.mbox", "out.pst", outlook=outlook)
+    folder = outlook.store("out.pst").folder("Gmail Archive")
+    print(len(folder.Items), folder.Items[0].Subject)
+
+Calls are instantaneous by default. A LatencyModel makes the fake behave
+like a real (slow, sometimes overloaded) Outlook for benchmarks:
+
+    outlook = FakeOutlookApplication(latency=LatencyModel.preset("outlook"))
+"""
+import os
+import re
+import time
+import uuid
+import random
+from email import message_from_bytes
+from email import policy
+
+
+PR_MESSAGE_FLAGS = "http://schemas.microsoft.com/mapi/proptag/0x0E070003"
+PR_ATTACH_CONTENT_ID = "http://schemas.microsoft.com/mapi/proptag/0x3712001F"
+PR_INTERNET_MESSAGE_ID = "http://schemas.microsoft.com/mapi/proptag/0x1035001F"
+PR_HASATTACH = "http://schemas.microsoft.com/mapi/proptag/0x0E1B000B"
+MAPI_PROPERTY_PREFIX = "http://schemas.microsoft.com/mapi/"
+MSGFLAG_UNSENT = 0x08
+PR_KEYWORDS = "http://schemas.microsoft.com/mapi/string/{00020329-0000-0000-C000-000000000046}/Keywords"
+DASL_PROPERTIES = {"urn:schemas-microsoft-com:office:office#Keywords": PR_KEYWORDS,
+                   "urn:schemas:httpmail:subject": "Subject"}
+DASL_CONDITION = re.compile(r'"([^"]+)"\s+(LIKE|=)\s+\'((?:[^\']|\'\')*)\'', re.IGNORECASE)
+RPC_E_CALL_REJECTED = -2147418111  # 0x80010001, "Call was rejected by callee"
+
+
+class FakeComError(Exception):
+    """Raised where Outlook would raise a pywintypes.com_error."""
+
+    def __init__(self, message, hresult=None):
+        super().__init__(message)
+        self.hresult = hresult
+
+
+class LatencyModel:
+    """
+    Simulated cost of the Outlook calls that reach the store.
+
+    costs maps an operation ("Items.Add", "Save", "Move", "SetProperties",
+    "Attachments.Add"...) to its base latency in seconds. Each call costs
+    base * (1 + growth * items already stored) -- Outlook slows down as the
+    PST grows -- times a random jitter factor, and fails with
+    RPC_E_CALL_REJECTED with probability busy_rate. Operations missing from
+    costs are free and never fail.
+    """
+
+    PRESETS = {
+        "none": {},
+        # Orders of magnitude seen with Outlook 2016+ writing to a local PST
+        "outlook": {"Items.Add": 0.020, "SetProperty": 0.002, "SetProperties": 0.004,
+                    "Attachments.Add": 0.015, "Save": 0.060, "Move": 0.040,
+                    "OpenSharedItem": 0.080, "Categories.Add": 0.010,
+                    "GetTable": 0.030, "Items.Restrict": 0.030, "Table.GetNextRow": 0.00005, "GetItemFromID": 0.015},
+        "fast": {"Items.Add": 0.002, "SetProperty": 0.0002, "SetProperties": 0.0004,
+                 "Attachments.Add": 0.0015, "Save": 0.006, "Move": 0.004,
+                 "OpenSharedItem": 0.008, "Categories.Add": 0.001,
+                 "GetTable": 0.003, "Items.Restrict": 0.003, "Table.GetNextRow": 0.000005, "GetItemFromID": 0.0015},
+    }
+
+    def __init__(self, costs=None, scale=1.0, jitter=0.0, growth=0.0, busy_rate=0.0, seed=0, sleep=time.sleep):
+        self.costs = dict(costs or {})
+        self.scale = scale
+        self.jitter = jitter
+        self.growth = growth
+        self.busy_rate = busy_rate
+        self._random = random.Random(seed)
+        self._sleep = sleep
+        self.items_stored = 0
+        self.calls = 0
+        self.simulated = 0.0  # seconds slept
+        self.busy_errors = 0
+
+    @classmethod
+    def preset(cls, name, **options):
+        return cls(cls.PRESETS[name], **options)
+
+    def charge(self, operation):
+        """Account (and sleep for) one call; raises FakeComError when Outlook is 'busy'."""
+        base = self.costs.get(operation)
+        if base is None:
+            return
+        self.calls += 1
+        if self.busy_rate and self._random.random() < self.busy_rate:
+            self.busy_errors += 1
+            raise FakeComError("Call was rejected by callee.", RPC_E_CALL_REJECTED)
+        delay = base * self.scale * (1 + self.growth * self.items_stored)
+        if self.jitter:
+            delay *= self._random.lognormvariate(0, self.jitter)
+        self.simulated += delay
+        self._sleep(delay)
+
+
+NO_LATENCY = LatencyModel()
+
+
+class FakePropertyAccessor:
+    """
+    PropertyAccessor keeping properties in a dict. Every method call is one
+    COM round trip in real Outlook and is counted in round_trips.
+    Tags listed in rejected_tags fail like read-only properties.
+    """
+    rejected_tags = set()
+
+    def __init__(self, latency=NO_LATENCY):
+        self.properties = {}
+        self.round_trips = 0
+        self._latency = latency
+
+    def _set(self, tag, value):
+        if tag in self.rejected_tags:
+            raise FakeComError(f"Property {tag} cannot be set")
+        self.properties[tag] = value
+
+    def SetProperty(self, tag, value):
+        self.round_trips += 1
+        self._latency.charge("SetProperty")
+        self._set(tag, value)
+
+    def GetProperty(self, tag):
+        self.round_trips += 1
+        if tag not in self.properties:
+            raise FakeComError(f"Property {tag} not found")
+        return self.properties[tag]
+
+    def SetProperties(self, tags, values):
+        """Returns one entry per tag: None on success, the error otherwise."""
+        self.round_trips += 1
+        self._latency.charge("SetProperties")
+        if len(tags) != len(values):
+            raise FakeComError("SetProperties: tags and values differ in length")
+        errors = []
+        for tag, value in zip(tags, values):
+            try:
+                self._set(tag, value)
+                errors.append(None)
+            except FakeComError as e:
+                errors.append(e)
+        return errors
+
+    def GetProperties(self, tags):
+        """Returns one value per tag, or the error for missing properties."""
+        self.round_trips += 1
+        return [self.properties[tag] if tag in self.properties else FakeComError(f"Property {tag} not found")
+                for tag in tags]
+
+
+class FakeAttachment:
+    def __init__(self, data, file_name, attach_type=1, position=1, latency=NO_LATENCY):
+        self.data = data
+        self.FileName = file_name
+        self.DisplayName = self.FileName
+        self.Type = attach_type
+        self.Position = position
+        self.Size = len(self.data)
+        self.PropertyAccessor = FakePropertyAccessor(latency)
+
+
+class FakeAttachments:
+    def __init__(self, latency=NO_LATENCY):
+        self._items = []
+        self._latency = latency
+
+    def Add(self, source, attach_type=1, position=1, display_name=None):
+        self._latency.charge("Attachments.Add")
+        with open(source, 'rb') as f:
+            data = f.read()
+        attachment = FakeAttachment(data, display_name or os.path.basename(source), attach_type, position,
+                                    self._latency)
+        self._items.append(attachment)
+        return attachment
+
+    @property
+    def Count(self):
+        return len(self._items)
+
+    def Item(self, index):
+        return self._items[index - 1]  # COM collections are 1-based
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FakeMailItem:
+    """
+    Mail item. Like Outlook, PR_MESSAGE_FLAGS is only taken into account at
+    the first Save(): an item saved without it stays an unsent draft
+    (Sent == False).
+    """
+
+    def __init__(self, parent, in_folder=True):
+        self.Parent = parent
+        self._latency = parent._latency
+        self._in_folder = in_folder  # False for OpenSharedItem() items until saved
+        self.EntryID = uuid.uuid4().hex.upper()
+        self.Subject = ""
+        self.SentOnBehalfOfName = ""
+        self.To = ""
+        self.Categories = ""
+        self.HTMLBody = ""
+        self.Body = ""
+        self.MessageClass = "IPM.Note"
+        self.UnRead = True
+        self.Sent = False
+        self.Saved = False
+        self.save_count = 0
+        self.PropertyAccessor = FakePropertyAccessor(self._latency)
+        self.Attachments = FakeAttachments(self._latency)
+
+    def Save(self):
+        self._latency.charge("Save")
+        if self.save_count == 0:
+            self._latency.items_stored += 1
+        if self.save_count == 0 and not self.Sent:
+            flags = self.PropertyAccessor.properties.get(PR_MESSAGE_FLAGS, MSGFLAG_UNSENT)
+            self.Sent = not flags & MSGFLAG_UNSENT
+        if not self._in_folder:
+            self.Parent.Items._append(self)
+            self._in_folder = True
+        self.Saved = True
+        self.save_count += 1
+
+    def Move(self, folder):
+        self._latency.charge("Move")
+        if self._in_folder:
+            self.Parent.Items._remove(self)
+        self._in_folder = True
+        folder.Items._append(self)
+        self.Parent = folder
+        return self
+
+    def Delete(self):
+        self.Parent.Items._remove(self)
+
+    def _keywords(self):
+        """Keywords as the store keeps them: Outlook splits Categories on the list separator (';' here)."""
+        return tuple(name.strip() for name in self.Categories.split(";") if name.strip())
+
+    def _column(self, name):
+        if name == PR_KEYWORDS:
+            return self._keywords()
+        if name == PR_HASATTACH:
+            # Computed by the store, like MSGFLAG_HASATTACH
+            return len(self.Attachments) > 0
+        if name.startswith(MAPI_PROPERTY_PREFIX):
+            return self.PropertyAccessor.properties.get(name)
+        return getattr(self, name)
+
+
+class FakeItems:
+    def __init__(self, folder):
+        self._folder = folder
+        self._items = []
+
+    def Add(self, item_type=0):
+        self._folder._latency.charge("Items.Add")
+        item = FakeMailItem(self._folder)
+        self._items.append(item)
+        return item
+
+    def Restrict(self, filter):
+        """
+        Items matching a DASL filter: "@SQL=" conditions '"<property>" LIKE
+        '%text%'' or '"<property>" = 'text'' joined with OR (case-insensitive;
+        a multi-valued property matches if one of its values does).
+        """
+        self._folder._latency.charge("Items.Restrict")
+        if not filter.startswith("@SQL="):
+            raise FakeComError("Only @SQL= filters are supported by the fake")
+        clauses = re.split(r"\s+OR\s+", filter[len("@SQL="):])
+        conditions = []
+        for clause in clauses:
+            match = DASL_CONDITION.fullmatch(clause.strip())
+            if not match or match.group(1) not in DASL_PROPERTIES:
+                raise FakeComError(f"Unsupported filter condition: {clause}")
+            prop, operator, value = match.groups()
+            conditions.append((DASL_PROPERTIES[prop], operator.upper(), value.replace("''", "'").lower()))
+
+        def matches(item):
+            for prop, operator, value in conditions:
+                values = item._column(prop)
+                for candidate in (values if isinstance(values, tuple) else (values,)):
+                    candidate = str(candidate).lower()
+                    if operator == "=" and candidate == value:
+                        return True
+                    if operator == "LIKE" and re.fullmatch(".*".join(map(re.escape, value.split("%"))), candidate,
+                                                           re.DOTALL):
+                        return True
+            return False
+
+        restricted = FakeItems(self._folder)
+        restricted._items = [item for item in self._items if matches(item)]
+        return restricted
+
+    def _append(self, item):
+        self._items.append(item)
+
+    def _remove(self, item):
+        self._items.remove(item)
+
+    @property
+    def Count(self):
+        return len(self._items)
+
+    def Item(self, index):
+        return self._items[index - 1]
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FakeColumns:
+    def __init__(self, names):
+        self._names = list(names)
+
+    def Add(self, name):
+        self._names.append(name)
+
+    def RemoveAll(self):
+        self._names = []
+
+    @property
+    def Count(self):
+        return len(self._names)
+
+    def Item(self, index):
+        return self._names[index - 1]
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+
+class FakeRow:
+    def __init__(self, values):
+        self._values = values
+
+    def GetValues(self):
+        return tuple(self._values.values())
+
+    def Item(self, name):
+        return self._values[name]
+
+    __call__ = Item
+
+
+class FakeTable:
+    """
+    Folder.GetTable(): a read-only snapshot of the folder rows, restricted to
+    the columns asked for (EntryID, Subject, ... or PR_KEYWORDS, which returns
+    the keywords as a tuple like a multi-valued property referenced by its
+    DASL name; other DASL property names return the value set through the
+    PropertyAccessor, None if unset). Rows are read without opening the items.
+    """
+
+    def __init__(self, items, latency=NO_LATENCY):
+        self._items = items
+        self._latency = latency
+        self._position = 0
+        self.Columns = FakeColumns(["EntryID", "Subject", "CreationTime", "LastModificationTime", "MessageClass"])
+
+    @property
+    def EndOfTable(self):
+        return self._position >= len(self._items)
+
+    def GetRowCount(self):
+        return len(self._items)
+
+    def MoveToStart(self):
+        self._position = 0
+
+    def GetNextRow(self):
+        if self.EndOfTable:
+            return None
+        self._latency.charge("Table.GetNextRow")
+        item = self._items[self._position]
+        self._position += 1
+        return FakeRow({name: item._column(name) for name in self.Columns})
+
+
+class FakeFolders:
+    def __init__(self, parent):
+        self._parent = parent
+        self._folders = []
+
+    def Add(self, name, folder_type=None):
+        if any(f.Name == name for f in self._folders):
+            raise FakeComError(f"Folder '{name}' already exists")
+        folder = FakeFolder(name, self._parent)
+        self._folders.append(folder)
+        return folder
+
+    def _remove(self, folder):
+        self._folders.remove(folder)
+
+    @property
+    def Count(self):
+        return len(self._folders)
+
+    def Item(self, key):
+        if isinstance(key, int):
+            return self._folders[key - 1]
+        for folder in self._folders:
+            if folder.Name == key:
+                return folder
+        raise FakeComError(f"Folder '{key}' not found")
+
+    def __iter__(self):
+        return iter(list(self._folders))
+
+    def __len__(self):
+        return len(self._folders)
+
+
+class FakeFolder:
+    def __init__(self, name, parent=None, latency=None, store_id=None):
+        self.Name = name
+        self.Parent = parent
+        self._latency = latency or (parent._latency if parent is not None else NO_LATENCY)
+        self.StoreID = store_id or (parent.StoreID if parent is not None else "")
+        self.Items = FakeItems(self)
+        self.Folders = FakeFolders(self)
+
+    def Delete(self):
+        if self.Parent is not None:
+            self.Parent.Folders._remove(self)
+
+    def GetTable(self, filter="", table_contents=0):
+        if filter:
+            raise FakeComError("Table filters are not supported by the fake")
+        self._latency.charge("GetTable")
+        return FakeTable(list(self.Items), self._latency)
+
+    def folder(self, path):
+        """Test helper: subfolder by name or 'A/B/C' path."""
+        folder = self
+        for name in path.split("/"):
+            folder = folder.Folders.Item(name)
+        return folder
+
+
+class FakeStore:
+    def __init__(self, file_path, display_name=None, latency=NO_LATENCY):
+        self.FilePath = file_path
+        self.DisplayName = display_name or os.path.splitext(os.path.basename(file_path))[0]
+        self.StoreID = uuid.uuid4().hex.upper()
+        self._root = FakeFolder(self.DisplayName, latency=latency, store_id=self.StoreID)
+
+    def GetRootFolder(self):
+        return self._root
+
+    def folder(self, path):
+        """Test helper: folder below the root by name or 'A/B/C' path."""
+        return self._root.folder(path)
+
+
+class FakeStores:
+    def __init__(self):
+        self._stores = []
+
+    @property
+    def Count(self):
+        return len(self._stores)
+
+    def Item(self, index):
+        return self._stores[index - 1]
+
+    def __iter__(self):
+        return iter(list(self._stores))
+
+    def __len__(self):
+        return len(self._stores)
+
+
+class FakeCategory:
+    def __init__(self, name, color=0):
+        self.Name = name
+        self.Color = color
+
+
+class FakeCategories:
+    def __init__(self, latency=NO_LATENCY):
+        self._categories = []
+        self._latency = latency
+
+    def Add(self, name, color=0, shortcut_key=0):
+        self._latency.charge("Categories.Add")
+        if any(c.Name.lower() == name.lower() for c in self._categories):
+            raise FakeComError(f"Category '{name}' already exists")
+        category = FakeCategory(name, color)
+        self._categories.append(category)
+        return category
+
+    def Remove(self, key):
+        self._categories.remove(self.Item(key))
+
+    @property
+    def Count(self):
+        return len(self._categories)
+
+    def Item(self, key):
+        if isinstance(key, int):
+            return self._categories[key - 1]
+        for category in self._categories:
+            if category.Name.lower() == key.lower():
+                return category
+        raise FakeComError(f"Category '{key}' not found")
+
+    def __iter__(self):
+        return iter(list(self._categories))
+
+    def __len__(self):
+        return len(self._categories)
+
+
+class FakeNamespace:
+    def __init__(self, latency=NO_LATENCY):
+        self._latency = latency
+        self.Stores = FakeStores()
+        self.Categories = FakeCategories(latency)
+        self._default_store = FakeStore("default.ost", "Outlook", latency)
+        self._inbox = self._default_store.GetRootFolder().Folders.Add("Inbox")
+        self._drafts = self._default_store.GetRootFolder().Folders.Add("Drafts")
+
+    def AddStore(self, path):
+        if not any(s.FilePath.lower() == path.lower() for s in self.Stores):
+            self.Stores._stores.append(FakeStore(path, latency=self._latency))
+
+    def GetDefaultFolder(self, folder_type):
+        if folder_type == 6:  # olFolderInbox
+            return self._inbox
+        if folder_type == 16:  # olFolderDrafts
+            return self._drafts
+        raise FakeComError(f"Default folder {folder_type} not supported")
+
+    def GetItemFromID(self, entry_id, store_id=None):
+        self._latency.charge("GetItemFromID")
+        for store in [self._default_store, *self.Stores]:
+            if store_id and store.StoreID != store_id:
+                continue
+            folders = [store.GetRootFolder()]
+            while folders:
+                folder = folders.pop()
+                folders.extend(folder.Folders)
+                for item in folder.Items:
+                    if item.EntryID == entry_id:
+                        return item
+        raise FakeComError(f"Item {entry_id} not found")
+
+    def OpenSharedItem(self, path):
+        """Open an .eml file as a received (non-draft) item, saved to Drafts on Save()."""
+        self._latency.charge("OpenSharedItem")
+        with open(path, 'rb') as f:
+            message = message_from_bytes(f.read(), policy=policy.default)
+        item = FakeMailItem(self._drafts, in_folder=False)
+        item.Subject = str(message.get('Subject', ''))
+        item.SentOnBehalfOfName = str(message.get('From', ''))
+        item.To = str(message.get('To', ''))
+        item.Sent = True
+        if message.get('Message-ID'):
+            item.PropertyAccessor.properties[PR_INTERNET_MESSAGE_ID] = str(message['Message-ID']).strip()
+        body = message.get_body(preferencelist=('html',))
+        if body is not None:
+            item.HTMLBody = body.get_content()
+        body = message.get_body(preferencelist=('plain',))
+        if body is not None:
+            item.Body = body.get_content()
+        for part in message.iter_attachments():
+            attachment = FakeAttachment(part.get_payload(decode=True) or b'', part.get_filename() or "attachment",
+                                        latency=self._latency)
+            if part.get('Content-ID'):
+                attachment.PropertyAccessor.properties[PR_ATTACH_CONTENT_ID] = str(part['Content-ID']).strip('<>')
+            item.Attachments._items.append(attachment)
+        return item
+
+    @property
+    def Folders(self):
+        folders = FakeFolders(None)
+        folders._folders = [s.GetRootFolder() for s in self.Stores]
+        return folders
+
+
+class FakeOutlookApplication:
+    """Stand-in for win32com.client.Dispatch("Outlook.Application")."""
+
+    def __init__(self, latency=NO_LATENCY):
+        self.latency = latency
+        self._namespace = FakeNamespace(latency)
+
+    def GetNamespace(self, name):
+        return self._namespace
+
+    def property_round_trips(self):
+        """Test helper: PropertyAccessor calls made on every item and attachment."""
+        total = 0
+        for store in self._namespace.Stores:
+            folders = [store.GetRootFolder()]
+            while folders:
+                folder = folders.pop()
+                folders.extend(folder.Folders)
+                for item in folder.Items:
+                    total += item.PropertyAccessor.round_trips
+                    total += sum(a.PropertyAccessor.round_trips for a in item.Attachments)
+        return total
+
+    def store(self, pst_path):
+        """Test helper: the FakeStore opened for pst_path."""
+        pst_abs_path = os.path.abspath(pst_path)
+        for store in self._namespace.Stores:
+            if store.FilePath.lower() == pst_abs_path.lower():
+                return store
+        raise FakeComError(f"Store {pst_path} not opened")
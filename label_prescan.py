@@ -0,0 +1,104 @@
+"""
+Label pre-scan: every Outlook category is created before the first item.
+
+The Gmail labels of a mailbox are known before any message is decoded: the
+MBOX index keeps the raw X-Gmail-Labels header of every message (see
+mbox_index.summarize_headers), so one pass over the index, without reading
+the MBOX again, gives every distinct label and the number of messages that
+carry it. The master categories are then created in one batch, coloured
+from an optional JSON mapping:
+
+    {
+        "Important": "Red",
+        "Travail": "olCategoryColorDarkBlue",
+        "Factures": 5
+    }
+
+Colours are olCategoryColor names (with or without the "olCategoryColor"
+prefix, any case) or their numbers (1-25, -1 = none). The per-message loop
+then finds every category already in the master list.
+"""
+import json
+import time
+import logging
+from collections import Counter
+
+from mbox_index import SUMMARY_FIELDS
+
+
+# Outlook OlCategoryColor enumeration
+OL_CATEGORY_COLORS = {
+    "none": -1,
+    "red": 1, "orange": 2, "peach": 3, "yellow": 4, "green": 5, "teal": 6, "olive": 7, "blue": 8,
+    "purple": 9, "maroon": 10, "steel": 11, "darksteel": 12, "gray": 13, "darkgray": 14, "black": 15,
+    "darkred": 16, "darkorange": 17, "darkpeach": 18, "darkyellow": 19, "darkgreen": 20, "darkteal": 21,
+    "darkolive": 22, "darkblue": 23, "darkpurple": 24, "darkmaroon": 25,
+}
+COLOR_PREFIX = "olcategorycolor"
+LABELS_FIELD = SUMMARY_FIELDS.index("labels")
+TOP_LABELS = 10  # labels listed in the log after the pre-scan
+
+
+def parse_category_color(value):
+    """olCategoryColor number for a colour name or number; ValueError if unknown."""
+    if isinstance(value, bool):
+        raise ValueError(f"invalid category colour: {value!r}")
+    if isinstance(value, int):
+        if value == -1 or 1 <= value <= 25:
+            return value
+        raise ValueError(f"category colour out of range (1-25, -1 = none): {value}")
+    if isinstance(value, str):
+        key = value.strip().lower().replace(" ", "").replace("_", "")
+        if key.startswith(COLOR_PREFIX):
+            key = key[len(COLOR_PREFIX):]
+        if key in OL_CATEGORY_COLORS:
+            return OL_CATEGORY_COLORS[key]
+        if key.lstrip("-").isdigit():
+            return parse_category_color(int(key))
+    raise ValueError(f"unknown category colour: {value!r}")
+
+
+def load_category_colors(path):
+    """Read a {label: colour} JSON file into {label: olCategoryColor number}."""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        mapping = json.load(f)
+    if not isinstance(mapping, dict):
+        raise ValueError(f"{path}: expected a JSON object {{\"label\": \"colour\"}}")
+    colors = {}
+    for label, value in mapping.items():
+        try:
+            colors[label.strip()] = parse_category_color(value)
+        except ValueError as e:
+            raise ValueError(f"{path}: label '{label}': {e}") from None
+    return colors
+
+
+def scan_labels(mbox_index, decode_labels, start_at=0, stop_at=None, keep=None):
+    """
+    Count the messages carrying each label in messages [start_at, stop_at) of
+    the index. decode_labels turns a raw header value into a tuple of labels
+    (mbox_to_pst.decode_labels, cached per distinct value); keep(i), if
+    given, leaves out the messages the run will not import (filters).
+    """
+    stop_at = len(mbox_index) if stop_at is None else stop_at
+    frequencies = Counter()
+    summaries = mbox_index.summaries
+    for i in range(start_at, stop_at):
+        raw = summaries[i][LABELS_FIELD]
+        if raw and (keep is None or keep(i)):
+            # Several X-Gmail-Labels headers are joined with ",": count a label once per message
+            frequencies.update(set(decode_labels(raw)))
+    return frequencies
+
+
+def prescan_labels(mbox_index, decode_labels, start_at=0, stop_at=None, top=TOP_LABELS, keep=None):
+    """scan_labels() with a log of the most frequent labels."""
+    t0 = time.perf_counter()
+    frequencies = scan_labels(mbox_index, decode_labels, start_at, stop_at, keep)
+    stop_at = len(mbox_index) if stop_at is None else stop_at
+    logging.info(f"Label pre-scan: {len(frequencies)} distinct labels in {stop_at - start_at} messages "
+                 f"({time.perf_counter() - t0:.2f}s)")
+    if frequencies:
+        logging.info("Most frequent labels: " +
+                     ", ".join(f"{label} ({count})" for label, count in frequencies.most_common(top)))
+    return frequencies
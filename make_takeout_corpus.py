@@ -0,0 +1,270 @@
+"""
+Synthetic Gmail Takeout MBOX generator, for reproducible benchmarks.
+
+Writes an MBOX of the requested size (or message count) with the mix found
+in real Takeout exports:
+
+- multi-label X-Gmail-Labels headers (accented labels as encoded words,
+  "Catégorie : ..." labels, Spam/Trash),
+- RFC 2047 encoded-word subjects and sender names (UTF-8 and ISO-8859-1,
+  B and Q encodings), multi-recipient To headers,
+- plain text, multipart/alternative, HTML with CID inline images
+  (multipart/related), large base64 attachments, forwarded messages
+  nested as message/rfc822,
+- body lines starting with "From " (escaped ">From " in the MBOX),
+- messages without Message-ID and exact duplicates of earlier messages.
+
+The output only depends on --seed: the same command always produces the
+same file, so throughput can be compared between commits.
+
+Usage:
+    python make_takeout_corpus.py corpus.mbox --size-mb 200
+    python make_takeout_corpus.py corpus.mbox --messages 5000 --seed 7
+"""
+import re
+import time
+import base64
+import quopri
+import random
+import argparse
+import datetime
+from email.header import Header
+from email.utils import formataddr, format_datetime
+
+
+FIRST_NAMES = ["Élise", "François", "Zoë", "Jérôme", "Anaïs", "Marc", "Sophie", "Thomas", "Léa", "Björn",
+               "Ωmega", "Chloé", "Nicolas", "Hélène", "Paul", "Amélie", "Iñaki", "Julie", "李", "Camille"]
+LAST_NAMES = ["Dupré", "Müller", "Martin", "Lefèvre", "Bernard", "Nguyễn", "Garcia", "Rousseau", "Petit",
+              "O'Brien", "Durand", "Moreau", "Faure", "Girard", "André", "Mercier"]
+DOMAINS = ["gmail.com", "orange.fr", "free.fr", "example.com", "univ-lyon.fr", "entreprise.fr", "yahoo.fr",
+           "laposte.net", "newsletter.example.org", "notifications.example.net"]
+LABELS = ["Inbox", "Important", "Ouvert", "Non lus", "Envoyés", "Archivé", "Suivis", "Catégorie : Forums",
+          "Catégorie : Promotions", "Catégorie : Réseaux sociaux", "Catégorie : Mises à jour", "Travail/Projets",
+          "Famille", "Voyages 2019", "Impôts", "Factures", "Reçus", "Spam", "Corbeille"]
+WORDS = ("réunion projet facture devis rendez-vous vacances photos rapport compte-rendu budget commande "
+         "livraison dossier contrat planning équipe relance inscription confirmation invitation bilan "
+         "proposition mise à jour urgent semaine prochaine merci bonjour").split()
+
+# Message kinds and their share of the corpus
+KINDS = (("plain", 0.30), ("alternative", 0.30), ("inline_images", 0.15), ("attachments", 0.17),
+         ("forwarded", 0.08))
+
+# 1x1 transparent GIF: inline images are small, their count is what matters
+TINY_GIF = (b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00"
+            b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;")
+
+_FROM_LINE = re.compile(rb'^(>*From )', re.MULTILINE)
+
+
+class CorpusGenerator:
+    """Deterministic generator of raw Takeout-like messages (bytes, LF line endings)."""
+
+    def __init__(self, seed=0, attachment_kb=(20, 4096), duplicate_rate=0.05, missing_id_rate=0.02):
+        self.random = random.Random(seed)
+        self.attachment_kb = attachment_kb
+        self.duplicate_rate = duplicate_rate
+        self.missing_id_rate = missing_id_rate
+        self.count = 0
+        self.duplicates = 0
+        self._recent = []  # small raw messages available for duplication
+        self._start = datetime.datetime(2008, 1, 1, tzinfo=datetime.timezone.utc)
+
+    # ------------------------------------------------------------------
+    # Headers
+    # ------------------------------------------------------------------
+
+    def _encoded(self, text):
+        """Encoded word when needed, like Gmail: UTF-8 (B or Q), sometimes ISO-8859-1."""
+        if text.isascii():
+            return text
+        charset = "iso-8859-1" if self.random.random() < 0.2 and all(ord(c) < 256 for c in text) else "utf-8"
+        return Header(text, charset).encode()
+
+    def _address(self):
+        first, last = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+        local = re.sub(r"[^a-z.]", "", f"{first}.{last}".lower()).strip(".") or "contact"
+        email_address = f"{local}{self.random.randint(1, 99)}@{self.random.choice(DOMAINS)}"
+        if self.random.random() < 0.15:
+            return email_address
+        return formataddr((self._encoded(f"{first} {last}"), email_address))
+
+    def _subject(self):
+        words = self.random.sample(WORDS, self.random.randint(2, 7))
+        subject = " ".join(words).capitalize()
+        prefix = self.random.choice(["", "", "", "Re: ", "RE: ", "Fwd: ", "TR: "])
+        return self._encoded(prefix + subject)
+
+    def _labels(self):
+        labels = self.random.sample(LABELS, self.random.randint(1, 4))
+        # Takeout writes the whole list as one header, encoded if any label is not ASCII
+        return self._encoded(",".join(labels))
+
+    def _headers(self, date, with_message_id=True):
+        lines = [
+            f"X-GM-THRID: {self.random.getrandbits(63)}",
+            f"X-Gmail-Labels: {self._labels()}",
+            f"Delivered-To: {self._address()}",
+        ]
+        if with_message_id and self.random.random() >= self.missing_id_rate:
+            lines.append(f"Message-ID: <{self.random.getrandbits(64):016x}.{self.count}@{self.random.choice(DOMAINS)}>")
+        lines += [
+            f"Date: {format_datetime(date)}",
+            f"From: {self._address()}",
+            f"To: {', '.join(self._address() for _ in range(self.random.randint(1, 4)))}",
+            f"Subject: {self._subject()}",
+        ]
+        if self.random.random() < 0.3:
+            lines.append(f"References: <{self.random.getrandbits(64):016x}@{self.random.choice(DOMAINS)}>")
+        lines.append("MIME-Version: 1.0")
+        return lines
+
+    # ------------------------------------------------------------------
+    # Bodies
+    # ------------------------------------------------------------------
+
+    def _text(self, paragraphs=None):
+        lines = []
+        for _ in range(paragraphs or self.random.randint(1, 8)):
+            lines.append(" ".join(self.random.choice(WORDS) for _ in range(self.random.randint(8, 30))).capitalize() + ".")
+            if self.random.random() < 0.1:
+                lines.append("From the desk of the team: see below.")  # needs >From escaping in the MBOX
+            lines.append("")
+        return "\n".join(lines)
+
+    def _html(self, text, cids=()):
+        paragraphs = "".join(f"<p>{line}</p>" for line in text.split("\n") if line)
+        images = "".join(f'<img src="cid:{cid}" alt="image">' for cid in cids)
+        return f"<html><body>{paragraphs}{images}</body></html>"
+
+    @staticmethod
+    def _qp(text):
+        return quopri.encodestring(text.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _base64(data):
+        encoded = base64.b64encode(data).decode("ascii")
+        return "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+
+    def _boundary(self):
+        return f"000000000000{self.random.getrandbits(48):012x}"
+
+    def _text_part(self, subtype, text):
+        return [f'Content-Type: text/{subtype}; charset="UTF-8"', "Content-Transfer-Encoding: quoted-printable",
+                "", self._qp(text)]
+
+    def _multipart(self, subtype, parts):
+        boundary = self._boundary()
+        lines = [f'Content-Type: multipart/{subtype}; boundary="{boundary}"', ""]
+        for part in parts:
+            lines += [f"--{boundary}"] + part
+        lines += [f"--{boundary}--", ""]
+        return lines
+
+    def _attachment_part(self):
+        low, high = self.attachment_kb
+        # Mostly small documents, a few large ones
+        size_kb = int(min(high, max(low, self.random.paretovariate(1.2) * low)))
+        extension, mime_type = self.random.choice([(".pdf", "application/pdf"), (".jpg", "image/jpeg"),
+                                                   (".docx", "application/vnd.openxmlformats-officedocument."
+                                                                 "wordprocessingml.document"),
+                                                   (".zip", "application/zip")])
+        filename = self._encoded(f"{self.random.choice(WORDS)}_{self.random.randint(1, 999)}{extension}")
+        return [f'Content-Type: {mime_type}; name="{filename}"',
+                f'Content-Disposition: attachment; filename="{filename}"',
+                "Content-Transfer-Encoding: base64", "",
+                self._base64(self.random.randbytes(size_kb * 1024))]
+
+    def _body(self, kind):
+        text = self._text()
+        if kind == "plain":
+            return self._text_part("plain", text)
+        if kind == "alternative":
+            return self._multipart("alternative", [self._text_part("plain", text),
+                                                   self._text_part("html", self._html(text))])
+        if kind == "inline_images":
+            cids = [f"ii_{self.random.getrandbits(40):010x}" for _ in range(self.random.randint(1, 5))]
+            images = [[f'Content-Type: image/gif; name="image{i}.gif"', f"Content-ID: <{cid}>",
+                       f"X-Attachment-Id: {cid}", 'Content-Disposition: inline; filename="image.gif"',
+                       "Content-Transfer-Encoding: base64", "", self._base64(TINY_GIF)]
+                      for i, cid in enumerate(cids)]
+            related = self._multipart("related", [self._text_part("html", self._html(text, cids))] + images)
+            return self._multipart("alternative", [self._text_part("plain", text), related])
+        if kind == "attachments":
+            body = self._multipart("alternative", [self._text_part("plain", text),
+                                                   self._text_part("html", self._html(text))])
+            return self._multipart("mixed", [body] + [self._attachment_part()
+                                                      for _ in range(self.random.randint(1, 3))])
+        # forwarded: the original message nested as message/rfc822
+        inner_date = self._start + datetime.timedelta(seconds=self.random.randint(0, 16 * 365 * 86400))
+        inner = self._headers(inner_date, with_message_id=False)[3:] + self._text_part("plain", self._text(2))
+        return self._multipart("mixed", [self._text_part("plain", "---------- Forwarded message ----------"),
+                                         ['Content-Type: message/rfc822', 'Content-Disposition: attachment', ""]
+                                         + inner])
+
+    # ------------------------------------------------------------------
+    # Messages
+    # ------------------------------------------------------------------
+
+    def message(self):
+        """Return (From_ line, raw message bytes) for the next message."""
+        self.count += 1
+        if self._recent and self.random.random() < self.duplicate_rate:
+            self.duplicates += 1
+            return self.random.choice(self._recent)
+
+        kind = self.random.choices([k for k, _ in KINDS], [w for _, w in KINDS])[0]
+        date = self._start + datetime.timedelta(seconds=self.random.randint(0, 16 * 365 * 86400))
+        raw = "\n".join(self._headers(date) + self._body(kind)).encode("utf-8")
+        from_line = f"From {self.random.getrandbits(60)}@xxx {date.strftime('%a %b %d %H:%M:%S +0000 %Y')}"
+        entry = (from_line.encode("ascii"), raw)
+        if len(raw) < 64 * 1024:
+            self._recent.append(entry)
+            if len(self._recent) > 200:
+                self._recent.pop(self.random.randrange(len(self._recent)))
+        return entry
+
+
+def write_corpus(path, size_mb=None, messages=None, seed=0, attachment_kb=(20, 4096),
+                 duplicate_rate=0.05, missing_id_rate=0.02):
+    """Write an MBOX until size_mb megabytes or the given message count. Returns the generator (for its counters)."""
+    generator = CorpusGenerator(seed, attachment_kb, duplicate_rate, missing_id_rate)
+    target_bytes = int(size_mb * 1024 * 1024) if size_mb else None
+    written = 0
+    with open(path, "wb") as f:
+        while True:
+            if messages is not None and generator.count >= messages:
+                break
+            if target_bytes is not None and written >= target_bytes:
+                break
+            from_line, raw = generator.message()
+            # mboxo escaping, as Takeout does: body lines starting with "From " get a ">"
+            body = _FROM_LINE.sub(rb'>\1', raw)
+            chunk = from_line + b"\n" + body + (b"\n" if body.endswith(b"\n") else b"\n\n")
+            f.write(chunk)
+            written += len(chunk)
+    return generator, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère un MBOX synthétique au format Gmail Takeout")
+    parser.add_argument("output", help="Fichier .mbox à créer")
+    parser.add_argument("--size-mb", type=float, default=None, help="Taille cible en Mo (défaut : 50)")
+    parser.add_argument("--messages", type=int, default=None, help="Nombre de messages (au lieu de --size-mb)")
+    parser.add_argument("--seed", type=int, default=0, help="Graine : le même nombre donne le même fichier")
+    parser.add_argument("--max-attachment-kb", type=int, default=4096, help="Taille maximale d'une pièce jointe (Ko)")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="Proportion de doublons (défaut : 0.05)")
+    parser.add_argument("--missing-id", type=float, default=0.02, help="Proportion de messages sans Message-ID")
+    args = parser.parse_args()
+    if args.size_mb is None and args.messages is None:
+        args.size_mb = 50
+
+    t0 = time.perf_counter()
+    generator, written = write_corpus(args.output, args.size_mb, args.messages, args.seed,
+                                      (min(20, args.max_attachment_kb), args.max_attachment_kb),
+                                      args.duplicates, args.missing_id)
+    print(f"{args.output}: {generator.count} messages ({generator.duplicates} duplicates), "
+          f"{written / (1024 * 1024):.1f} MB in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
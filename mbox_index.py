@@ -0,0 +1,258 @@
+"""
+Persistent byte-offset index for MBOX files.
+
+Opening a 5-10 GB Takeout export with mailbox.mbox() scans the whole file just
+to count messages, and resuming at message N re-parses the N previous messages
+only to skip them. The index is built once, stored next to the MBOX
+("<file>.mbox.idx") and reused as long as the MBOX size and modification time
+are unchanged. It records, for every message:
+
+    - the byte span of the message (start of the "From " line, end of data)
+    - a 64-bit hash of its Message-ID
+    - a short header summary (Date, From, Subject, X-Gmail-Labels)
+
+Any message can then be read with a single seek(), in constant time.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from array import array
+from email.parser import BytesHeaderParser
+from email.policy import compat32
+
+from mbox_scanner import MboxScanner, LINESEP
+
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+SUMMARY_FIELDS = ("date", "from", "subject", "labels")
+SUBJECT_MAX_LEN = 200
+
+FINGERPRINT_SAMPLE = 64 * 1024
+
+
+def message_id_hash(message_id):
+    """Return a stable 64-bit integer hash of a Message-ID (0 if empty)."""
+    if not message_id:
+        return 0
+    message_id = message_id.strip()
+    if not message_id:
+        return 0
+    digest = hashlib.blake2b(message_id.encode('utf-8', errors='surrogateescape'), digest_size=8).digest()
+    # 0 is reserved for "no Message-ID"
+    return int.from_bytes(digest, 'little') or 1
+
+
+def header_message_id_hash(value):
+    """message_id_hash() of a raw Message-ID header value, whitespace normalised as in the index."""
+    return message_id_hash(_clean_header(value))
+
+
+def file_fingerprint(path):
+    """
+    Cheap identity of a (multi-GB) file: its size and a hash of its first and
+    last 64 KB. The mtime is recorded too but not compared, so a copied MBOX
+    still matches.
+    """
+    st = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE))
+        if st.st_size > FINGERPRINT_SAMPLE:
+            f.seek(max(st.st_size - FINGERPRINT_SAMPLE, FINGERPRINT_SAMPLE))
+            digest.update(f.read(FINGERPRINT_SAMPLE))
+    return {"size": st.st_size, "mtime": int(st.st_mtime), "sample_hash": digest.hexdigest()}
+
+
+def fingerprints_match(saved, current):
+    return saved.get("size") == current["size"] and saved.get("sample_hash") == current["sample_hash"]
+
+
+def index_path_for(mbox_path):
+    return mbox_path + INDEX_SUFFIX
+
+
+def _clean_header(value, max_len=None):
+    """Header value as plain str (undecoded RFC 2047), safe for JSON."""
+    if value is None:
+        return ""
+    value = str(value)
+    # compat32 keeps undecodable bytes as surrogates
+    value = value.encode('utf-8', errors='surrogateescape').decode('utf-8', errors='replace')
+    value = " ".join(value.split())
+    if max_len:
+        value = value[:max_len]
+    return value
+
+
+def summarize_headers(header_bytes):
+    """
+    Parse a raw header block and return (message_id_hash, summary tuple).
+
+    Only the header block is parsed: bodies and attachments are never decoded.
+    """
+    headers = BytesHeaderParser(policy=compat32).parsebytes(header_bytes)
+    message_id = headers.get('Message-ID', '') or headers.get('Message-Id', '')
+    labels = headers.get_all('X-Gmail-Labels', [])
+    summary = (
+        _clean_header(headers.get('Date')),
+        _clean_header(headers.get('From')),
+        _clean_header(headers.get('Subject'), SUBJECT_MAX_LEN),
+        _clean_header(",".join(str(l) for l in labels if l)),
+    )
+    return header_message_id_hash(message_id), summary
+
+
+class MboxIndex:
+    """In-memory view of an MBOX offset index."""
+
+    def __init__(self, mbox_path, mbox_size, mbox_mtime, starts=None, stops=None, hashes=None, summaries=None):
+        self.mbox_path = mbox_path
+        self.mbox_size = mbox_size
+        self.mbox_mtime = mbox_mtime
+        self.starts = starts if starts is not None else array('q')
+        self.stops = stops if stops is not None else array('q')
+        self.hashes = hashes if hashes is not None else array('Q')
+        self.summaries = summaries if summaries is not None else []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def span(self, i):
+        """(start, stop) byte offsets of message i, as in mailbox.mbox._toc."""
+        return self.starts[i], self.stops[i]
+
+    def offset(self, i):
+        """Byte offset where message i starts (offset(len(self)) is the file size)."""
+        if i >= len(self.starts):
+            return self.mbox_size
+        return self.starts[i]
+
+    def summary(self, i):
+        return dict(zip(SUMMARY_FIELDS, self.summaries[i]), message_id_hash=self.hashes[i])
+
+    def matches_file(self, mbox_path=None):
+        """True if the MBOX on disk still has the size/mtime the index was built from."""
+        try:
+            st = os.stat(mbox_path or self.mbox_path)
+        except OSError:
+            return False
+        return st.st_size == self.mbox_size and int(st.st_mtime) == self.mbox_mtime
+
+    # ------------------------------------------------------------------
+    # Message access
+    # ------------------------------------------------------------------
+
+    def iter_messages(self, start_at=0, stop=None):
+        """
+        Yield (message_index, file_position, message) from start_at, seeking
+        directly to the first message instead of parsing the previous ones.
+        Messages are identical to those returned by mailbox.mbox.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        with MboxScanner(self.mbox_path) as scanner:
+            for i in range(start_at, stop):
+                start, end = self.span(i)
+                yield i, end, scanner.message(start, end)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, index_path=None):
+        """Write the index atomically (temp file + rename)."""
+        index_path = index_path or index_path_for(self.mbox_path)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "mbox_size": self.mbox_size,
+                "mbox_mtime": self.mbox_mtime,
+                "linesep": LINESEP.decode('ascii'),
+                "count": len(self),
+            }, f)
+            f.write("\n")
+            for i in range(len(self)):
+                json.dump([self.starts[i], self.stops[i], self.hashes[i], *self.summaries[i]], f, ensure_ascii=False)
+                f.write("\n")
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, mbox_path, index_path=None):
+        """Load an index from disk. Returns None if missing, unreadable or stale."""
+        index_path = index_path or index_path_for(mbox_path)
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                meta = json.loads(f.readline())
+                if meta.get("version") != INDEX_VERSION or meta.get("linesep") != LINESEP.decode('ascii'):
+                    return None
+                index = cls(mbox_path, meta["mbox_size"], meta["mbox_mtime"])
+                for line in f:
+                    start, stop, msg_hash, *summary = json.loads(line)
+                    index.starts.append(start)
+                    index.stops.append(stop)
+                    index.hashes.append(msg_hash)
+                    index.summaries.append(tuple(summary))
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable MBOX index {index_path}: {e}")
+            return None
+        if len(index) != meta.get("count") or not index.matches_file(mbox_path):
+            return None
+        return index
+
+    @classmethod
+    def build(cls, mbox_path, progress_callback=None):
+        """
+        Scan the MBOX once and build its index.
+
+        Boundaries come from MboxScanner, which follows
+        mailbox.mbox._generate_toc() exactly; only the header block of each
+        message is parsed.
+
+        Args:
+            progress_callback: Optional callable(file_position, file_size)
+        """
+        st = os.stat(mbox_path)
+        index = cls(mbox_path, st.st_size, int(st.st_mtime))
+        last_progress_pos = 0
+
+        with MboxScanner(mbox_path) as scanner:
+            for start, stop in scanner.spans():
+                msg_hash, summary = summarize_headers(scanner.header_block(start, stop))
+                index.starts.append(start)
+                index.stops.append(stop)
+                index.hashes.append(msg_hash)
+                index.summaries.append(summary)
+                if progress_callback and start - last_progress_pos > 10 * 1024 * 1024:
+                    progress_callback(start, st.st_size)
+                    last_progress_pos = start
+
+        if progress_callback:
+            progress_callback(st.st_size, st.st_size)
+        return index
+
+
+def open_index(mbox_path, rebuild=False, progress_callback=None):
+    """
+    Return a valid MboxIndex for mbox_path, loading the sidecar file when it
+    matches the MBOX size/mtime and (re)building it otherwise.
+    """
+    index = None if rebuild else MboxIndex.load(mbox_path)
+    if index is not None:
+        logging.info(f"Loaded MBOX index: {len(index)} messages")
+        return index
+
+    logging.info("Building MBOX offset index (one-time scan)...")
+    t0 = time.time()
+    index = MboxIndex.build(mbox_path, progress_callback=progress_callback)
+    logging.info(f"Indexed {len(index)} messages in {time.time() - t0:.1f}s")
+    try:
+        index.save()
+    except OSError as e:
+        logging.warning(f"Could not save MBOX index next to the MBOX: {e}")
+    return index
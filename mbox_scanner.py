@@ -0,0 +1,161 @@
+"""
+Zero-copy MBOX framing engine based on mmap.
+
+The MBOX file is memory-mapped and message boundaries ("From " lines) are
+located with mmap.find(), which runs in C directly on the mapped pages: no
+chunk buffers are concatenated and no data is copied until a message is
+actually parsed. Boundaries follow mailbox.mbox._generate_toc() exactly, so
+the bytes of every message are identical to what the standard parser returns
+(the old chunked stream_mbox() truncated some messages).
+"""
+import os
+import mmap
+import mailbox
+
+
+# mailbox.mbox strips os.linesep before the next "From " line and converts it
+# to "\n" in message data; do the same to stay byte-for-byte compatible.
+LINESEP = mailbox.linesep
+_LINESEP_LEN = len(LINESEP)
+_NEWLINE = 0x0A
+
+
+class MboxScanner:
+    """
+    Memory-mapped view of an MBOX file.
+
+    Usage:
+        with MboxScanner(path) as scanner:
+            for start, stop in scanner.spans():
+                msg = scanner.message(start, stop)
+    """
+
+    def __init__(self, mbox_path):
+        self.mbox_path = mbox_path
+        self._file = open(mbox_path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._view = memoryview(self._mm) if self._mm is not None else memoryview(b'')
+
+    def close(self):
+        self._view.release()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Framing
+    # ------------------------------------------------------------------
+
+    def _line_is_empty(self, line_end):
+        """True if the line ending just before offset line_end is exactly LINESEP."""
+        line_start = line_end - _LINESEP_LEN
+        if line_start < 0 or self._mm[line_start:line_end] != LINESEP:
+            return False
+        return line_start == 0 or self._mm[line_start - 1] == _NEWLINE
+
+    def _next_from(self, pos):
+        """Offset of the next line starting with "From " at or after pos, or -1."""
+        if pos == 0 and self._mm[:5] == b'From ':
+            return 0
+        found = self._mm.find(b'\nFrom ', max(pos - 1, 0))
+        return found + 1 if found != -1 else -1
+
+    def spans(self, start_offset=0):
+        """
+        Yield (start, stop) byte spans of each message, like mailbox.mbox's
+        table of contents. start is the offset of the "From " line, stop the
+        end of the message data.
+
+        start_offset must be 0 or the start of a message (e.g. from the index
+        or a checkpoint); messages before it are never looked at.
+        """
+        if self._mm is None:
+            return
+        start = self._next_from(start_offset)
+        while start != -1:
+            following = self._next_from(start + 5)
+            if following == -1:
+                stop = self.size - _LINESEP_LEN if self._line_is_empty(self.size) else self.size
+                yield start, stop
+                return
+            stop = following - _LINESEP_LEN if self._line_is_empty(following) else following
+            yield start, stop
+            start = following
+
+    # ------------------------------------------------------------------
+    # Message access
+    # ------------------------------------------------------------------
+
+    def view(self, start, stop):
+        """
+        memoryview over the raw bytes of a span (no copy). Release it before
+        closing the scanner.
+        """
+        return self._view[start:stop]
+
+    def from_line_end(self, start, stop):
+        """Offset just after the "From " line of the message at start."""
+        eol = self._mm.find(b'\n', start, stop)
+        return stop if eol == -1 else eol + 1
+
+    def header_block(self, start, stop):
+        """
+        Raw header block of a message (From line excluded), up to and
+        including the newline of the last header line. Only these bytes are
+        copied; the body is never touched.
+        """
+        body_start = self.from_line_end(start, stop)
+        search_from = max(body_start - 1, start)
+        ends = [pos for pos in (self._mm.find(b'\n\n', search_from, stop),
+                                self._mm.find(b'\n\r\n', search_from, stop)) if pos != -1]
+        header_end = min(ends) + 1 if ends else stop
+        return self._mm[body_start:max(header_end, body_start)]
+
+    def message_bytes(self, start, stop, from_=False):
+        """Message bytes, identical to mailbox.mbox.get_bytes()."""
+        data = self._mm[start if from_ else self.from_line_end(start, stop):stop]
+        if LINESEP != b'\n':
+            data = data.replace(LINESEP, b'\n')
+        return data
+
+    def message(self, start, stop):
+        """mailbox.mboxMessage, identical to mailbox.mbox.get_message()."""
+        body_start = self.from_line_end(start, stop)
+        from_line = self._mm[start:body_start].replace(LINESEP, b'')
+        data = self._mm[body_start:stop]
+        if LINESEP != b'\n':
+            data = data.replace(LINESEP, b'\n')
+        msg = mailbox.mboxMessage(data)
+        msg.set_from(from_line[5:].decode('ascii', errors='replace'))
+        return msg
+
+
+def iter_mbox(mbox_path, start_at=0, progress_callback=None):
+    """
+    Yield (message_index, file_position, message) for every message, where
+    file_position is the offset just after the message.
+
+    Args:
+        start_at: Message index to start yielding from (earlier messages are
+            framed but never parsed)
+        progress_callback: Optional callable(file_position, file_size, message_index, start_at)
+            called every 10 MB while skipping to start_at
+    """
+    with MboxScanner(mbox_path) as scanner:
+        last_progress_pos = 0
+        for message_index, (start, stop) in enumerate(scanner.spans()):
+            if message_index < start_at:
+                if progress_callback and start - last_progress_pos > 10 * 1024 * 1024:
+                    progress_callback(start, scanner.size, message_index, start_at)
+                    last_progress_pos = start
+                continue
+            yield message_index, stop, scanner.message(start, stop)
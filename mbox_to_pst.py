@@ -1,18 +1,51 @@
-import win32com.client
-import pywintypes  # Explicit import for PyInstaller
-import win32timezone  # Required by pywintypes.Time()
+try:
+    import win32com.client
+    import pywintypes  # Explicit import for PyInstaller
+    import win32timezone  # Required by pywintypes.Time()
+    WIN32_AVAILABLE = True
+except ImportError:
+    # Not on Windows: Outlook-free parts (parsing, fake_outlook) still work
+    WIN32_AVAILABLE = False
+    win32com = None
+    pywintypes = None
 import os
-import mailbox  # Standard MBOX parser - more reliable than custom streaming
+from mbox_index import open_index, file_fingerprint, fingerprints_match
+from dedup_store import open_dedup_store, DedupStore
+from problem_journal import ProblemJournal, REPORT_KEYS, print_report
+from backpressure import BackPressure, busy_error_name
+from stage_profiler import StageProfiler, SNAPSHOT_SECONDS
+from address_book import HeaderCache, AddressBook, intern_address
+from label_prescan import prescan_labels, load_category_colors
+from date_folders import DATE_FOLDER_MODES, date_folder_path, FolderCache
+from throughput import ThroughputTimeline
+from delta_import import DeltaSeed, outlook_messages
+from message_filter import MessageFilter, SPAM_TRASH_LABELS, parse_day
+from migration_scan import (MboxScan, stratified_sample, project, format_duration, MANIFEST_FILE, SIZE_CLASSES,
+                            TOP_LARGEST, DEFAULT_OUTLOOK_RATE, message_parts)
+from migration_verify import (MigrationVerifier, pst_file_items, outlook_items, ISSUES, DATE_TOLERANCE,
+                              VERIFY_REPORT_FILE)
+from outlook_categories import provision_master_categories, CategorySync, CategoryCleanup, remove_master_categories
+from mbox_scanner import MboxScanner, iter_mbox
+import pst_file
 
 import sys
+import glob
 import time
+import argparse
 import tempfile
 import logging
 import json
 import signal
+import atexit
+import queue
+import threading
+import multiprocessing
+import multiprocessing.pool
+import uuid
 from email.header import decode_header
 from email.utils import parsedate_to_datetime, getaddresses, formataddr, parseaddr
 from email import message_from_bytes
+from email.message import EmailMessage
 import datetime
 import mimetypes
 import re
@@ -35,128 +68,21 @@ def stream_mbox(mbox_path, start_at=0, progress_callback=None):
     """
     Streaming MBOX parser that yields (message_index, file_position, message) tuples.
     
-    This reads the file in chunks and parses messages on-the-fly, allowing
-    real-time progress updates based on file position.
+    The file is memory-mapped and message boundaries are located in place
+    (see mbox_scanner.py), so messages are framed exactly like mailbox.mbox
+    without re-buffering the file. Messages before start_at are framed but
+    never parsed.
     
     Args:
         mbox_path: Path to the MBOX file
         start_at: Message index to start from (for resume support)
-        progress_callback: Optional callable(file_position, file_size) for progress updates
+        progress_callback: Optional callable(file_position, file_size, message_index, start_at)
+            for progress updates while skipping to start_at
     
     Yields:
         (message_index, file_position, email.message.Message)
     """
-    file_size = os.path.getsize(mbox_path)
-    # MBOX message boundary pattern
-    # Google Takeout uses: "From 1234567890@xxx Mon Jan 21 00:00:00 +0000 2026"
-    # We match "From " followed by non-space chars, then a space (simple but effective)
-    mbox_from_pattern = re.compile(rb'^From \S+ .+\r?\n', re.MULTILINE)
-    
-    with open(mbox_path, 'rb') as f:
-        message_index = 0
-        current_message_data = b''
-        last_progress_pos = 0
-        
-        # Read in chunks for efficiency
-        chunk_size = 1024 * 1024  # 1 MB chunks
-        buffer = b''
-        
-        while True:
-            chunk = f.read(chunk_size)
-            if not chunk and not buffer:
-                break
-            
-            buffer += chunk
-            
-            # Find all "From " lines (message boundaries)
-            # MBOX format: each message starts with "From <email> <date>"
-            matches = list(mbox_from_pattern.finditer(buffer))
-            
-            if len(matches) == 0:
-                # No complete message boundary found yet, keep reading
-                if not chunk:  # End of file
-                    # Process remaining data as last message
-                    if buffer.strip():
-                        if message_index >= start_at:
-                            try:
-                                msg = message_from_bytes(buffer)
-                                yield (message_index, f.tell(), msg)
-                            except Exception:
-                                pass
-                    break
-                continue
-            
-            # Process all complete messages (except the last one in buffer)
-            for i, match in enumerate(matches):
-                if i == 0:
-                    # First match - data before it belongs to previous message
-                    if current_message_data:
-                        if message_index >= start_at:
-                            try:
-                                msg = message_from_bytes(current_message_data)
-                                pos = f.tell() - len(buffer) + match.start()
-                                yield (message_index, pos, msg)
-                            except Exception:
-                                pass
-                        message_index += 1
-                        
-                        # Progress callback during skip phase
-                        if progress_callback and message_index < start_at:
-                            pos = f.tell() - len(buffer) + match.start()
-                            if pos - last_progress_pos > 10 * 1024 * 1024:  # Every 10MB
-                                progress_callback(pos, file_size, message_index, start_at)
-                                last_progress_pos = pos
-                    
-                    # Start new message (skip the "From " line itself)
-                    if i + 1 < len(matches):
-                        current_message_data = buffer[match.end():matches[i + 1].start()]
-                    else:
-                        current_message_data = buffer[match.end():]
-                else:
-                    # Complete message between this match and previous
-                    if message_index >= start_at:
-                        try:
-                            msg = message_from_bytes(current_message_data)
-                            pos = f.tell() - len(buffer) + match.start()
-                            yield (message_index, pos, msg)
-                        except Exception:
-                            pass
-                    message_index += 1
-                    
-                    # Progress callback during skip phase
-                    if progress_callback and message_index < start_at:
-                        pos = f.tell() - len(buffer) + match.start()
-                        if pos - last_progress_pos > 10 * 1024 * 1024:
-                            progress_callback(pos, file_size, message_index, start_at)
-                            last_progress_pos = pos
-                    
-                    # Start new message
-                    if i + 1 < len(matches):
-                        current_message_data = buffer[match.end():matches[i + 1].start()]
-                    else:
-                        current_message_data = buffer[match.end():]
-            
-            # Keep only the last incomplete message in buffer
-            if matches:
-                buffer = buffer[matches[-1].start():]
-            
-            if not chunk:  # End of file
-                # Process final message
-                if buffer.strip():
-                    # Remove the "From " line from the start
-                    match = mbox_from_pattern.match(buffer)
-                    if match:
-                        final_data = buffer[match.end():]
-                    else:
-                        final_data = buffer
-                    
-                    if final_data.strip() and message_index >= start_at:
-                        try:
-                            msg = message_from_bytes(final_data)
-                            yield (message_index, file_size, msg)
-                        except Exception:
-                            pass
-                break
+    yield from iter_mbox(mbox_path, start_at=start_at, progress_callback=progress_callback)
 
 
 # Optional: tqdm for progress bar (graceful fallback if not installed)
@@ -178,17 +104,22 @@ logging.basicConfig(
 )
 
 STATE_FILE = "migration_state.json"
-PROBLEM_FILE = "problem_messages.json"
+BATCH_STATE_FILE = "migration_batch_state.json"  # one checkpoint per MBOX of a batch
+STATE_VERSION = 2
+PROBLEM_FILE = "problem_messages.jsonl"
+
+# Buffered: flushed at every checkpoint and at exit
+problem_journal = ProblemJournal(PROBLEM_FILE)
+atexit.register(problem_journal.close)
+
+# Per-stage timings and COM call counts, enabled by --profile
+profiler = StageProfiler()
+
+# Decoded From/To/label headers: repeated correspondents cost a lookup
+header_cache = HeaderCache()
 
 def log_problem_message(msg_index, subject, sender, date_str, error_type, error_detail):
-    """Log a problematic message for later manual review."""
-    problems = []
-    if os.path.exists(PROBLEM_FILE):
-        try:
-            with open(PROBLEM_FILE, 'r', encoding='utf-8') as f:
-                problems = json.load(f)
-        except: pass
-    
+    """Log a problematic message for later manual review (appended to the JSONL journal)."""
     # Decode sender if it's MIME-encoded
     decoded_sender = sender
     if sender:
@@ -205,7 +136,7 @@ def log_problem_message(msg_index, subject, sender, date_str, error_type, error_
         except:
             decoded_sender = sender
     
-    problems.append({
+    problem_journal.append({
         "message_index": msg_index,
         "subject": subject[:100] if subject else "(No Subject)",
         "sender": decoded_sender[:100] if decoded_sender else "",
@@ -214,9 +145,6 @@ def log_problem_message(msg_index, subject, sender, date_str, error_type, error_
         "error_detail": str(error_detail)[:500],
         "logged_at": datetime.datetime.now().isoformat()
     })
-    
-    with open(PROBLEM_FILE, 'w', encoding='utf-8') as f:
-        json.dump(problems, f, ensure_ascii=False, indent=2)
 
 def decode_mime_header(header_value):
     if not header_value:
@@ -241,40 +169,87 @@ def decode_mime_header(header_value):
     except:
         return str(header_value)
 
-def set_item_properties(mail_item, date_obj, sender_name="", sender_email="", references="", in_reply_to=""):
+class PropertyBatch:
+    """
+    Collects the MAPI properties of one Outlook object and writes them with a
+    single PropertyAccessor.SetProperties() call (one COM round trip) instead
+    of one SetProperty() per tag.
+    
+    Tags the batch reports as failed (or every tag, if SetProperties itself
+    fails) are retried one by one with SetProperty(); apply() returns the
+    properties that still could not be set.
+    """
+
+    def __init__(self):
+        self.schema_names = []
+        self.values = []
+
+    def __len__(self):
+        return len(self.schema_names)
+
+    def set(self, schema_name, value):
+        self.schema_names.append(schema_name)
+        self.values.append(value)
+
+    def apply(self, prop_accessor):
+        """Write the batch. Returns {schema_name: error} for the properties that failed."""
+        if not self.schema_names:
+            return {}
+        retry = range(len(self.schema_names))
+        try:
+            results = prop_accessor.SetProperties(self.schema_names, self.values)
+            # One entry per property: empty on success, the error otherwise
+            if results:
+                retry = [i for i, result in enumerate(results) if result]
+            else:
+                retry = []
+        except Exception as e:
+            logging.debug(f"SetProperties failed ({e}), setting properties one by one")
+
+        failures = {}
+        for i in retry:
+            try:
+                prop_accessor.SetProperty(self.schema_names[i], self.values[i])
+            except Exception as e:
+                failures[self.schema_names[i]] = e
+        return failures
+
+
+def set_item_properties(mail_item, date_obj, sender_name="", sender_email="", references="", in_reply_to="",
+                        message_id=""):
     """
-    Uses PropertyAccessor to set the sent/received date, message flags, SENDER info, and threading headers.
+    Uses PropertyAccessor to set the sent/received date, message flags, SENDER info, threading headers and
+    the Message-ID (read back in bulk by a --delta import).
     Must be called BEFORE the first Save() to effectively clear Draft status.
+    
+    All properties are sent in one PropertyBatch; returns {schema_name: error}
+    for those that could not be set.
     """
     try:
         prop_accessor = mail_item.PropertyAccessor
     except Exception as e:
         logging.warning(f"Cannot get PropertyAccessor: {e}")
-        return
+        return {}
+
+    batch = PropertyBatch()
     
     # 1. FORCE CLEAR DRAFT STATUS FIRST
     # PR_MESSAGE_FLAGS (0x0E070003) -> 1 = Read, Sent.
-    try:
-        prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0E070003", 1)
-    except: pass
+    batch.set("http://schemas.microsoft.com/mapi/proptag/0x0E070003", 1)
     
     # PR_MESSAGE_STATUS - skip this as it often fails
-    # try:
-    #     prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0E170003", 0)
-    # except: pass
+    # batch.set("http://schemas.microsoft.com/mapi/proptag/0x0E170003", 0)
     
     # PR_ICON_INDEX (0x10800003) -> 256 (Standard Unopened Mail Icon)
-    try:
-        prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x10800003", 256)
-    except: pass
+    batch.set("http://schemas.microsoft.com/mapi/proptag/0x10800003", 256)
 
     # 2. Set Dates (Critical for display)
     if date_obj:
         try:
             # Use pywintypes.Time which is the native COM date format
-            pywin_date = pywintypes.Time(date_obj.timestamp())
-            prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x00390040", pywin_date) # PR_CLIENT_SUBMIT_TIME
-            prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0E060040", pywin_date) # PR_MESSAGE_DELIVERY_TIME
+            pywin_date = pywintypes.Time(date_obj.timestamp()) if pywintypes else date_obj
+            batch.set("http://schemas.microsoft.com/mapi/proptag/0x00390040", pywin_date) # PR_CLIENT_SUBMIT_TIME
+            batch.set("http://schemas.microsoft.com/mapi/proptag/0x0E060040", pywin_date) # PR_MESSAGE_DELIVERY_TIME
         except:
             pass
 
@@ -283,44 +258,56 @@ def set_item_properties(mail_item, date_obj, sender_name="", sender_email="", re
         name = sender_name or sender_email
         email = sender_email or name
         
-        try:
-            prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0C1A001F", name) # PR_SENDER_NAME
-            prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0042001F", name) # PR_SENT_REPRESENTING_NAME
-        except: pass
+        batch.set("http://schemas.microsoft.com/mapi/proptag/0x0C1A001F", name) # PR_SENDER_NAME
+        batch.set("http://schemas.microsoft.com/mapi/proptag/0x0042001F", name) # PR_SENT_REPRESENTING_NAME
         
         if "@" in email:
-            try:
-                prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0C1F001F", email) # PR_SENDER_EMAIL_ADDRESS
-                prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0C1E001F", "SMTP") # PR_SENDER_ADDRTYPE
-                prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0065001F", email) # PR_SENT_REPRESENTING_EMAIL_ADDRESS
-                prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x0064001F", "SMTP") # PR_SENT_REPRESENTING_ADDRTYPE
-            except: pass
+            batch.set("http://schemas.microsoft.com/mapi/proptag/0x0C1F001F", email) # PR_SENDER_EMAIL_ADDRESS
+            batch.set("http://schemas.microsoft.com/mapi/proptag/0x0C1E001F", "SMTP") # PR_SENDER_ADDRTYPE
+            batch.set("http://schemas.microsoft.com/mapi/proptag/0x0065001F", email) # PR_SENT_REPRESENTING_EMAIL_ADDRESS
+            batch.set("http://schemas.microsoft.com/mapi/proptag/0x0064001F", "SMTP") # PR_SENT_REPRESENTING_ADDRTYPE
 
     # 4. Set Threading Headers for Conversation Grouping
     if references:
-        try:
-            # PR_INTERNET_REFERENCES (0x1039001F)
-            prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x1039001F", references)
-        except: pass
+        # PR_INTERNET_REFERENCES (0x1039001F)
+        batch.set("http://schemas.microsoft.com/mapi/proptag/0x1039001F", references)
     
     if in_reply_to:
-        try:
-            # PR_IN_REPLY_TO_ID (0x1042001F)
-            clean_reply_to = in_reply_to.strip().strip('<>')
-            prop_accessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x1042001F", clean_reply_to)
-        except: pass
+        # PR_IN_REPLY_TO_ID (0x1042001F)
+        clean_reply_to = in_reply_to.strip().strip('<>')
+        batch.set("http://schemas.microsoft.com/mapi/proptag/0x1042001F", clean_reply_to)
 
+    if message_id:
+        # PR_INTERNET_MESSAGE_ID (0x1035001F)
+        batch.set("http://schemas.microsoft.com/mapi/proptag/0x1035001F", message_id)
 
+    failures = batch.apply(prop_accessor)
+    for schema_name, error in failures.items():
+        logging.debug(f"Could not set {schema_name.rsplit('/', 1)[-1]}: {error}")
+    return failures
 
-def save_state(count):
-    with open(STATE_FILE, "w") as f:
-        json.dump({"last_count": count}, f)
 
-def load_state():
-    if os.path.exists(STATE_FILE):
-        with open(STATE_FILE, "r") as f:
-            return json.load(f).get("last_count", 0)
-    return 0
+
+def save_state(state, path=STATE_FILE):
+    """Write a checkpoint atomically: temp file, fsync, then rename over the previous one."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load_state(path=STATE_FILE):
+    """Return the last checkpoint ({} if none). Old {"last_count": n} files are returned as is."""
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if isinstance(state, dict):
+                return state
+        except ValueError as e:
+            logging.warning(f"Ignoring unreadable state file {path}: {e}")
+    return {}
 
 def add_to_master_categories(namespace, category_names):
     """Adds categories to the Outlook Master Category List if they don't exist."""
@@ -337,16 +324,15 @@ def add_to_master_categories(namespace, category_names):
     except Exception as e:
         logging.warning(f"Could not update Master Category List: {e}")
 
-def normalize_addresses(header_value):
-    if not header_value:
-        return ""
-    
+def _decode_address_list(raw_value):
+    """(display string, ((name, email), ...)) for a raw address header; see decode_address_list()."""
     # Use getaddresses on the raw header converted to string.
     # We do NOT pre-decode the whole header because that can break address delimiters (commas).
-    raw_values = [str(header_value)]
+    raw_values = [raw_value]
     
     seen = set()
     addresses = []
+    pairs = []
     
     for name, email in getaddresses(raw_values):
         if not email:
@@ -381,42 +367,660 @@ def normalize_addresses(header_value):
                  decoded_name = decode_mime_header(decoded_name).strip()
 
         addresses.append(formataddr((decoded_name, email_clean)))
+        pairs.append(intern_address(decoded_name, email_clean))
         
-    return "; ".join(addresses)
+    return "; ".join(addresses), tuple(pairs)
 
-def parse_sender(header_value):
+def decode_address_list(header_value):
+    """
+    Decode a To/Cc header: ("Name <a@b>; ...", ((name, email), ...)), with
+    duplicate addresses removed and names RFC 2047-decoded. Cached on the
+    raw header value.
+    """
     if not header_value:
-        return "", ""
-    
+        return "", ()
+    return header_cache.get("addresses", str(header_value), _decode_address_list)
+
+def normalize_addresses(header_value):
+    return decode_address_list(header_value)[0]
+
+def _parse_sender(raw_value):
     # Use getaddresses which is more robust for headers than parseaddr
     # It handles comma-separated lists (we take the first one)
-    pairs = getaddresses([str(header_value)])
+    pairs = getaddresses([raw_value])
     if pairs:
         name, email = pairs[0]
         decoded_name = decode_mime_header(name).strip()
-        return decoded_name, email.strip()
+        return intern_address(decoded_name, email.strip())
     return "", ""
 
+def parse_sender(header_value):
+    if not header_value:
+        return "", ""
+    return header_cache.get("sender", str(header_value), _parse_sender)
+
+def _decode_labels(raw_value):
+    decoded = decode_mime_header(raw_value)
+    return tuple(sys.intern(l.strip()) for l in decoded.split(',') if l.strip())
+
+def decode_labels(header_value):
+    """Labels of one X-Gmail-Labels header (cached: a mailbox only has a few distinct label sets)."""
+    if not header_value:
+        return ()
+    return header_cache.get("labels", str(header_value), _decode_labels)
+
 def format_sender_display(sender_name, sender_email):
     if sender_email:
         return formataddr((sender_name, sender_email))
     return sender_name
 
-def mbox_to_pst(mbox_path, pst_path, folder_name="Gmail Archive", resume=True, limit=None):
-    if not os.path.exists(mbox_path):
-        logging.error(f"MBOX file not found at {mbox_path}")
-        return
+class PreparedMessage:
+    """
+    A message decoded from its raw MIME form and ready to be written to Outlook:
+    decoded headers, bodies, attachment payloads and categories.
 
-    pst_abs_path = os.path.abspath(pst_path)
+    Built by prepare_message() without any COM call, so it can be produced in
+    a worker process (it is picklable) and consumed on the Outlook thread by
+    write_prepared_message().
+    """
+    __slots__ = ('index', 'position', 'message_id', 'subject', 'sender_header', 'sender_name', 'sender_email',
+                 'to', 'recipients', 'date', 'date_str', 'references', 'in_reply_to', 'categories',
+                 'body_html', 'body_text', 'attachments', 'warnings', 'problems')
+
+    def __init__(self, index=0, position=0):
+        self.index = index
+        self.position = position  # file offset just after the message
+        self.message_id = ""
+        self.subject = ""
+        self.sender_header = ""
+        self.sender_name = ""
+        self.sender_email = ""
+        self.to = ""
+        self.recipients = ()   # ((name, email), ...) of the To header
+        self.date = None
+        self.date_str = ""
+        self.references = ""
+        self.in_reply_to = ""
+        self.categories = []
+        self.body_html = ""
+        self.body_text = ""
+        self.attachments = []  # (filename, payload bytes, content_id, content_type)
+        self.warnings = []     # messages to log on the writer side
+        self.problems = []     # (error_type, error_detail) for log_problem_message()
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def decode_attachment_payload(part):
+    """Robust payload extraction with fallback for non-standard encodings."""
+    payload = part.get_payload(decode=True)
+    
+    if payload is None:
+        # Fallback: manual decoding for non-standard encodings
+        raw_payload = part.get_payload(decode=False)
+        if isinstance(raw_payload, list):
+            # Nested message (message/rfc822, e.g. a forwarded email): attach it whole as an .eml
+            return raw_payload[0].as_bytes() if raw_payload else None
+        transfer_encoding = (part.get('Content-Transfer-Encoding') or '').lower().strip()
+        
+        if raw_payload:
+            if transfer_encoding == 'base64':
+                import base64
+                try:
+                    # Handle string or bytes
+                    if isinstance(raw_payload, str):
+                        raw_payload = raw_payload.encode('ascii', errors='ignore')
+                    payload = base64.b64decode(raw_payload)
+                except Exception as b64_err:
+                    logging.debug(f"Base64 decode failed: {b64_err}")
+            elif transfer_encoding == 'quoted-printable':
+                import quopri
+                try:
+                    if isinstance(raw_payload, str):
+                        raw_payload = raw_payload.encode('ascii', errors='ignore')
+                    payload = quopri.decodestring(raw_payload)
+                except Exception as qp_err:
+                    logging.debug(f"Quoted-printable decode failed: {qp_err}")
+            elif transfer_encoding in ('7bit', '8bit', 'binary', ''):
+                # No encoding, use as-is
+                if isinstance(raw_payload, str):
+                    payload = raw_payload.encode('utf-8', errors='replace')
+                else:
+                    payload = raw_payload
+    return payload
+
+
+def prepare_message(message, index=0, position=0):
+    """
+    Decode everything Outlook needs from an email.message.Message.
+    
+    Pure CPU work (header decoding, address normalization, date parsing,
+    MIME walk, base64/quoted-printable decoding, label parsing): no COM call.
+    """
+    prepared = PreparedMessage(index, position)
+
+    with profiler.stage("decode.headers"):
+        message_id = message.get('Message-ID', '') or message.get('Message-Id', '')
+        prepared.message_id = str(message_id).strip() if message_id else ""
+
+        # Extract headers
+        prepared.subject = decode_mime_header(message['subject']) or "(No Subject)"
+        prepared.sender_header = message['from'] or ""
+
+    with profiler.stage("decode.addresses"):
+        prepared.sender_name, prepared.sender_email = parse_sender(prepared.sender_header)
+        prepared.to, prepared.recipients = decode_address_list(message['to'] or "")
+
+    with profiler.stage("decode.headers"):
+        # Date parsing
+        prepared.date_str = str(message['date']) if message['date'] else ""
+        if message['date']:
+            try:
+                prepared.date = parsedate_to_datetime(message['date'])
+            except:
+                pass
+
+        # Threading headers for conversation grouping
+        prepared.references = message.get('References', '') or ''
+        prepared.in_reply_to = message.get('In-Reply-To', '') or ''
+
+        # X-Gmail-Labels
+        labels_headers = message.get_all('X-Gmail-Labels', [])
+        categories = []
+        
+        for distinct_header in labels_headers:
+            categories.extend(decode_labels(distinct_header))
+        
+        prepared.categories = list(set(categories))
+
+    # Corps et Pièces jointes
+    if message.is_multipart():
+        for part in message_parts(message):
+            if part.get_content_maintype() == 'multipart':
+                continue
+
+            content_type = part.get_content_type()
+            content_disposition = str(part.get("Content-Disposition", ""))
+            filename = part.get_filename()
+            content_id = part.get('Content-ID')
+            
+            is_attachment = False
+            
+            if "attachment" in content_disposition:
+                is_attachment = True
+            elif filename:
+                is_attachment = True
+            elif content_type not in ("text/plain", "text/html"):
+                is_attachment = True
+            
+            # Handle Body
+            if not is_attachment and content_type in ("text/plain", "text/html"):
+                try:
+                    with profiler.stage("decode.body"):
+                        payload = part.get_payload(decode=True)
+                        charset = part.get_content_charset() or 'utf-8'
+                        decoded = payload.decode(charset, errors='replace')
+                    if content_type == "text/html":
+                        prepared.body_html += decoded
+                    else:
+                        prepared.body_text += decoded
+                except: pass
+            
+            # Handle Attachment/Inline
+            else:
+                if filename:
+                    filename = decode_mime_header(filename)
+                else:
+                    ext = mimetypes.guess_extension(content_type) or ".dat"
+                    filename = f"attachment_{os.urandom(4).hex()}{ext}"
+                
+                # Sanitize filename for filesystem
+                filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
+                    
+                try:
+                    with profiler.stage("decode.attachment"):
+                        payload = decode_attachment_payload(part)
+                    if payload:
+                        prepared.attachments.append((filename, payload, str(content_id) if content_id else None, content_type))
+                    else:
+                        transfer_enc = part.get('Content-Transfer-Encoding', 'none')
+                        prepared.warnings.append(f"No payload extracted for attachment: {filename} "
+                                                 f"(Content-Type: {content_type}, Transfer-Encoding: {transfer_enc})")
+                except Exception as att_err:
+                    transfer_enc = part.get('Content-Transfer-Encoding', 'none')
+                    prepared.warnings.append(f"Attachment error [{filename}]: {att_err} "
+                                             f"(Content-Type: {content_type}, Transfer-Encoding: {transfer_enc})")
+                    prepared.problems.append(("attachment_error", f"{filename}: {att_err}"))
+
+    else:
+        try:
+            with profiler.stage("decode.body"):
+                payload = message.get_payload(decode=True)
+                charset = message.get_content_charset() or 'utf-8'
+                content = payload.decode(charset, errors='replace')
+            if message.get_content_type() == "text/html":
+                prepared.body_html = content
+            else:
+                prepared.body_text = content
+        except: pass
+
+    return prepared
+
+
+def log_prepared_issues(prepared):
+    """Log the warnings and problems collected while decoding a message."""
+    for warning in prepared.warnings:
+        logging.warning(warning)
+    for error_type, error_detail in prepared.problems:
+        log_problem_message(prepared.index, prepared.subject, prepared.sender_header, prepared.date_str,
+                            error_type, error_detail)
+
+
+class AttachmentStaging:
+    """
+    Reusable staging area for Attachments.Add(), which only accepts a file path.
+    
+    Payloads are written straight from memory into short-lived files, without
+    flush()/fsync(): Outlook reads them back immediately, from the OS cache
+    (on Windows they are opened with O_SHORT_LIVED so they can stay in RAM).
+    Each attachment slot of a message has its own subfolder, so the staged
+    file keeps the original file name, and files are deleted once added.
+    """
+
+    _FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0) | getattr(os, 'O_SHORT_LIVED', 0)
+
+    def __init__(self, base_dir=None):
+        self._temp_dir = tempfile.TemporaryDirectory(prefix="mbox_attachments_", dir=base_dir)
+        self.path = self._temp_dir.name
+        self._slots = set()
+
+    def _slot_dir(self, slot):
+        slot_dir = os.path.join(self.path, str(slot))
+        if slot not in self._slots:
+            os.makedirs(slot_dir, exist_ok=True)
+            self._slots.add(slot)
+        return slot_dir
+
+    def _write(self, path, payload):
+        fd = os.open(path, self._FLAGS, 0o600)
+        written = 0
+        view = memoryview(payload)
+        try:
+            while written < len(view):
+                count = os.write(fd, view[written:])
+                if not count:
+                    break
+                written += count
+        finally:
+            os.close(fd)
+        return written
+
+    def stage(self, slot, filename, payload):
+        """Write payload to a staged file. Returns (path, bytes written)."""
+        slot_dir = self._slot_dir(slot)
+        path = os.path.join(slot_dir, filename)
+        try:
+            return path, self._write(path, payload)
+        except OSError:
+            # Name rejected by the file system (too long, reserved...): keep the extension only
+            path = os.path.join(slot_dir, f"attachment{os.path.splitext(filename)[1][:16]}")
+            return path, self._write(path, payload)
+
+    def release(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup(self):
+        self._temp_dir.cleanup()
+
+
+def fill_mail_item(mail, prepared, staging):
+    """
+    Copy a PreparedMessage into a new Outlook item: headers, categories,
+    attachments, body and MAPI properties. Must run before the item's first
+    Save() (the Draft status can only be cleared before it).
+    """
+    # Application des propriétés de base
+    with profiler.stage("com.headers"):
+        mail.Subject = prepared.subject
+        mail.SentOnBehalfOfName = format_sender_display(prepared.sender_name, prepared.sender_email)
+        mail.To = prepared.to
+
+        if prepared.categories:
+            mail.Categories = "; ".join(prepared.categories)
+
+    for slot, (filename, payload, content_id, content_type) in enumerate(prepared.attachments):
+        try:
+            if not payload:
+                logging.warning(f"Empty attachment skipped: {filename}")
+                continue
+
+            # Attachments.Add() only takes a path: stage the payload (no fsync),
+            # checking the byte count in memory instead of stat'ing the file
+            with profiler.stage("attachment.stage"):
+                temp_path, written_size = staging.stage(slot, filename, payload)
+            expected_size = len(payload)
+            if written_size != expected_size:
+                logging.warning(f"Size mismatch for {filename}: expected {expected_size}, got {written_size}")
+
+            try:
+                with profiler.stage("com.attachments_add"):
+                    attachment = mail.Attachments.Add(temp_path, 1, 1, filename)
+            finally:
+                staging.release(temp_path)
+
+            if content_id:
+                # Attachment properties live on the attachment object: one batch (round trip) each
+                cid_clean = content_id.strip('<>')
+                attachment_batch = PropertyBatch()
+                attachment_batch.set("http://schemas.microsoft.com/mapi/proptag/0x3712001F", cid_clean) # PR_ATTACH_CONTENT_ID
+                try:
+                    with profiler.stage("com.properties"):
+                        attachment_batch.apply(attachment.PropertyAccessor)
+                except: pass
+        except Exception as att_err:
+            logging.warning(f"Attachment error [{filename}]: {att_err}")
+            logging.debug(f"  Content-Type: {content_type}")
+            # Log for manual review
+            log_problem_message(prepared.index, prepared.subject, prepared.sender_header, prepared.date_str,
+                                "attachment_error", f"{filename}: {att_err}")
+
+    with profiler.stage("com.body"):
+        if prepared.body_html:
+            mail.HTMLBody = prepared.body_html
+        elif prepared.body_text:
+            mail.Body = prepared.body_text
+    
+    with profiler.stage("com.headers"):
+        mail.MessageClass = "IPM.Note"
+        try:
+            mail.UnRead = False
+        except Exception:
+            pass
+    
+    # Set MAPI Properties BEFORE Save (including threading headers)
+    with profiler.stage("com.properties"):
+        set_item_properties(mail, prepared.date, sender_name=prepared.sender_name, sender_email=prepared.sender_email,
+                            references=prepared.references, in_reply_to=prepared.in_reply_to,
+                            message_id=prepared.message_id)
+
+
+def write_prepared_message(prepared, temp_folder, target_folder, staging):
+    """
+    Create the Outlook item for a PreparedMessage (COM thread only).
     
-    # Initialize Outlook
+    The item is created in the transit folder, its MAPI properties are set
+    before the first Save() to clear the Draft status, then it is moved to
+    the target folder.
+    """
+    log_prepared_issues(prepared)
+
+    mail = None
     try:
-        outlook = win32com.client.Dispatch("Outlook.Application")
-        namespace = outlook.GetNamespace("MAPI")
-    except Exception as e:
-        logging.error(f"Error connecting to Outlook: {e}. Ensure Outlook is installed.")
+        # Création du message dans le dossier de transit
+        with profiler.stage("com.items_add"):
+            mail = temp_folder.Items.Add(0) # 0 = olMailItem
+        
+        fill_mail_item(mail, prepared, staging)
+
+        # Save & Move
+        with profiler.stage("com.save"):
+            mail.Save()
+        if temp_folder != target_folder:
+            with profiler.stage("com.move"):
+                mail.Move(target_folder)
+    finally:
+        # Explicitly release the COM object
+        mail = None
+
+
+def _init_prepare_worker():
+    """Worker processes ignore Ctrl+C: the main process handles the shutdown."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    profiler.enabled = False  # a forked copy would measure into a profile nobody writes
+
+def _prepare_raw_message(task):
+    """(PreparedMessage, CPU seconds spent parsing and decoding it) in a worker process."""
+    index, position, raw = task
+    cpu_started = time.process_time()
+    prepared = prepare_message(message_from_bytes(raw), index, position)
+    return prepared, time.process_time() - cpu_started
+
+
+# Placeholders yielded for a message skipped on its header data (never read nor parsed):
+# a duplicate, or a message excluded by the --after/--labels/--from... filters
+SKIPPED = object()
+FILTERED = object()
+AHEAD_WINDOW = 1024  # Message-ID hashes remembered while their messages are decoded ahead of the writer
+
+
+class HeaderFastPath:
+    """
+    Skip decisions taken on the header data the MBOX index already holds
+    (Message-ID hash, Date/From/Subject/labels summary: only the header block
+    of each message was parsed to build it), before the message is read and
+    its MIME tree built. A message excluded by the MessageFilter, already in
+    the dedup store, or a copy of a message just sent to be decoded, is
+    never parsed.
+
+    The writer still checks the dedup store: the fast path only saves work.
+    It also measures the parse cost of the messages it lets through, to
+    estimate the CPU time the skipped ones would have cost.
+    """
+
+    def __init__(self, dedup_store, message_filter=None):
+        self.dedup_store = dedup_store
+        self.message_filter = message_filter or None  # an empty filter excludes nothing
+        self.mbox_index = None
+        self._ahead = {}          # hashes sent to be decoded, oldest first (bounded)
+        self.skipped = 0          # duplicates
+        self.skipped_bytes = 0
+        self.filtered = 0
+        self.filtered_bytes = 0
+        self.parsed = 0
+        self.parsed_bytes = 0
+        self.parse_cpu = 0.0
+
+    def start(self, mbox_index):
+        self.mbox_index = mbox_index
+        self._ahead.clear()
+
+    def skip(self, i):
+        """
+        FILTERED or SKIPPED if message i need not be parsed, None otherwise
+        (called before the message is read).
+        """
+        start, stop = self.mbox_index.span(i)
+        if self.message_filter is not None and self.message_filter.exclude(self.mbox_index.summaries[i], stop - start):
+            self.filtered += 1
+            self.filtered_bytes += stop - start
+            return FILTERED
+        msg_hash = self.mbox_index.hashes[i]
+        if not msg_hash:
+            return None
+        if msg_hash in self.dedup_store or msg_hash in self._ahead:
+            self.skipped += 1
+            self.skipped_bytes += stop - start
+            return SKIPPED
+        # With worker processes the writer lags behind: remember the hashes in flight
+        self._ahead[msg_hash] = None
+        if len(self._ahead) > AHEAD_WINDOW:
+            del self._ahead[next(iter(self._ahead))]
+        return None
+
+    def keep(self, i):
+        """False if the filter excludes message i (label pre-scan: no category for excluded messages)."""
+        if self.message_filter is None:
+            return True
+        start, stop = self.mbox_index.span(i)
+        return self.message_filter.reason(self.mbox_index.summaries[i], stop - start) is None
+
+    def record_parse(self, i, cpu_seconds):
+        start, stop = self.mbox_index.span(i)
+        self.parsed += 1
+        self.parsed_bytes += stop - start
+        self.parse_cpu += cpu_seconds
+
+    def prepare_skipped(self, i):
+        """
+        Read and decode a message skipped as a copy of one that was then never
+        written (decoding error), on the calling thread.
+        """
+        start, stop = self.mbox_index.span(i)
+        self.skipped -= 1
+        self.skipped_bytes -= stop - start
+        cpu_started = time.process_time()
+        with MboxScanner(self.mbox_index.mbox_path) as scanner:
+            prepared = prepare_message(scanner.message(start, stop), i, stop)
+        self.record_parse(i, time.process_time() - cpu_started)
+        return prepared
+
+    def cpu_saved(self):
+        """Estimated parse CPU time of the skipped messages (measured cost per byte of the parsed ones)."""
+        if not self.parsed_bytes:
+            return 0.0
+        return (self.skipped_bytes + self.filtered_bytes) * self.parse_cpu / self.parsed_bytes
+
+    def to_dict(self):
+        """Figures for the --profile JSON."""
+        return {"skipped": self.skipped, "skipped_bytes": self.skipped_bytes, "filtered": self.filtered,
+                "filtered_bytes": self.filtered_bytes, "parsed": self.parsed,
+                "parsed_bytes": self.parsed_bytes, "parse_cpu_s": round(self.parse_cpu, 3),
+                "cpu_saved_s": round(self.cpu_saved(), 3)}
+
+    def summary(self):
+        seen = self.skipped + self.filtered + self.parsed
+        rate = 100.0 * (self.skipped + self.filtered) / seen if seen else 0.0
+        filtered = f" and {self.filtered} filtered" if self.filtered else ""
+        return (f"{self.skipped} duplicates{filtered} of {seen} messages ({rate:.1f}%) skipped on their headers, "
+                f"{(self.skipped_bytes + self.filtered_bytes) / 2**20:.1f} MB never parsed; "
+                f"estimated CPU saved {self.cpu_saved():.1f}s "
+                f"(parse cost {self.parse_cpu:.1f}s for {self.parsed_bytes / 2**20:.1f} MB)")
+
+
+def iter_prepared_messages(mbox_index, start_at, stop_at, workers=0, queue_size=64, fast_path=None, pool=None):
+    """
+    Yield (message_index, PreparedMessage or Exception) in input order.
+    
+    workers == 0: messages are decoded on the calling thread.
+    workers > 0: a feeder thread reads raw messages and submits them to a pool
+    of worker processes; results come back through a bounded queue (at most
+    queue_size messages in flight), so the single Outlook writer consumes them
+    in MBOX order while every core decodes ahead of it. pool is an existing
+    multiprocessing.Pool to submit to (left open afterwards); without one, a
+    pool of `workers` processes is started for this MBOX only.
+
+    With a HeaderFastPath, the messages it skips are yielded as SKIPPED
+    (duplicates) or FILTERED without being read or parsed.
+    """
+    if workers <= 0:
+        with MboxScanner(mbox_index.mbox_path) as scanner:
+            for i in range(start_at, stop_at):
+                decision = fast_path.skip(i) if fast_path is not None else None
+                if decision is not None:
+                    yield i, decision
+                    continue
+                start, stop = mbox_index.span(i)
+                try:
+                    cpu_started = time.process_time()
+                    # MBOX framing + MIME parse (identical to mailbox.mbox)
+                    with profiler.stage("mbox.parse"):
+                        message = scanner.message(start, stop)
+                    prepared = prepare_message(message, i, stop)
+                    if fast_path is not None:
+                        fast_path.record_parse(i, time.process_time() - cpu_started)
+                except Exception as e:
+                    prepared = e
+                yield i, prepared
         return
 
+    results = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    own_pool = pool is None
+    if own_pool:
+        pool = multiprocessing.Pool(workers, initializer=_init_prepare_worker)
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feeder():
+        try:
+            with MboxScanner(mbox_index.mbox_path) as scanner:
+                for i in range(start_at, stop_at):
+                    decision = fast_path.skip(i) if fast_path is not None else None
+                    if decision is not None:
+                        if not put((i, decision)):
+                            break
+                        continue
+                    start, stop = mbox_index.span(i)
+                    task = (i, stop, scanner.message_bytes(start, stop))
+                    if not put((i, pool.apply_async(_prepare_raw_message, (task,)))):
+                        break
+        except Exception as e:
+            put((None, e))
+        finally:
+            put(None)
+
+    feeder_thread = threading.Thread(target=feeder, name="mbox-feeder", daemon=True)
+    feeder_thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            i, pending = item
+            if i is None:
+                raise pending  # feeder failure (e.g. MBOX unreadable)
+            if pending is SKIPPED or pending is FILTERED:
+                yield i, pending
+                continue
+            try:
+                # Parse/decode stages run in the workers: only the writer's wait is measured here
+                with profiler.stage("decode.wait"):
+                    prepared, cpu_seconds = pending.get()
+                if fast_path is not None:
+                    fast_path.record_parse(i, cpu_seconds)
+            except Exception as e:
+                prepared = e
+            yield i, prepared
+    finally:
+        stop_event.set()
+        if own_pool:
+            pool.terminate()
+            pool.join()
+        feeder_thread.join(timeout=5)
+
+
+def find_or_add_folder(parent, name):
+    """Subfolder of parent with this name, created if missing."""
+    for folder in parent.Folders:
+        if folder.Name == name:
+            return folder
+    return parent.Folders.Add(name)
+
+
+def open_outlook_target(outlook, pst_path, folder_name):
+    """
+    Open (or create) the PST store and its target and transit folders.
+    
+    Returns (namespace, target_folder, temp_folder), or None on error (logged).
+    """
+    pst_abs_path = os.path.abspath(pst_path)
+    namespace = outlook.GetNamespace("MAPI")
+
     # Create/Open PST
     logging.info(f"Opening/Creating PST: {pst_abs_path}")
 
@@ -440,49 +1044,20 @@ def mbox_to_pst(mbox_path, pst_path, folder_name="Gmail Archive", resume=True, l
                     
         if not pst_store:
             logging.error("Could not find or create the PST store.")
-            return
+            return None
             
         root_folder = pst_store.GetRootFolder()
 
     except Exception as e:
         logging.error(f"Error accessing PST: {e}")
-        return
+        return None
 
     # Get target folder
     try:
-        target_folder = None
-        for folder in root_folder.Folders:
-            if folder.Name == folder_name:
-                target_folder = folder
-                break
-        if not target_folder:
-            target_folder = root_folder.Folders.Add(folder_name)
+        target_folder = find_or_add_folder(root_folder, folder_name)
     except Exception as e:
         logging.error(f"Error creating/accessing folder '{folder_name}': {e}")
-        return
-
-    # For clearing the 'Draft' status, we will create items in a temporary storage (like default Inbox)
-    # and then move them to the target PST folder. This is a common FIX for the Unsent flag.
-    # We'll use the default folder for temporary creation.
-    try:
-        temp_folder = namespace.GetDefaultFolder(6) # 6 = olFolderInbox
-    except:
-        temp_folder = target_folder # Fallback
-
-    # Master Category List Caching
-    known_master_categories = set()
-    try:
-        for cat in namespace.Categories:
-            known_master_categories.add(cat.Name)
-    except: pass
-    
-    def ensure_categories_exist(cat_list):
-        for c in cat_list:
-            if c and c not in known_master_categories:
-                try:
-                    namespace.Categories.Add(c)
-                    known_master_categories.add(c)
-                except: pass
+        return None
 
     # Create a transit folder WITHIN the PST to avoid cross-store resource issues
     # and still fix the 'Draft' status via the Move() method.
@@ -499,303 +1074,976 @@ def mbox_to_pst(mbox_path, pst_path, folder_name="Gmail Archive", resume=True, l
         logging.warning(f"Could not create temp folder in PST, using target: {e}")
         temp_folder = target_folder
 
-    # Initialize state variables
-    attachments_temp_dir = tempfile.TemporaryDirectory()
-    
-    start_at = 0
-    if resume:
-        start_at = load_state()
-        if start_at > 0:
-            logging.info(f"Resuming from message {start_at}...")
+    return namespace, target_folder, temp_folder
 
-    count = 0
-    errors = 0
-    duplicates_skipped = 0
-    start_time = time.time()
-    
-    # Effective limit calculation
-    effective_limit = (start_at + limit) if limit else None
 
-    # Deduplication: track Message-IDs to avoid importing duplicates
-    seen_message_ids = set()
+def build_eml(prepared):
+    """Rebuild an RFC 822 message (bytes) from a PreparedMessage, for OpenSharedItem()."""
+    msg = EmailMessage()
+    for header, value in (("Subject", prepared.subject),
+                          ("From", format_sender_display(prepared.sender_name, prepared.sender_email)),
+                          ("To", prepared.to.replace(";", ",")),
+                          ("Date", prepared.date_str),
+                          ("Message-ID", prepared.message_id),
+                          ("References", prepared.references),
+                          ("In-Reply-To", prepared.in_reply_to)):
+        if value:
+            msg[header] = " ".join(str(value).split())
+    msg.set_content(prepared.body_text or "")
+    if prepared.body_html:
+        msg.add_alternative(prepared.body_html, subtype="html")
+    for filename, payload, content_id, content_type in prepared.attachments:
+        if not payload:
+            continue
+        maintype, _, subtype = (content_type or "application/octet-stream").partition("/")
+        msg.add_attachment(payload, maintype=maintype, subtype=subtype or "octet-stream", filename=filename)
+        if content_id:
+            msg.get_payload()[-1]["Content-ID"] = content_id
+    return msg.as_bytes()
 
-    # Setup progress bar
-    file_size = os.path.getsize(mbox_path)
-    file_size_mb = file_size / (1024 * 1024)
-    
-    progress_bar = None
-    last_progress_mb = 0
-    progress_bar_created = False
-    
-    # Show info about skipping if resuming
-    if start_at > 0:
-        logging.info(f"Seeking to message {start_at}...")
-    
-    # Use standard mailbox library for reliable MBOX parsing
-    # (Custom streaming parser had bugs that truncated some messages)
-    messages_processed = 0
-    logging.info("Opening MBOX file with standard parser...")
-    mbox = mailbox.mbox(mbox_path)
-    total_messages = len(mbox) if hasattr(mbox, '__len__') else None
-    
-    if total_messages:
-        logging.info(f"Found {total_messages} messages in MBOX")
-    
-    for i, message in enumerate(mbox):
-        # Skip to resume point
-        if i < start_at:
-            continue
-        
-        # Create progress bar only when processing actually starts
-        if TQDM_AVAILABLE and not progress_bar_created:
-            if limit:
-                progress_bar = tqdm(total=limit, desc="Processing", unit="msg",
-                                   file=sys.stderr, dynamic_ncols=True, leave=False,
-                                   bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} msgs [{elapsed}<{remaining}]')
-            elif total_messages:
-                progress_bar = tqdm(total=total_messages - start_at, desc="Processing", unit="msg",
-                                   file=sys.stderr, dynamic_ncols=True, leave=False,
-                                   bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} msgs [{elapsed}<{remaining}]')
-            else:
-                progress_bar = tqdm(total=int(file_size_mb), desc="Processing", unit="MB",
-                                   file=sys.stderr, dynamic_ncols=True, leave=False,
-                                   bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}MB [{elapsed}<{remaining}]')
-            progress_bar_created = True
-        
-            
 
-        if effective_limit and i >= effective_limit:
-            logging.info(f"Session limit of {limit} messages reached.")
-            break
-        
-        # Check for graceful shutdown request (Ctrl+C)
-        if _shutdown_requested:
-            logging.info(f"Shutdown requested. Saving state at message {count}...")
-            save_state(count)
-            break
+class SaveMoveStrategy:
+    """
+    Create the item in the transit folder, Save() it, then Move() it to the
+    target folder: two store writes per item, but the Move() reliably clears
+    the Draft status.
+    """
+    name = "save-move"
+
+    def __init__(self, namespace, target_folder, temp_folder, staging):
+        self.namespace = namespace
+        self.target_folder = target_folder
+        self.temp_folder = temp_folder
+        self.staging = staging
+
+    def write(self, prepared, folder=None):
+        """Write one message into folder (default: the target folder)."""
+        write_prepared_message(prepared, self.temp_folder, folder or self.target_folder, self.staging)
+
+    def flush(self):
+        """Items are in the target folder as soon as write() returns."""
+
+    def close(self):
+        self.flush()
 
+
+class DirectStrategy(SaveMoveStrategy):
+    """
+    Create the item directly in the target folder with its flags set before
+    the first Save(): one store write per item, no transit folder.
+    """
+    name = "direct"
+
+    def write(self, prepared, folder=None):
+        folder = folder or self.target_folder
+        write_prepared_message(prepared, folder, folder, self.staging)
+
+
+class BatchedMoveStrategy(SaveMoveStrategy):
+    """
+    Create and Save() items in the transit folder, then move the transit
+    folder contents to the target folder every move_batch items (and at
+    every checkpoint), so the target folder is written in bursts. With date
+    subfolders, a message bound for another folder than the pending ones
+    moves them first: a batch always has a single destination.
+    """
+    name = "batch-move"
+
+    def __init__(self, namespace, target_folder, temp_folder, staging, move_batch=50):
+        super().__init__(namespace, target_folder, temp_folder, staging)
+        self.move_batch = move_batch
+        self.pending = 0
+        self.destination = target_folder
+
+    def write(self, prepared, folder=None):
+        folder = folder or self.target_folder
+        if self.temp_folder == self.target_folder:
+            # No transit folder: nothing to batch
+            write_prepared_message(prepared, folder, folder, self.staging)
+            return
+        if self.pending and folder is not self.destination:
+            self.flush()
+        self.destination = folder
+        write_prepared_message(prepared, self.temp_folder, self.temp_folder, self.staging)
+        self.pending += 1
+        if self.pending >= self.move_batch:
+            self.flush()
+
+    def flush(self):
+        if self.temp_folder == self.target_folder:
+            return
+        items = self.temp_folder.Items
+        # The collection is live: Item(1) is the next item once the previous one has moved
+        while items.Count > 0:
+            with profiler.stage("com.move"):
+                items.Item(1).Move(self.destination)
+        self.pending = 0
+
+
+class EmlImportStrategy(SaveMoveStrategy):
+    """
+    Rebuild the message as an .eml file and open it with
+    Namespace.OpenSharedItem(), as explored in debug_eml_import.py: Outlook
+    parses the MIME itself and the item is a received (non-draft) message.
+    Categories and MAPI properties are then set and the item is moved to the
+    target folder.
+    """
+    name = "eml"
+
+    def write(self, prepared, folder=None):
+        log_prepared_issues(prepared)
+        with profiler.stage("eml.build"):
+            eml_path, _ = self.staging.stage("eml", f"message_{uuid.uuid4().hex[:8]}.eml", build_eml(prepared))
         mail = None
         try:
-            # Check for duplicates based on Message-ID
-            message_id = message.get('Message-ID', '') or message.get('Message-Id', '')
-            if message_id:
-                message_id = message_id.strip()
-                if message_id in seen_message_ids:
-                    duplicates_skipped += 1
-                    count = i + 1  # Update count for state saving
-                    continue  # Skip this duplicate
-                seen_message_ids.add(message_id)
-            
-            # Extract headers
-            subject = decode_mime_header(message['subject']) or "(No Subject)"
-            sender_header = message['from'] or ""
-            to_header = message['to'] or ""
-            sender_name, sender_email = parse_sender(sender_header)
-            to = normalize_addresses(to_header)
-
-            
-            # Date parsing
-            date_val = None
-            if message['date']:
+            with profiler.stage("com.open_shared_item"):
+                mail = self.namespace.OpenSharedItem(eml_path)
+            with profiler.stage("com.headers"):
+                if prepared.categories:
+                    mail.Categories = "; ".join(prepared.categories)
                 try:
-                    date_val = parsedate_to_datetime(message['date'])
-                except:
+                    mail.UnRead = False
+                except Exception:
                     pass
+            with profiler.stage("com.properties"):
+                set_item_properties(mail, prepared.date, sender_name=prepared.sender_name,
+                                    sender_email=prepared.sender_email,
+                                    references=prepared.references, in_reply_to=prepared.in_reply_to,
+                                    message_id=prepared.message_id)
+            with profiler.stage("com.save"):
+                mail.Save()
+            with profiler.stage("com.move"):
+                mail.Move(folder or self.target_folder)
+        finally:
+            mail = None
+            self.staging.release(eml_path)
 
-            # Threading headers for conversation grouping
-            references = message.get('References', '') or ''
-            in_reply_to = message.get('In-Reply-To', '') or ''
 
-            # X-Gmail-Labels
-            labels_headers = message.get_all('X-Gmail-Labels', [])
-            categories = []
-            
-            for distinct_header in labels_headers:
-                if distinct_header:
-                    decoded = decode_mime_header(distinct_header)
-                    parts = [l.strip() for l in decoded.split(',') if l.strip()]
-                    categories.extend(parts)
-            
-            categories = list(set(categories))
-            
-            if categories:
-                ensure_categories_exist(categories)
+STRATEGIES = {strategy.name: strategy for strategy in (SaveMoveStrategy, DirectStrategy, BatchedMoveStrategy,
+                                                        EmlImportStrategy)}
 
-            # Création du message dans le dossier de transit
-            mail = temp_folder.Items.Add(0) # 0 = olMailItem
-            
-            # Application des propriétés de base
-            mail.Subject = subject
-            mail.SentOnBehalfOfName = format_sender_display(sender_name, sender_email)
-            mail.To = to
-
-            if categories:
-                mail.Categories = "; ".join(categories)
-
-            # Corps et Pièces jointes
-            body_html = ""
-            body_text = ""
-            if message.is_multipart():
-                for part in message.walk():
-                    if part.get_content_maintype() == 'multipart':
-                        continue
 
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition", ""))
-                    filename = part.get_filename()
-                    content_id = part.get('Content-ID')
-                    
-                    is_attachment = False
-                    
-                    if "attachment" in content_disposition:
-                        is_attachment = True
-                    elif filename:
-                        is_attachment = True
-                    elif content_type not in ("text/plain", "text/html"):
-                        is_attachment = True
-                    
-                    # Handle Body
-                    if not is_attachment and content_type in ("text/plain", "text/html"):
-                        try:
-                            payload = part.get_payload(decode=True)
-                            charset = part.get_content_charset() or 'utf-8'
-                            decoded = payload.decode(charset, errors='replace')
-                            if content_type == "text/html":
-                                body_html += decoded
-                            else:
-                                body_text += decoded
-                        except: pass
-                    
-                    # Handle Attachment/Inline
-                    else:
-                        if filename:
-                            filename = decode_mime_header(filename)
-                        else:
-                            ext = mimetypes.guess_extension(content_type) or ".dat"
-                            filename = f"attachment_{os.urandom(4).hex()}{ext}"
-                        
-                        # Sanitize filename for filesystem
-                        filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-                            
-                        try:
-                            # Robust payload extraction with fallback
-                            payload = part.get_payload(decode=True)
-                            
-                            if payload is None:
-                                # Fallback: manual decoding for non-standard encodings
-                                raw_payload = part.get_payload(decode=False)
-                                transfer_encoding = (part.get('Content-Transfer-Encoding') or '').lower().strip()
-                                
-                                if raw_payload:
-                                    if transfer_encoding == 'base64':
-                                        import base64
-                                        try:
-                                            # Handle string or bytes
-                                            if isinstance(raw_payload, str):
-                                                raw_payload = raw_payload.encode('ascii', errors='ignore')
-                                            payload = base64.b64decode(raw_payload)
-                                        except Exception as b64_err:
-                                            logging.debug(f"Base64 decode failed for {filename}: {b64_err}")
-                                    elif transfer_encoding == 'quoted-printable':
-                                        import quopri
-                                        try:
-                                            if isinstance(raw_payload, str):
-                                                raw_payload = raw_payload.encode('ascii', errors='ignore')
-                                            payload = quopri.decodestring(raw_payload)
-                                        except Exception as qp_err:
-                                            logging.debug(f"Quoted-printable decode failed for {filename}: {qp_err}")
-                                    elif transfer_encoding in ('7bit', '8bit', 'binary', ''):
-                                        # No encoding, use as-is
-                                        if isinstance(raw_payload, str):
-                                            payload = raw_payload.encode('utf-8', errors='replace')
-                                        else:
-                                            payload = raw_payload
-                            
-                            if payload:
-                                # Use unique temp filename to avoid conflicts with multiple attachments
-                                import uuid
-                                base_name, ext = os.path.splitext(filename)
-                                unique_filename = f"{base_name}_{uuid.uuid4().hex[:8]}{ext}"
-                                temp_path = os.path.join(attachments_temp_dir.name, unique_filename)
-                                
-                                # Write with explicit flush and close
-                                with open(temp_path, "wb") as f:
-                                    f.write(payload)
-                                    f.flush()
-                                    os.fsync(f.fileno())
-                                
-                                # Verify file integrity
-                                written_size = os.path.getsize(temp_path)
-                                expected_size = len(payload)
-                                if written_size != expected_size:
-                                    logging.warning(f"Size mismatch for {filename}: expected {expected_size}, got {written_size}")
-                                
-                                if written_size == 0:
-                                    logging.warning(f"Empty attachment written: {filename}")
-                                    os.remove(temp_path)
-                                else:
-                                    attachment = mail.Attachments.Add(temp_path, 1, 1, filename)
-                                    
-                                    if content_id:
-                                        cid_clean = content_id.strip('<>')
-                                        try:
-                                            attachment.PropertyAccessor.SetProperty("http://schemas.microsoft.com/mapi/proptag/0x3712001F", cid_clean)
-                                        except: pass
-                                    
-                                    try:
-                                        os.remove(temp_path)
-                                    except OSError:
-                                        pass
-                            else:
-                                logging.warning(f"No payload extracted for attachment: {filename}")
-                                transfer_enc = part.get('Content-Transfer-Encoding', 'none')
-                                logging.debug(f"  Content-Type: {content_type}, Transfer-Encoding: {transfer_enc}")
-                                    
-                        except Exception as att_err:
-                            logging.warning(f"Attachment error [{filename}]: {att_err}")
-                            transfer_enc = part.get('Content-Transfer-Encoding', 'none')
-                            logging.debug(f"  Content-Type: {content_type}, Transfer-Encoding: {transfer_enc}")
-                            # Log for manual review
-                            date_str = str(message['date']) if message['date'] else ""
-                            log_problem_message(i, subject, sender_header, date_str, 
-                                              "attachment_error", f"{filename}: {att_err}")
+class OutlookBackend:
+    """
+    Writes messages through the Outlook object model (COM). How items are
+    created (transit folder + Move, direct, batched moves, EML import) is
+    chosen with strategy, a key of STRATEGIES.
+    """
+    name = "outlook"
+    checkpoint_seconds = 30             # checkpoint at least this often...
+    checkpoint_bytes = 32 * 1024 * 1024  # ...or after this much of the MBOX
+    throttle = True         # pause regularly so Outlook keeps up
+    shard = 0               # single output file (see ShardedBackend)
 
-            else:
+    def __init__(self, pst_path, folder_name, outlook=None, strategy="save-move", move_batch=50, date_folders=None):
+        self.pst_path = os.path.abspath(pst_path)
+        self.folder_name = folder_name
+        self.date_folders = date_folders  # "year" / "month": subfolders of the target folder
+        self.folders = None
+        self.outlook = outlook
+        self.strategy_name = strategy
+        self.move_batch = move_batch
+        self.strategy = None
+        self.namespace = None
+        self.target_folder = None
+        self.temp_folder = None
+        self.known_master_categories = set()
+        self.categories_provisioned = False
+        self.late_categories = 0   # categories the pre-scan missed, added while writing
+        self.staging = None
+
+    def open(self):
+        """Connect to Outlook and open the target folders. Returns False on error (logged)."""
+        if self.outlook is None:
+            if not WIN32_AVAILABLE:
+                logging.error("win32com is not available: Outlook can only be driven on Windows (pip install pywin32). "
+                              "Use --backend pst to write the PST file directly.")
+                return False
+            try:
+                self.outlook = win32com.client.Dispatch("Outlook.Application")
+            except Exception as e:
+                logging.error(f"Error connecting to Outlook: {e}. Ensure Outlook is installed.")
+                return False
+
+        # --profile: count every COM call made through the application object
+        self.outlook = profiler.wrap_com(self.outlook)
+
+        try:
+            target = open_outlook_target(self.outlook, self.pst_path, self.folder_name)
+        except Exception as e:
+            logging.error(f"Error connecting to Outlook: {e}. Ensure Outlook is installed.")
+            return False
+        if target is None:
+            return False
+        self.namespace, self.target_folder, self.temp_folder = target
+        if self.date_folders:
+            self.folders = FolderCache(self.target_folder, find_or_add_folder)
+
+        # Master Category List Caching
+        try:
+            for cat in self.namespace.Categories:
+                self.known_master_categories.add(cat.Name)
+        except: pass
+
+        self.staging = AttachmentStaging()
+        strategy_class = STRATEGIES[self.strategy_name]
+        if strategy_class is BatchedMoveStrategy:
+            self.strategy = strategy_class(self.namespace, self.target_folder, self.temp_folder,
+                                           self.staging, move_batch=self.move_batch)
+        else:
+            self.strategy = strategy_class(self.namespace, self.target_folder, self.temp_folder,
+                                           self.staging)
+        logging.info(f"Item creation strategy: {self.strategy_name}")
+        return True
+
+    def ensure_categories_exist(self, cat_list):
+        for c in cat_list:
+            if c and c not in self.known_master_categories:
                 try:
-                    payload = message.get_payload(decode=True)
-                    charset = message.get_content_charset() or 'utf-8'
-                    content = payload.decode(charset, errors='replace')
-                    if message.get_content_type() == "text/html":
-                        body_html = content
-                    else:
-                        body_text = content
+                    with profiler.stage("com.categories_add"):
+                        self.namespace.Categories.Add(c)
+                    self.known_master_categories.add(c)
+                    if self.categories_provisioned:
+                        self.late_categories += 1
                 except: pass
 
-            if body_html:
-                mail.HTMLBody = body_html
-            elif body_text:
-                mail.Body = body_text
-            
-            mail.MessageClass = "IPM.Note"
+    def provision_categories(self, labels, colors=None):
+        """
+        Create the master category of every label in one batch, before the
+        first item is written, and apply the colours of colors (label ->
+        olCategoryColor) to new and existing categories alike.
+        """
+        with profiler.stage("categories.provision"):
+            created, recolored, failed = provision_master_categories(self.namespace, labels, colors)
+        self.known_master_categories.update(set(labels) - set(failed))
+        self.categories_provisioned = True
+        logging.info(f"Master categories: {created} created, {recolored} recolored, "
+                     f"{len(labels) - created - len(failed)} already present")
+
+    def write(self, prepared):
+        # After provision_categories() every label is already in the cache: no COM call
+        if prepared.categories:
+            self.ensure_categories_exist(prepared.categories)
+        folder = None
+        if self.folders is not None:
+            # Cached after the first message of each year/month: no COM lookup
+            with profiler.stage("com.date_folder"):
+                folder = self.folders.folder(date_folder_path(prepared.date, self.date_folders))
+        self.strategy.write(prepared, folder)
+
+    def categories(self):
+        """Category cache saved with each checkpoint."""
+        return sorted(self.known_master_categories)
+
+    def existing_messages(self):
+        """(Message-ID, subject, date, shard) of the items already below the target folder, from folder tables."""
+        for message_id, subject, date in outlook_messages(self.target_folder):
+            yield message_id, subject, date, self.shard
+
+    def restore_categories(self, names):
+        """Seed the cache from a checkpoint: those categories were already added to the master list."""
+        self.known_master_categories.update(names)
+
+    def route(self, prepared):
+        """Single output: nothing to choose (see ShardedBackend.route)."""
+        return False
+
+    def shards(self):
+        return None
+
+    def restore_shards(self, saved):
+        pass
+
+    def flush(self):
+        """Outlook commits every item on Save(); only deferred moves are pending."""
+        self.strategy.flush()
+
+    def close(self):
+        if self.strategy:
+            self.strategy.close()
+        if self.folders is not None:
+            logging.info(f"Date folders of {self.pst_path}: {self.folders.summary()}")
+        # Cleanup temp folder if empty
+        try:
+            if self.temp_folder != self.target_folder and self.temp_folder.Items.Count == 0:
+                self.temp_folder.Delete()
+        except: pass
+        if self.staging:
+            self.staging.cleanup()
+            self.staging = None
+
+
+class PstFileBackend:
+    """
+    Writes the PST file directly with pst_file.PstWriter: no Outlook, no COM,
+    works on any OS. The file is committed (B-trees and header rewritten) on
+    every flush(), which happens right before each checkpoint is saved,
+    so a resumed run never skips a message that is not in the PST.
+    """
+    name = "pst"
+    # A commit rewrites the folder tables: keep them rarer than Outlook checkpoints
+    checkpoint_seconds = 60
+    checkpoint_bytes = 256 * 1024 * 1024
+    # ...and, as every commit rewrites the tables and B-trees in full, no more
+    # than this share of the run: the next checkpoint waits 1/commit_share
+    # times the last commit (bounded total cost instead of quadratic)
+    commit_share = 0.05
+    throttle = False
+    shard = 0
+
+    def __init__(self, pst_path, folder_name, date_folders=None):
+        self.pst_path = os.path.abspath(pst_path)
+        self.folder_name = folder_name
+        self.date_folders = date_folders
+        self.folders = None
+        self.writer = None
+        self.folder_nid = None
+        self.known_categories = set()
+
+    def open(self):
+        try:
+            self.writer = pst_file.PstWriter(self.pst_path).open()
+            self.folder_nid = self.writer.get_folder([self.folder_name])
+            if self.date_folders:
+                self.folders = FolderCache(self.folder_nid, lambda parent, name: self.writer.get_folder([name], parent))
+        except (OSError, pst_file.PstError) as e:
+            logging.error(f"Error opening PST file {self.pst_path}: {e}")
+            return False
+        logging.info(f"Writing PST file directly: {self.pst_path} ({self.writer.message_count} messages already present)")
+        return True
+
+    def write(self, prepared):
+        log_prepared_issues(prepared)
+        with profiler.stage("pst.properties"):
+            properties, recipients, attachments, named = prepared_to_pst_properties(prepared)
+        folder_nid = self.folder_nid
+        if self.folders is not None:
+            folder_nid = self.folders.folder(date_folder_path(prepared.date, self.date_folders))
+        with profiler.stage("pst.add_message"):
+            self.writer.add_message(folder_nid, properties, recipients, attachments, named)
+        self.known_categories.update(prepared.categories)
+
+    def categories(self):
+        return sorted(self.known_categories)
+
+    def existing_messages(self):
+        """(Message-ID, subject, date, shard) of the messages already below the target folder, from contents tables."""
+        for folder_nid in self.writer.folder_tree(self.folder_nid):
+            for row in self.writer.contents_rows(folder_nid):
+                yield (row.get(pst_file.PR_INTERNET_MESSAGE_ID), row.get(pst_file.PR_SUBJECT),
+                       row.get(pst_file.PR_CLIENT_SUBMIT_TIME), self.shard)
+
+    def restore_categories(self, names):
+        self.known_categories.update(names)
+
+    def provision_categories(self, labels, colors=None):
+        """
+        A PST has no master category list (Outlook keeps it in the mail
+        profile): only the names are recorded, as categories() of the state.
+        """
+        self.known_categories.update(labels)
+        if colors:
+            logging.info("Category colours apply to the Outlook master list: not written with --backend pst")
+
+    def route(self, prepared):
+        return False
+
+    def shards(self):
+        return None
+
+    def restore_shards(self, saved):
+        pass
+
+    def checkpoint_spacing(self):
+        """Seconds to wait after a checkpoint before the next commit (see commit_share)."""
+        return self.writer.last_commit_seconds / self.commit_share if self.writer else 0.0
+
+    def flush(self):
+        with profiler.stage("pst.commit"):
+            self.writer.commit()
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            writer = self.writer
+            logging.info(f"PST commits of {os.path.basename(self.pst_path)}: {writer.commits} in "
+                         f"{writer.commit_seconds:.2f}s (last {writer.last_commit_seconds:.2f}s), "
+                         f"{writer.rows_rewritten} contents rows rewritten for {writer.message_count} messages")
+            self.writer = None
+        if self.folders is not None:
+            logging.info(f"Date folders of {self.pst_path}: {self.folders.summary()}")
+
+
+class ShardedBackend:
+    """
+    Spreads the messages over several PST files ("shards"), each written by
+    its own backend_class instance:
+
+    - mode "size": one shard at a time; once its file reaches max_bytes the
+      next message starts a new one (out_001.pst, out_002.pst...), and the
+      previous one is committed and closed;
+    - mode "year": one shard per year of the message date (out_2019.pst...,
+      out_undated.pst), opened on first use and kept open.
+
+    route() picks the shard of the next message before it is written, so the
+    run can record it in the dedup store; shards() / restore_shards() carry
+    the shard list and the current shard in the checkpoint.
+    """
+
+    def __init__(self, pst_path, backend_class, mode="size", max_bytes=None, **backend_options):
+        self.pst_path = os.path.abspath(pst_path)
+        self.backend_class = backend_class
+        self.backend_options = backend_options
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.name = backend_class.name
+        self.throttle = backend_class.throttle
+        self.checkpoint_seconds = backend_class.checkpoint_seconds
+        self.checkpoint_bytes = backend_class.checkpoint_bytes
+        self.backends = {}        # shard -> open backend
+        self.paths = {}           # shard -> PST file, for every shard written so far
+        self.current = 1 if mode == "size" else None
+        self._categories = set()  # categories known to the shards (closed ones included)
+        self._provisioned = None  # (labels, colors) of the last provision_categories()
+        self._late_categories = 0
+
+    @property
+    def shard(self):
+        return self.current or 0
+
+    def shard_path(self, shard):
+        """PST file of a shard: "out_001.pst" (size), "out_2019.pst" / "out_undated.pst" (year)."""
+        stem, ext = os.path.splitext(self.pst_path)
+        if self.mode == "year":
+            suffix = str(shard) if shard != UNDATED_SHARD else "undated"
+        else:
+            suffix = f"{shard:03d}"
+        return f"{stem}_{suffix}{ext or '.pst'}"
+
+    def _open_shard(self, shard):
+        if self.mode == "size":
+            # One shard at a time: commit and close the full one first
+            for other in list(self.backends):
+                self._close_shard(other)
+        path = self.paths.get(shard) or self.shard_path(shard)
+        backend = self.backend_class(path, **self.backend_options)
+        if not backend.open():
+            raise RuntimeError(f"Could not open PST shard {path}")
+        backend.restore_categories(self._categories)
+        if self._provisioned:
+            backend.provision_categories(*self._provisioned)
+        logging.info(f"PST shard {shard}: {path}")
+        self.backends[shard] = backend
+        self.paths[shard] = path
+        return backend
+
+    def _close_shard(self, shard):
+        backend = self.backends.pop(shard)
+        backend.flush()
+        self._categories.update(backend.categories())
+        self._late_categories += getattr(backend, "late_categories", 0)
+        backend.close()
+
+    def open(self):
+        """Open the first shard now (so that Outlook or file errors show up before the loop)."""
+        if self.mode == "size":
             try:
-                mail.UnRead = False
-            except Exception:
-                pass
-            
-            # Set MAPI Properties BEFORE Save (including threading headers)
-            set_item_properties(mail, date_val, sender_name=sender_name, sender_email=sender_email,
-                                references=references, in_reply_to=in_reply_to)
-            
-            # Save & Move
-            mail.Save()
-            if temp_folder != target_folder:
-                mail.Move(target_folder)
-            
+                self._open_shard(self.current)
+            except Exception as e:
+                logging.error(f"{e}")
+                return False
+        return True
+
+    def route(self, prepared):
+        """
+        Choose (and open if needed) the shard of the next message. Returns
+        True when that message starts a new shard file.
+        """
+        if self.mode == "year":
+            shard = prepared.date.year if prepared.date else UNDATED_SHARD
+        else:
+            shard = self.current
+            if self.max_bytes and self._shard_size(shard) >= self.max_bytes:
+                shard += 1
+                logging.info(f"PST shard {self.current} reached {self._shard_size(self.current) / 2**30:.2f} GB: "
+                             f"rolling over to shard {shard}")
+        started = shard not in self.paths
+        if shard not in self.backends:
+            self._open_shard(shard)
+        self.current = shard
+        return started
+
+    def _shard_size(self, shard):
+        try:
+            return os.path.getsize(self.paths.get(shard) or self.shard_path(shard))
+        except OSError:
+            return 0
+
+    def write(self, prepared):
+        self.backends[self.current].write(prepared)
+
+    def checkpoint_spacing(self):
+        """A checkpoint commits every open shard."""
+        return sum(backend.checkpoint_spacing() for backend in self.backends.values()
+                   if hasattr(backend, "checkpoint_spacing"))
+
+    def _existing_shards(self):
+        """(shard, path) of the shard files of this PST name already on disk."""
+        folder = os.path.dirname(self.pst_path)
+        stem = os.path.basename(os.path.splitext(self.pst_path)[0])
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return []
+        shards = []
+        for name in names:
+            if not name.lower().startswith(stem.lower() + "_"):
+                continue
+            suffix = os.path.splitext(name)[0][len(stem) + 1:]
+            if self.mode == "year" and suffix.lower() == "undated":
+                shard = UNDATED_SHARD
+            elif suffix.isdigit():
+                shard = int(suffix)
+            else:
+                continue
+            path = self.shard_path(shard)
+            if os.path.normcase(path) == os.path.normcase(os.path.join(folder, name)):
+                shards.append((shard, path))
+        return sorted(shards)
+
+    def existing_messages(self):
+        """
+        (Message-ID, subject, date, shard) of the messages of every shard file already on
+        disk, each opened in turn (they then receive the new messages: a
+        "size" run carries on with the last one).
+        """
+        for shard, path in self._existing_shards():
+            self.paths.setdefault(shard, path)
+        if self.mode == "size" and self.paths:
+            self.current = max(self.current, max(self.paths))
+        for shard in sorted(self.paths):
+            backend = self.backends.get(shard) or self._open_shard(shard)
+            for message_id, subject, date, _ in backend.existing_messages():
+                yield message_id, subject, date, shard
+        if self.mode == "size" and self.current not in self.backends:
+            self._open_shard(self.current)
+
+    def provision_categories(self, labels, colors=None):
+        self._provisioned = (labels, colors)
+        for backend in self.backends.values():
+            backend.provision_categories(labels, colors)
+
+    @property
+    def late_categories(self):
+        return self._late_categories + sum(getattr(b, "late_categories", 0) for b in self.backends.values())
+
+    def categories(self):
+        names = set(self._categories)
+        for backend in self.backends.values():
+            names.update(backend.categories())
+        return sorted(names)
+
+    def restore_categories(self, names):
+        self._categories.update(names)
+        for backend in self.backends.values():
+            backend.restore_categories(names)
+
+    def shards(self):
+        """Shard list saved with each checkpoint."""
+        return {"mode": self.mode, "max_bytes": self.max_bytes, "current": self.current,
+                "paths": {str(shard): path for shard, path in sorted(self.paths.items())}}
+
+    def restore_shards(self, saved):
+        """Carry on with the shards of a checkpoint (the current one receives the next messages)."""
+        if not saved:
+            return
+        if saved.get("mode") != self.mode:
+            logging.warning(f"The checkpoint was made with --shard-by {saved.get('mode')}, not {self.mode}: "
+                            f"new shards are numbered from scratch")
+            return
+        self.paths.update({int(shard): path for shard, path in saved.get("paths", {}).items()})
+        if self.mode == "size" and saved.get("current"):
+            self.current = saved["current"]
+
+    def flush(self):
+        for backend in self.backends.values():
+            backend.flush()
+
+    def close(self):
+        for shard in list(self.backends):
+            self._close_shard(shard)
+        if self.paths:
+            logging.info(f"PST shards: {', '.join(self.paths[shard] for shard in sorted(self.paths))}")
+
+
+BACKENDS = ("outlook", "pst")
+SHARD_MODES = ("size", "year")
+UNDATED_SHARD = 0       # year shard of the messages without a usable date
+DEFAULT_SHARD_GB = 10   # Outlook slows down well before the 50 GB PST limit
+
+
+def prepared_to_pst_properties(prepared):
+    """
+    MAPI properties of a PreparedMessage for PstWriter.add_message(): the same
+    properties the Outlook backend sets (flags, dates, sender, threading,
+    categories, attachments with Content-ID), as plain values.
+    
+    Returns (properties, recipients, attachments, named_properties).
+    """
+    props = {
+        pst_file.PR_MESSAGE_CLASS: "IPM.Note",
+        pst_file.PR_SUBJECT: prepared.subject,
+        pst_file.PR_CONVERSATION_TOPIC: prepared.subject,
+        pst_file.PR_MESSAGE_FLAGS: pst_file.MSGFLAG_READ,  # read, not a draft (no MSGFLAG_UNSENT)
+        pst_file.PR_ICON_INDEX: 256,
+        pst_file.PR_DISPLAY_TO: prepared.to,
+    }
+    if prepared.message_id:
+        props[pst_file.PR_INTERNET_MESSAGE_ID] = prepared.message_id
+
+    if prepared.date:
+        props[pst_file.PR_CLIENT_SUBMIT_TIME] = prepared.date
+        props[pst_file.PR_MESSAGE_DELIVERY_TIME] = prepared.date
+        props[pst_file.PR_CREATION_TIME] = prepared.date
+        props[pst_file.PR_LAST_MODIFICATION_TIME] = prepared.date
+
+    if prepared.sender_name or prepared.sender_email:
+        name = prepared.sender_name or prepared.sender_email
+        email = prepared.sender_email or name
+        props[pst_file.PR_SENDER_NAME] = name
+        props[pst_file.PR_SENT_REPRESENTING_NAME] = name
+        if "@" in email:
+            props[pst_file.PR_SENDER_EMAIL_ADDRESS] = email
+            props[pst_file.PR_SENDER_ADDRTYPE] = "SMTP"
+            props[pst_file.PR_SENT_REPRESENTING_EMAIL_ADDRESS] = email
+            props[pst_file.PR_SENT_REPRESENTING_ADDRTYPE] = "SMTP"
+
+    if prepared.references:
+        props[pst_file.PR_INTERNET_REFERENCES] = prepared.references
+    if prepared.in_reply_to:
+        props[pst_file.PR_IN_REPLY_TO_ID] = prepared.in_reply_to.strip().strip('<>')
+
+    if prepared.body_html:
+        props[pst_file.PR_HTML] = prepared.body_html.encode('utf-8', errors='replace')
+        props[pst_file.PR_INTERNET_CPID] = 65001
+        props[pst_file.PR_NATIVE_BODY] = 3  # HTML
+    elif prepared.body_text:
+        props[pst_file.PR_BODY] = prepared.body_text
+        props[pst_file.PR_NATIVE_BODY] = 1  # plain text
+
+    recipients = []
+    for name, email in prepared.recipients:
+        display_name = name or email
+        recipients.append({
+            pst_file.PR_RECIPIENT_TYPE: 1,  # MAPI_TO
+            pst_file.PR_RESPONSIBILITY: True,
+            pst_file.PR_OBJECT_TYPE: 6,  # MAPI_MAILUSER
+            pst_file.PR_DISPLAY_TYPE: 0,  # DT_MAILUSER
+            pst_file.PR_DISPLAY_NAME: display_name,
+            pst_file.PR_ADDRTYPE: "SMTP",
+            pst_file.PR_EMAIL_ADDRESS: email,
+            pst_file.PR_SMTP_ADDRESS: email,
+            pst_file.PR_ENTRYID: pst_file.one_off_entryid(display_name, email),
+            pst_file.PR_SEARCH_KEY: f"SMTP:{email.upper()}\x00".encode('ascii', errors='replace'),
+        })
+
+    attachments = []
+    for filename, payload, content_id, content_type in prepared.attachments:
+        if not payload:
+            logging.warning(f"Empty attachment skipped: {filename}")
+            continue
+        attachment = {
+            pst_file.PR_ATTACH_METHOD: pst_file.ATTACH_BY_VALUE,
+            pst_file.PR_ATTACH_DATA_BIN: payload,
+            pst_file.PR_ATTACH_LONG_FILENAME: filename,
+            pst_file.PR_ATTACH_FILENAME: filename,
+            pst_file.PR_DISPLAY_NAME: filename,
+            pst_file.PR_ATTACH_EXTENSION: os.path.splitext(filename)[1] or None,
+            pst_file.PR_ATTACH_MIME_TAG: content_type,
+            pst_file.PR_OBJECT_TYPE: 7,  # MAPI_ATTACH
+        }
+        if content_id:
+            attachment[pst_file.PR_ATTACH_CONTENT_ID] = content_id.strip().strip('<>')
+        attachments.append(attachment)
+
+    named = {}
+    if prepared.categories:
+        named[pst_file.NAME_KEYWORDS] = (pst_file.PT_MV_UNICODE, list(prepared.categories))
+
+    return props, recipients, attachments, named
+
+
+def resume_position(state, mbox_path, fingerprint, pst_abs_path, state_file=STATE_FILE, delta=False):
+    """
+    Message to restart from according to a checkpoint (0 without one), or None
+    when the checkpoint belongs to another (or a modified) MBOX. With delta,
+    such a checkpoint is that of the previous import: start from 0.
+    """
+    start_at = state.get("last_count", 0)
+    if start_at > 0:
+        saved_mbox = state.get("mbox")
+        if saved_mbox is None:
+            logging.warning("State file without input fingerprint (older version): resuming by message count only")
+        elif not fingerprints_match(saved_mbox, fingerprint) and delta:
+            logging.info(f"The checkpoint in {state_file} belongs to a previous import ({saved_mbox.get('path')}): "
+                         f"delta import of {mbox_path} from its first message")
+            return 0
+        elif not fingerprints_match(saved_mbox, fingerprint):
+            logging.error(f"The checkpoint in {state_file} was made for another MBOX ({saved_mbox.get('path')}, "
+                          f"{saved_mbox.get('size'):,} bytes), not {mbox_path}. "
+                          f"Use --no-resume to start over with this file.")
+            return None
+        if state.get("pst") and os.path.normcase(state["pst"]) != os.path.normcase(pst_abs_path):
+            logging.warning(f"The checkpoint was made for another PST: {state['pst']}")
+    return start_at
+
+
+def open_backend(backend, pst_abs_path, folder_name, outlook=None, strategy="save-move", move_batch=50,
+                 shard_by=None, shard_size_gb=None, date_folders=None):
+    """
+    Open the writer named by backend ("outlook" or "pst", or a backend object),
+    spread over several PST files with shard_by ("size" or "year") and over
+    Year[/Month] subfolders with date_folders ("year" or "month").
+    None if it cannot be opened.
+    """
+    if shard_size_gb and not shard_by:
+        shard_by = "size"
+    if shard_by and backend in BACKENDS:
+        max_bytes = int((shard_size_gb or DEFAULT_SHARD_GB) * 2**30) if shard_by == "size" else None
+        if backend == "outlook":
+            backend = ShardedBackend(pst_abs_path, OutlookBackend, shard_by, max_bytes, folder_name=folder_name,
+                                     outlook=outlook, strategy=strategy, move_batch=move_batch,
+                                     date_folders=date_folders)
+        else:
+            backend = ShardedBackend(pst_abs_path, PstFileBackend, shard_by, max_bytes, folder_name=folder_name,
+                                     date_folders=date_folders)
+    elif backend == "outlook":
+        backend = OutlookBackend(pst_abs_path, folder_name, outlook, strategy=strategy, move_batch=move_batch,
+                                 date_folders=date_folders)
+    elif backend == "pst":
+        backend = PstFileBackend(pst_abs_path, folder_name, date_folders=date_folders)
+    if not backend.open():
+        return None
+    return backend
+
+
+class MigrationRun:
+    """
+    One import session into one PST. The writer (Outlook or the PST file),
+    the Message-ID dedup store, the back-pressure controller and the totals
+    are shared by every MBOX file imported with import_mbox(), so several
+    Takeout parts go through a single Outlook connection and are deduplicated
+    against each other.
+    """
+
+    def __init__(self, backend, pst_abs_path, resume=True, workers=0, checkpoint_seconds=None, checkpoint_mb=None,
+                 contacts=None, label_prescan=True, colors=None, message_filter=None, delta=False):
+        self.backend = backend
+        self.pst_abs_path = pst_abs_path
+        self.workers = workers
+        self.label_prescan = label_prescan
+        self.colors = colors
+        self.contacts = contacts
+
+        # Deduplication: 64-bit Message-ID hashes of the messages already in the
+        # PST, saved with each checkpoint so duplicates are still skipped after a resume
+        self.dedup_store = open_dedup_store(pst_abs_path, reset=not resume)
+
+        self.checkpoint_seconds = checkpoint_seconds or backend.checkpoint_seconds
+        self.checkpoint_bytes = int(checkpoint_mb * 1024 * 1024) if checkpoint_mb else backend.checkpoint_bytes
+
+        # Pauses between items only when Outlook shows signs of overload
+        self.pressure = BackPressure(enabled=backend.throttle)
+
+        self.address_book = AddressBook() if contacts else None
+        # Rate of each window of written messages: shows whether the writer slows down
+        self.throughput = ThroughputTimeline()
+        # Duplicates are dropped on the index's header data, before any MIME parse
+        self.fast_path = HeaderFastPath(self.dedup_store, message_filter)
+        if self.fast_path.message_filter is not None:
+            logging.info(f"Message filters: {message_filter.describe()}")
+        # --delta: the messages already in the PST join the dedup store, so only new ones are parsed and written
+        self.delta = None
+        if delta:
+            self.delta = self.seed_from_target()
+
+        self._pool = None           # worker processes (workers > 0), shared by every MBOX of the session
+        self.count = 0              # MBOX position reached, summed over the files
+        self.messages_processed = 0  # messages written in this session
+        self.duplicates_skipped = 0
+        self.errors = 0
+        self.stopped = False        # too many errors: the session gives up
+
+    def worker_pool(self):
+        """The worker processes decoding messages (and indexing the files of a batch), started on first use."""
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, initializer=_init_prepare_worker)
+        return self._pool
+
+    def close_pool(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def seed_from_target(self):
+        """Add the Message-ID of every item already in the target folder tree to the dedup store (--delta)."""
+        if not hasattr(self.backend, "existing_messages"):
+            logging.warning(f"Delta import: the {self.backend.name} backend cannot list the messages of the PST")
+            return None
+        with profiler.stage("delta.read"):
+            seed = DeltaSeed(self.dedup_store).add(self.backend.existing_messages())
+        logging.info(f"Delta import: {seed.summary()}")
+        return seed
+
+    def import_mbox(self, mbox_path, fingerprint, state, start_at, save, limit=None, rebuild_index=False):
+        """
+        Import one MBOX from message start_at (its checkpoint state is state,
+        and save(state) records a new one). Returns the position reached, or
+        None if the MBOX index does not match the checkpoint.
+        """
+        backend = self.backend
+        pressure = self.pressure
+        dedup_store = self.dedup_store
+        address_book = self.address_book
+        workers = self.workers
+        backend.restore_categories(state.get("categories", []))
+        backend.restore_shards(state.get("shards"))
+
+        if start_at > 0:
+            logging.info(f"Resuming from message {start_at}...")
+
+        count = start_at
+        start_time = time.time()
+
+        # Effective limit calculation
+        effective_limit = (start_at + limit) if limit else None
+
+        last_checkpoint = {"time": time.time(), "offset": 0}
+
+        def build_state(count):
+            return {
+                "version": STATE_VERSION,
+                "last_count": count,
+                "byte_offset": mbox_index.offset(count),
+                "mbox": dict(fingerprint, path=os.path.abspath(mbox_path)),
+                "pst": self.pst_abs_path,
+                "backend": backend.name,
+                "dedup": {"path": dedup_store.path, "count": len(dedup_store)},
+                "categories": backend.categories(),
+                "shards": backend.shards(),
+                "saved_at": datetime.datetime.now().isoformat(),
+            }
+
+        # A PST commit rewrites the whole file structure: space checkpoints by its cost
+        checkpoint_spacing = getattr(backend, "checkpoint_spacing", lambda: 0.0)
+
+        def checkpoint(count):
+            # Commit the output first: the checkpoint must never be ahead of the PST
+            with profiler.stage("checkpoint"):
+                backend.flush()
+                dedup_store.save()
+                problem_journal.flush()
+                save(build_state(count))
+            last_checkpoint["time"] = time.time()
+            last_checkpoint["offset"] = mbox_index.offset(count)
+
+        # Setup progress bar
+        file_size = os.path.getsize(mbox_path)
+
+        progress_bar = None
+        progress_bar_created = False
+
+        # Show info about skipping if resuming
+        if start_at > 0:
+            logging.info(f"Seeking to message {start_at}...")
+
+        # The offset index gives the message count and the byte position of every
+        # message, so resume/--limit seek directly instead of re-parsing the MBOX.
+        # (Messages themselves are still parsed exactly like mailbox.mbox does.)
+        messages_processed = 0
+        mbox_index = open_index(mbox_path, rebuild=rebuild_index)
+        total_messages = len(mbox_index)
+        logging.info(f"Found {total_messages} messages in MBOX")
+
+        stop_at = min(effective_limit, total_messages) if effective_limit else total_messages
+        if start_at > 0:
+            saved_offset = state.get("byte_offset")
+            if start_at > total_messages or (saved_offset is not None and saved_offset != mbox_index.offset(start_at)):
+                logging.error(f"Checkpoint offset {saved_offset} does not match message {start_at} of the MBOX index. "
+                              f"Use --no-resume to start over.")
+                return None
+            logging.info(f"Resuming at byte offset {mbox_index.offset(start_at):,} / {file_size:,}")
+        last_checkpoint["offset"] = mbox_index.offset(start_at)
+
+        fast_path = self.fast_path
+        fast_path.start(mbox_index)
+
+        # Every label is in the index: create all the categories before the first item
+        if self.label_prescan:
+            labels = prescan_labels(mbox_index, decode_labels, start_at, stop_at,
+                                    keep=fast_path.keep if fast_path.message_filter else None)
+            backend.provision_categories(labels, self.colors)
+        if workers > 0:
+            logging.info(f"Decoding messages with {workers} worker processes")
+
+        def handle(i, prepared, count):
+            """Write message i, or skip it (filtered, duplicate). Returns the MBOX position reached."""
+            nonlocal messages_processed
+            if prepared is FILTERED:
+                return i + 1
+
+            # Check for duplicates based on Message-ID (hash computed by the index)
+            msg_hash = mbox_index.hashes[i]
+            if prepared is SKIPPED and msg_hash not in dedup_store:
+                prepared = fast_path.prepare_skipped(i)
+            if isinstance(prepared, Exception):
+                raise prepared
+
+            if msg_hash and msg_hash in dedup_store:
+                self.duplicates_skipped += 1
+                return i + 1  # Skip this duplicate
+            # --delta: an item without Message-ID already in the PST, matched on its subject and date
+            if self.delta is not None and self.delta.match(prepared, msg_hash):
+                self.duplicates_skipped += 1
+                return i + 1
+
+            # Sharded output: a new PST shard starts right after a checkpoint
+            if backend.route(prepared):
+                checkpoint(count)
+            shard = backend.shard
+
+            # Back-pressure: wait before the next COM write only while Outlook is overloaded.
+            # A write refused as busy is tried again after the pause; the error counts once the retries run out.
+            attempt = 0
+            while True:
+                pressure.pause()
+                write_started = time.perf_counter()
+                try:
+                    with profiler.stage("message.write"):
+                        backend.write(prepared)
+                except Exception as e:
+                    pressure.record(time.perf_counter() - write_started, e)
+                    if not pressure.should_retry(e, attempt):
+                        raise
+                    attempt += 1
+                    logging.debug(f"Message {i}: {busy_error_name(e)}, retry {attempt}/{pressure.busy_retries}")
+                    continue
+                pressure.record(time.perf_counter() - write_started)
+                break
+            # Only a written message counts as seen: a later copy of a failed one is still imported.
+            # The dedup store also records which shard it went to.
+            dedup_store.add(msg_hash, shard)
+            if address_book is not None:
+                address_book.record((prepared.sender_name, prepared.sender_email), prepared.recipients)
+
             count = i + 1
             messages_processed += 1
-            
-            # Update progress bar (message count for limit mode)
-            if progress_bar and limit:
+            self.messages_processed += 1
+            self.throughput.record()
+
+            # Update progress bar
+            if progress_bar:
                 progress_bar.update(1)
             elif count % 100 == 0 and not progress_bar:
                 # Fallback text logging if no tqdm
@@ -803,55 +2051,842 @@ def mbox_to_pst(mbox_path, pst_path, folder_name="Gmail Archive", resume=True, l
                 elapsed = time.time() - start_time
                 rate = (count - start_at) / elapsed if elapsed > 0 else 0
                 logging.info(f"Processed {count} messages... ({rate:.2f} msgs/sec)")
+            return count
 
-            
-            # Save state periodically
-            if count % 100 == 0:
-                save_state(count)
-            
-            # Micro-pause every 10 messages to avoid resource exhaustion
-            if count % 10 == 0:
-                time.sleep(0.1)
-                
-        except Exception as e:
-            errors += 1
-            logging.error(f"Error processing message {i}: {e}")
-            if errors > 500: # Higher threshold for 10GB
-                logging.error("Too many errors, stopping.")
+        self.throughput.begin()
+        for i, prepared in iter_prepared_messages(mbox_index, start_at, stop_at, workers=workers,
+                                                  fast_path=fast_path,
+                                                  pool=self.worker_pool() if workers > 0 else None):
+            # Create progress bar only when processing actually starts
+            if TQDM_AVAILABLE and not progress_bar_created:
+                progress_bar = tqdm(total=stop_at - start_at, desc="Processing", unit="msg",
+                                   file=sys.stderr, dynamic_ncols=True, leave=False,
+                                   bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} msgs [{elapsed}<{remaining}]')
+                progress_bar_created = True
+
+            # Check for graceful shutdown request (Ctrl+C)
+            if _shutdown_requested:
+                logging.info(f"Shutdown requested. Saving state at message {count}...")
+                checkpoint(count)
                 break
-            continue
-        finally:
-            # Explicitly release the COM object
-            mail = None
 
-    # Cleanup temp folder if empty
+            try:
+                count = handle(i, prepared, count)
+
+                # Checkpoint on a time or byte budget (the backend commits first), checked for
+                # every message: a long run of duplicates or filtered messages moves the position too
+                since_checkpoint = time.time() - last_checkpoint["time"]
+                if ((since_checkpoint >= self.checkpoint_seconds
+                        or mbox_index.offset(count) - last_checkpoint["offset"] >= self.checkpoint_bytes)
+                        and since_checkpoint >= checkpoint_spacing()):
+                    checkpoint(count)
+                profiler.maybe_snapshot(messages=self.count + count, written=self.messages_processed)
+
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Error processing message {i}: {e}")
+                if self.errors > 500: # Higher threshold for 10GB
+                    logging.error("Too many errors, stopping.")
+                    self.stopped = True
+                    break
+                continue
+
+        self.throughput.pause()
+        if effective_limit and stop_at == effective_limit and not _shutdown_requested:
+            logging.info(f"Session limit of {limit} messages reached.")
+
+        # Close progress bar
+        if progress_bar:
+            progress_bar.close()
+
+        checkpoint(count)
+        self.count += count
+        return count
+
+    def finish(self):
+        """Close the writer and log the totals of the session."""
+        self.close_pool()
+        self.backend.close()
+        self.dedup_store.save()
+        problem_journal.flush()
+        logging.info(f"Migration completed!")
+        logging.info(f"Total messages processed: {self.count}")
+        logging.info(f"Duplicates skipped: {self.duplicates_skipped}")
+        logging.info(f"Errors: {self.errors}")
+        if self.fast_path.message_filter is not None:
+            logging.info(f"Filtered out: {self.fast_path.message_filter.summary()}")
+        if self.delta is not None:
+            logging.info(f"Delta import: {self.messages_processed} new messages written "
+                         f"({self.delta.items} already in the PST)")
+        logging.info(f"Header fast path: {self.fast_path.summary()}")
+        self.throughput.finish()
+        logging.info(f"Throughput over time: {self.throughput.summary()}")
+        if self.pressure.enabled:
+            logging.info(f"Back-pressure: {self.pressure.summary()}")
+        if getattr(self.backend, "late_categories", 0):
+            logging.info(f"Categories added while writing (missed by the label pre-scan): {self.backend.late_categories}")
+        if self.workers <= 0:
+            logging.info(f"Address cache: {header_cache.summary()}")
+        if self.address_book is not None:
+            self.address_book.write_csv(self.contacts)
+        if profiler.enabled:
+            profiler.write(messages=self.count, written=self.messages_processed, duplicates=self.duplicates_skipped,
+                           errors=self.errors, backend=self.backend.name, throughput=self.throughput.to_list(),
+                           fast_path=self.fast_path.to_dict(),
+                           filtered=dict(self.fast_path.message_filter.excluded) if self.fast_path.message_filter else {},
+                           delta=self.delta.to_dict() if self.delta is not None else None)
+            profiler.log_summary()
+        logging.info(f"PST: {self.pst_abs_path}")
+
+
+def _start_migration(pst_path, folder_name, resume, workers, outlook, backend, strategy, move_batch,
+                     checkpoint_seconds, checkpoint_mb, profile, profile_every, contacts, label_prescan,
+                     category_colors, shard_by, shard_size_gb, date_folders, message_filter, delta, checks):
+    """
+    Read the colour mapping, run checks() (resume validation, before Outlook
+    is touched), then open the writer: a MigrationRun, or None (logged).
+    """
+    pst_abs_path = os.path.abspath(pst_path)
+    colors = None
+    if category_colors:
+        try:
+            colors = load_category_colors(category_colors)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read category colours: {e}")
+            return None
+    if profile:
+        profiler.start(profile, profile_every)
+    if not checks(pst_abs_path):
+        return None
+    backend = open_backend(backend, pst_abs_path, folder_name, outlook, strategy=strategy, move_batch=move_batch,
+                           shard_by=shard_by, shard_size_gb=shard_size_gb, date_folders=date_folders)
+    if backend is None:
+        return None
+    return MigrationRun(backend, pst_abs_path, resume=resume, workers=workers, checkpoint_seconds=checkpoint_seconds,
+                        checkpoint_mb=checkpoint_mb, contacts=contacts, label_prescan=label_prescan, colors=colors,
+                        message_filter=message_filter, delta=delta)
+
+
+def mbox_to_pst(mbox_path, pst_path, folder_name="Gmail Archive", resume=True, limit=None, rebuild_index=False,
+                workers=0, outlook=None, backend="outlook", strategy="save-move", move_batch=50,
+                checkpoint_seconds=None, checkpoint_mb=None, profile=None, profile_every=SNAPSHOT_SECONDS,
+                contacts=None, label_prescan=True, category_colors=None, shard_by=None, shard_size_gb=None,
+                date_folders=None, message_filter=None, delta=False):
+    """
+    Import an MBOX file into a PST, through Outlook or by writing the file directly.
+    
+    Args:
+        workers: Number of worker processes decoding messages ahead of the
+            writer (0 = decode on the main thread)
+        outlook: Outlook.Application object to use (default: dispatch the real
+            one through win32com; fake_outlook.FakeOutlookApplication on Linux)
+        backend: "outlook" (COM, Windows only) or "pst" (pst_file.PstWriter,
+            no Outlook needed), or a backend object with open/write/flush/close
+        strategy: Outlook item creation strategy, a key of STRATEGIES
+        move_batch: Items moved at once by the "batch-move" strategy
+        checkpoint_seconds, checkpoint_mb: Checkpoint budgets (time elapsed,
+            MBOX bytes consumed) overriding the backend defaults
+        profile: JSON file receiving per-stage timings and COM call counts
+            (plus a .csv next to it), rewritten every profile_every seconds
+        contacts: CSV file receiving the correspondents of the messages
+            written in this run (address, display name, message counts)
+        label_prescan: Create every category from the MBOX index before the
+            first item is written (otherwise on first use, message by message)
+        category_colors: JSON file mapping labels to olCategoryColor names
+            or numbers, applied by the label pre-scan
+        shard_by: Spread the output over several PST files: "size" (a new
+            file every shard_size_gb GB, default DEFAULT_SHARD_GB) or "year"
+            (one file per year of the message date); see ShardedBackend
+        date_folders: Route each message to a Year ("year") or Year/Month
+            ("month") subfolder of folder_name, from its date
+        message_filter: message_filter.MessageFilter excluding messages on
+            their header data (date range, labels, senders, size) before
+            they are parsed
+        delta: Read the Message-IDs already in the target PST first (folder
+            tables, no item opened) and import only the messages it lacks;
+            a checkpoint left by the previous import is not resumed
+
+    Returns the MigrationRun (totals), or None if the import could not start.
+    """
+    if not os.path.exists(mbox_path):
+        logging.error(f"MBOX file not found at {mbox_path}")
+        return None
+
+    # Checkpoints record where to restart and which MBOX they belong to:
+    # refuse to resume a different (or modified) MBOX
+    fingerprint = file_fingerprint(mbox_path)
+    state = load_state() if resume else {}
+    position = {}
+
+    def checks(pst_abs_path):
+        position["start_at"] = resume_position(state, mbox_path, fingerprint, pst_abs_path, delta=delta)
+        return position["start_at"] is not None
+
+    run = _start_migration(pst_path, folder_name, resume, workers, outlook, backend, strategy, move_batch,
+                           checkpoint_seconds, checkpoint_mb, profile, profile_every, contacts, label_prescan,
+                           category_colors, shard_by, shard_size_gb, date_folders, message_filter, delta, checks)
+    if run is None:
+        return None
+    if run.import_mbox(mbox_path, fingerprint, state, position["start_at"], save_state, limit=limit,
+                       rebuild_index=rebuild_index) is None:
+        run.close_pool()
+        run.backend.close()
+        return None
+    run.finish()
+    return run
+
+
+def find_mbox_files(paths):
+    """
+    MBOX files to import: files are taken as given, directories (a Takeout
+    export, extracted) are searched recursively for *.mbox files, in name order.
+    Each file is listed once.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for directory, _, names in os.walk(path):
+                found.extend(os.path.join(directory, name) for name in names if name.lower().endswith(".mbox"))
+            files.extend(sorted(found))
+        else:
+            files.append(path)
+    unique = []
+    seen = set()
+    for path in files:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def _index_mbox(task):
+    """Build (or check) the offset index of one MBOX in a background worker; the sidecar file carries it back."""
+    mbox_path, rebuild = task
+    return len(open_index(mbox_path, rebuild=rebuild))
+
+
+def mbox_to_pst_batch(mbox_paths, pst_path, folder_name="Gmail Archive", resume=True, limit=None, rebuild_index=False,
+                      workers=0, outlook=None, backend="outlook", strategy="save-move", move_batch=50,
+                      checkpoint_seconds=None, checkpoint_mb=None, profile=None, profile_every=SNAPSHOT_SECONDS,
+                      contacts=None, label_prescan=True, category_colors=None, shard_by=None, shard_size_gb=None,
+                      date_folders=None, message_filter=None, delta=False, state_file=BATCH_STATE_FILE):
+    """
+    Import several MBOX files (the parts of a Takeout export, or a Takeout
+    directory) into one PST, through one writer and one dedup store: a
+    message present in two parts is imported once.
+
+    Each file keeps its own checkpoint in state_file (keyed by its absolute
+    path), so an interrupted batch resumes every file where it stopped and
+    skips the finished ones. The offset index of the next file is built in
+    the background while the current one is written, in the pool of worker
+    processes that decodes the messages of every file (workers > 0). limit
+    applies to the whole batch; other options are those of mbox_to_pst().
+
+    Returns the MigrationRun (totals), or None if the batch could not start.
+    """
+    files = find_mbox_files(mbox_paths)
+    missing = [path for path in files if not os.path.isfile(path)]
+    if missing:
+        logging.error(f"MBOX file not found at {', '.join(missing)}")
+        return None
+    if not files:
+        logging.error("No MBOX file to import")
+        return None
+
+    batch_state = load_state(state_file) if resume else {}
+    file_states = batch_state.setdefault("files", {})
+    keys = [os.path.abspath(path) for path in files]
+    fingerprints = [file_fingerprint(path) for path in files]
+    positions = []
+
+    def checks(pst_abs_path):
+        for path, key, fingerprint in zip(files, keys, fingerprints):
+            start_at = resume_position(file_states.get(key, {}), path, fingerprint, pst_abs_path, state_file, delta)
+            if start_at is None:
+                return False
+            positions.append(start_at)
+        return True
+
+    run = _start_migration(pst_path, folder_name, resume, workers, outlook, backend, strategy, move_batch,
+                           checkpoint_seconds, checkpoint_mb, profile, profile_every, contacts, label_prescan,
+                           category_colors, shard_by, shard_size_gb, date_folders, message_filter, delta, checks)
+    if run is None:
+        return None
+    batch_state.update(version=STATE_VERSION, pst=run.pst_abs_path)
+    logging.info(f"Batch of {len(files)} MBOX files into {run.pst_abs_path}")
+
+    # Index the next file while the current one is written (the writer is the bottleneck).
+    # Queued ahead of the file's messages, its indexing takes a single worker of the pool.
+    indexer = run.worker_pool() if workers > 0 else multiprocessing.pool.ThreadPool(1)
+    indexes = {}
+
+    def index_async(n):
+        if n < len(files) and n not in indexes:
+            indexes[n] = indexer.apply_async(_index_mbox, ((files[n], rebuild_index),))
+        return indexes.get(n)
+
+    remaining = limit
     try:
-        if temp_folder.Items.Count == 0:
-            temp_folder.Delete()
-    except: pass
+        for n, (path, key, fingerprint, start_at) in enumerate(zip(files, keys, fingerprints, positions), 1):
+            if _shutdown_requested or run.stopped or (limit and remaining <= 0):
+                break
+            index = index_async(n - 1)
+            index_async(n)
+            try:
+                total = index.get()
+            except Exception as e:
+                logging.error(f"Could not index {path}: {e}")
+                run.errors += 1
+                continue
+            if start_at >= total and total > 0:
+                logging.info(f"[{n}/{len(files)}] {path}: already imported ({total} messages)")
+                run.count += start_at
+                continue
+            logging.info(f"[{n}/{len(files)}] {path}")
+
+            def save(state, key=key):
+                file_states[key] = state
+                save_state(batch_state, state_file)
+
+            written = run.messages_processed
+            count = run.import_mbox(path, fingerprint, file_states.get(key, {}), start_at, save,
+                                    limit=remaining, rebuild_index=False)
+            if count is None:
+                run.errors += 1
+                continue
+            if remaining:
+                remaining -= count - start_at
+            logging.info(f"[{n}/{len(files)}] {path}: message {count}/{total}, "
+                         f"{run.messages_processed - written} written")
+    finally:
+        if workers <= 0:
+            indexer.terminate()
+        run.close_pool()
+    run.finish()
+    return run
+
+
+def command_report(argv):
+    """report: aggregate the problem journal by error type, sender or month."""
+    parser = argparse.ArgumentParser(prog="mbox_to_pst.py report",
+                                     description="Synthèse du journal des messages problématiques")
+    parser.add_argument("journal", nargs="?", default=PROBLEM_FILE, help=f"Journal JSONL (défaut : {PROBLEM_FILE})")
+    parser.add_argument("--by", choices=REPORT_KEYS, default="type",
+                        help="Regrouper par type d'erreur, expéditeur ou mois du message")
+    parser.add_argument("--top", type=int, default=20, help="Nombre de groupes affichés")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.journal):
+        print(f"No problem journal at {args.journal}")
+        return 1
+    print_report(args.journal, by=args.by, top=args.top)
+    return 0
 
-    # Close progress bar
-    if progress_bar:
-        progress_bar.close()
 
-    attachments_temp_dir.cleanup()
+def connect_outlook():
+    """Outlook.Application through win32com, or None (logged) when unavailable."""
+    if not WIN32_AVAILABLE:
+        logging.error("win32com is not available: Outlook can only be driven on Windows (pip install pywin32).")
+        return None
+    try:
+        return win32com.client.Dispatch("Outlook.Application")
+    except Exception as e:
+        logging.error(f"Error connecting to Outlook: {e}. Ensure Outlook is installed.")
+        return None
+
+
+def find_outlook_store(namespace, pst_or_name):
+    """
+    Store opened in Outlook for a PST path or a store display name; a PST file
+    that is not open yet is added to the profile. None if not found.
+    """
+    pst_abs_path = os.path.abspath(pst_or_name)
+    for store in namespace.Stores:
+        try:
+            if store.FilePath and store.FilePath.lower() == pst_abs_path.lower():
+                return store
+        except: continue
+    for store in namespace.Stores:
+        try:
+            if store.DisplayName.lower() == pst_or_name.lower():
+                return store
+        except: continue
+    if os.path.isfile(pst_abs_path):
+        namespace.AddStore(pst_abs_path)
+        for store in namespace.Stores:
+            try:
+                if store.FilePath.lower() == pst_abs_path.lower():
+                    return store
+            except: continue
+    return None
 
-    save_state(count)
-    logging.info(f"Migration completed!")
-    logging.info(f"Total messages processed: {count}")
-    logging.info(f"Duplicates skipped: {duplicates_skipped}")
-    logging.info(f"Errors: {errors}")
-    logging.info(f"PST: {pst_abs_path}")
+
+def sync_categories(outlook, pst_or_name, folder_path=None, colors=None, dry_run=False):
+    """
+    Add the categories used in a store to the master list and repair the
+    items with merged labels, reading the items through folder tables
+    (outlook_categories.CategorySync). Returns the CategorySync, or None.
+    """
+    namespace = outlook.GetNamespace("MAPI")
+    store = find_outlook_store(namespace, pst_or_name)
+    if store is None:
+        logging.error(f"No Outlook store for {pst_or_name}")
+        return None
+    folder = store.GetRootFolder()
+    try:
+        for name in (folder_path or "").replace("\\", "/").split("/"):
+            if name:
+                folder = folder.Folders.Item(name)
+    except Exception as e:
+        logging.error(f"Folder '{folder_path}' not found in {store.DisplayName}: {e}")
+        return None
+
+    sync = CategorySync(namespace)
+    sync.scan(folder)
+    if not dry_run:
+        sync.add_missing(colors)
+        sync.repair()
+    logging.info(f"Category sync: {sync.summary()}")
+    return sync
+
+
+def command_sync_categories(argv, outlook=None):
+    """sync-categories: master category list and merged-label repair for a PST opened in Outlook."""
+    parser = argparse.ArgumentParser(prog="mbox_to_pst.py sync-categories",
+                                     description="Synchronise les catégories d'un PST avec la liste principale "
+                                                 "d'Outlook et répare les étiquettes fusionnées")
+    parser.add_argument("pst", help="Fichier .pst (ouvert dans Outlook si nécessaire) ou nom d'une banque Outlook")
+    parser.add_argument("--folder", default=None, help="Sous-dossier à traiter (ex. \"Gmail Archive\") ; défaut : tout le PST")
+    parser.add_argument("--category-colors", default=None, metavar="FICHIER.json",
+                        help="Couleurs des catégories : {\"libellé\": \"Red\"} (noms olCategoryColor ou numéros 1-25)")
+    parser.add_argument("--dry-run", action="store_true", help="Analyser sans rien modifier")
+    args = parser.parse_args(argv)
+    colors = None
+    if args.category_colors:
+        try:
+            colors = load_category_colors(args.category_colors)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read category colours: {e}")
+            return 1
+    if outlook is None:
+        outlook = connect_outlook()
+        if outlook is None:
+            return 1
+    sync = sync_categories(outlook, args.pst, args.folder, colors, dry_run=args.dry_run)
+    if sync is None:
+        return 1
+    print(f"{sync.scanned} items scanned, {len(sync.frequencies)} distinct categories")
+    for name, count in sync.frequencies.most_common():
+        print(f"  {count:8d}  {name}")
+    if args.dry_run:
+        print(f"{len(sync.repairs)} items would be repaired (--dry-run)")
+    return 1 if sync.errors else 0
+
+
+def clean_categories(outlook, names, pst_or_name=None, catalog=True, items=True, progress_every=50, dry_run=False):
+    """
+    Remove category names from the items (of one store, or of every store
+    when pst_or_name is None) and from the master list. Only the items a
+    Restrict() filter returns are opened (outlook_categories.CategoryCleanup).
+    Returns the CategoryCleanup, or None.
+    """
+    namespace = outlook.GetNamespace("MAPI")
+    if pst_or_name:
+        store = find_outlook_store(namespace, pst_or_name)
+        if store is None:
+            logging.error(f"No Outlook store for {pst_or_name}")
+            return None
+        stores = [store]
+    else:
+        stores = list(namespace.Stores)
+
+    cleanup = CategoryCleanup(names, progress_every=progress_every, dry_run=dry_run)
+    if items:
+        for store in stores:
+            try:
+                root_folder = store.GetRootFolder()
+            except Exception as e:
+                logging.warning(f"Skipping store {store.DisplayName}: {e}")
+                continue
+            cleanup.clean(root_folder)
+    if catalog and not dry_run:
+        remove_master_categories(namespace, cleanup.names)
+    logging.info(f"Category cleanup: {cleanup.summary()}")
+    return cleanup
+
+
+def command_clean_categories(argv, outlook=None):
+    """clean-categories: remove categories from the master list and from the items that carry them."""
+    parser = argparse.ArgumentParser(prog="mbox_to_pst.py clean-categories",
+                                     description="Supprime des catégories de la liste principale d'Outlook "
+                                                 "et des messages qui les portent")
+    parser.add_argument("names", nargs="*", help="Catégories à supprimer")
+    parser.add_argument("--all", action="store_true", help="Supprimer toutes les catégories de la liste principale")
+    parser.add_argument("--pst", default=None,
+                        help="Limiter le nettoyage des messages à ce PST (chemin ou nom de banque) ; défaut : tous")
+    parser.add_argument("--catalog-only", action="store_true",
+                        help="Retirer de la liste principale uniquement, sans toucher aux messages")
+    parser.add_argument("--keep-catalog", action="store_true",
+                        help="Nettoyer les messages sans retirer les catégories de la liste principale")
+    parser.add_argument("--progress-every", type=int, default=50,
+                        help="Afficher la progression tous les N messages examinés (défaut : 50)")
+    parser.add_argument("--dry-run", action="store_true", help="Compter les messages concernés sans rien modifier")
+    args = parser.parse_args(argv)
+    if not args.names and not args.all:
+        parser.error("give the categories to remove, or --all")
+    if args.catalog_only and args.keep_catalog:
+        parser.error("--catalog-only and --keep-catalog are mutually exclusive")
+    if outlook is None:
+        outlook = connect_outlook()
+        if outlook is None:
+            return 1
+    names = list(args.names)
+    if args.all:
+        names.extend(cat.Name for cat in outlook.GetNamespace("MAPI").Categories)
+    if not names:
+        print("No categories to remove")
+        return 0
+    cleanup = clean_categories(outlook, names, args.pst, catalog=not args.keep_catalog, items=not args.catalog_only,
+                               progress_every=args.progress_every, dry_run=args.dry_run)
+    if cleanup is None:
+        return 1
+    return 1 if cleanup.errors else 0
+
+
+def add_migration_arguments(parser):
+    """Options shared by a single-file migration and the batch command."""
+    parser.add_argument("--folder", default="Gmail Archive", help="Nom du dossier cible dans Outlook")
+    parser.add_argument("--no-resume", action="store_false", dest="resume", help="Ne pas reprendre la migration précédente")
+    parser.add_argument("--limit", type=int, default=None, help="Limiter le nombre de messages à traiter (pour test)")
+    parser.add_argument("--rebuild-index", action="store_true", help="Reconstruire l'index des positions du fichier MBOX")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Nombre de processus de décodage MIME en parallèle (0 = décodage sur le thread principal)")
+    parser.add_argument("--backend", choices=BACKENDS, default="outlook",
+                        help="outlook = import via Outlook (COM) ; pst = écriture directe du fichier PST, sans Outlook")
+    parser.add_argument("--strategy", choices=list(STRATEGIES), default="save-move",
+                        help="Création des éléments Outlook : save-move (dossier de transit + déplacement), "
+                             "direct (dans le dossier cible), batch-move (déplacements groupés), "
+                             "eml (import EML via OpenSharedItem)")
+    parser.add_argument("--move-batch", type=int, default=50,
+                        help="Nombre d'éléments déplacés à la fois avec --strategy batch-move")
+    parser.add_argument("--checkpoint-seconds", type=float, default=None,
+                        help="Point de reprise au moins toutes les N secondes (défaut : 30 avec Outlook, 60 avec --backend pst)")
+    parser.add_argument("--checkpoint-mb", type=float, default=None,
+                        help="Point de reprise tous les N Mo du MBOX traités (défaut : 32 avec Outlook, 256 avec --backend pst)")
+    parser.add_argument("--profile", nargs="?", const="profile.json", default=None, metavar="FICHIER",
+                        help="Mesure chaque étape (histogrammes de latence) et compte les appels COM ; "
+                             "résumé JSON + CSV (défaut : profile.json)")
+    parser.add_argument("--profile-every", type=float, default=SNAPSHOT_SECONDS, metavar="SECONDES",
+                        help=f"Intervalle des instantanés du profil pendant la migration (défaut : {SNAPSHOT_SECONDS})")
+    parser.add_argument("--contacts", default=None, metavar="FICHIER.csv",
+                        help="Écrire la liste des correspondants (adresse, nom, nombre de messages)")
+    parser.add_argument("--category-colors", default=None, metavar="FICHIER.json",
+                        help="Couleurs des catégories : {\"libellé\": \"Red\"} (noms olCategoryColor ou numéros 1-25)")
+    parser.add_argument("--no-label-prescan", action="store_false", dest="label_prescan",
+                        help="Ne pas créer les catégories avant l'import (création au fil des messages)")
+    parser.add_argument("--shard-by", choices=SHARD_MODES, default=None,
+                        help="Répartir la sortie sur plusieurs PST : size = nouveau fichier au-delà de --shard-size-gb, "
+                             "year = un fichier par année (sortie_2019.pst...)")
+    parser.add_argument("--shard-size-gb", type=float, default=None,
+                        help=f"Taille maximale d'un PST avec --shard-by size (défaut : {DEFAULT_SHARD_GB} Go)")
+    parser.add_argument("--date-folders", choices=DATE_FOLDER_MODES, default=None,
+                        help="Classer les messages dans des sous-dossiers par date : year = Année, "
+                             "month = Année/Mois (ex. \"Gmail Archive/2019/03\")")
+    parser.add_argument("--delta", action="store_true",
+                        help="Import différentiel (nouvel export Takeout vers un PST déjà rempli) : lit d'abord les "
+                             "Message-ID présents dans le PST (tables des dossiers, sans ouvrir les éléments) et "
+                             "n'importe que les nouveaux messages")
+    add_filter_arguments(parser)
+
+
+def add_filter_arguments(parser):
+    """Message filter options (migration, batch and scan), evaluated on the headers before any parsing."""
+    group = parser.add_argument_group("filtres (évalués sur les en-têtes, avant l'analyse des messages)")
+    group.add_argument("--after", type=parse_day, default=None, metavar="AAAA-MM-JJ",
+                       help="Ignorer les messages datés d'avant ce jour")
+    group.add_argument("--before", type=parse_day, default=None, metavar="AAAA-MM-JJ",
+                       help="Ignorer les messages datés de ce jour ou après")
+    group.add_argument("--labels", default=None, metavar="L1,L2",
+                       help="N'importer que les messages portant au moins un de ces libellés")
+    group.add_argument("--exclude-labels", default=None, metavar="L1,L2",
+                       help="Ignorer les messages portant un de ces libellés")
+    group.add_argument("--skip-spam-trash", action="store_true",
+                       help=f"Ignorer les messages du Spam et de la Corbeille ({', '.join(SPAM_TRASH_LABELS)})")
+    group.add_argument("--from", dest="senders", action="append", default=[], metavar="MOTIF",
+                       help="N'importer que les messages de cet expéditeur : adresse, domaine (exemple.com) "
+                            "ou motif (*@news.exemple.com) ; option répétable")
+    group.add_argument("--exclude-from", dest="exclude_senders", action="append", default=[], metavar="MOTIF",
+                       help="Ignorer les messages de cet expéditeur (mêmes motifs) ; option répétable")
+    group.add_argument("--max-size-mb", type=float, default=None, metavar="N",
+                       help="Ignorer les messages de plus de N Mo")
+
+
+def message_filter_from_args(args):
+    """MessageFilter of the add_filter_arguments() options, or None when no filter is set."""
+    split = lambda value: [label.strip() for label in (value or "").split(",") if label.strip()]
+    exclude_labels = split(args.exclude_labels) + (list(SPAM_TRASH_LABELS) if args.skip_spam_trash else [])
+    message_filter = MessageFilter(decode_labels, after=args.after, before=args.before, labels=split(args.labels),
+                                   exclude_labels=exclude_labels, senders=args.senders,
+                                   exclude_senders=args.exclude_senders,
+                                   max_bytes=int(args.max_size_mb * 2**20) if args.max_size_mb else None)
+    return message_filter if message_filter else None
+
+
+def migration_options(args):
+    """Keyword arguments of mbox_to_pst() / mbox_to_pst_batch() from add_migration_arguments() options."""
+    return dict(folder_name=args.folder, resume=args.resume, limit=args.limit, rebuild_index=args.rebuild_index,
+                workers=args.workers, backend=args.backend, strategy=args.strategy, move_batch=args.move_batch,
+                checkpoint_seconds=args.checkpoint_seconds, checkpoint_mb=args.checkpoint_mb,
+                profile=args.profile, profile_every=args.profile_every, contacts=args.contacts,
+                label_prescan=args.label_prescan, category_colors=args.category_colors,
+                shard_by=args.shard_by, shard_size_gb=args.shard_size_gb, date_folders=args.date_folders,
+                message_filter=message_filter_from_args(args), delta=args.delta)
+
+
+def command_batch(argv):
+    """batch: several MBOX files (or Takeout directories) into one PST, with one dedup store."""
+    parser = argparse.ArgumentParser(prog="mbox_to_pst.py batch",
+                                     description="Migration de plusieurs fichiers MBOX (ou d'un dossier Takeout) "
+                                                 "vers un seul PST, avec une déduplication commune")
+    parser.add_argument("pst", help="Chemin du fichier .pst de sortie")
+    parser.add_argument("mbox", nargs="+", help="Fichiers .mbox et/ou dossiers (recherche récursive des .mbox)")
+    add_migration_arguments(parser)
+    parser.add_argument("--state-file", default=BATCH_STATE_FILE,
+                        help=f"Points de reprise du lot, un par fichier MBOX (défaut : {BATCH_STATE_FILE})")
+    args = parser.parse_args(argv)
+    run = mbox_to_pst_batch(args.mbox, args.pst, state_file=args.state_file, **migration_options(args))
+    return 0 if run is not None else 1
+
+
+def calibrate_sample(scan, sample_size, seed=0, folder_name="Gmail Archive"):
+    """
+    Decode a stratified sample of the scanned messages and write it with
+    PstWriter, one throwaway PST per size class, to measure what each class
+    actually costs. Returns {size class: {"messages", "mbox_bytes",
+    "pst_bytes", "seconds"}} for migration_scan.project().
+    """
+    sample = stratified_sample(scan, sample_size, seed)
+    calibration = {}
+    with tempfile.TemporaryDirectory(prefix="mbox_scan_") as work_dir, MboxScanner(scan.mbox_path) as scanner:
+        for stratum, indexes in sample.items():
+            path = os.path.join(work_dir, f"sample_{stratum}.pst")
+            writer = pst_file.PstWriter(path).open()
+            try:
+                folder_nid = writer.get_folder([folder_name])
+                writer.commit()
+                empty_size = os.path.getsize(path)
+                mbox_bytes = 0
+                t0 = time.perf_counter()
+                for i in indexes:
+                    start, stop = scan.index.span(i)
+                    mbox_bytes += stop - start
+                    try:
+                        prepared = prepare_message(scanner.message(start, stop), i, stop)
+                        writer.add_message(folder_nid, *prepared_to_pst_properties(prepared))
+                    except Exception as e:
+                        logging.warning(f"Sample message {i} could not be converted: {e}")
+                writer.commit()
+                seconds = time.perf_counter() - t0
+            finally:
+                writer.close()
+            calibration[stratum] = {"messages": len(indexes), "mbox_bytes": mbox_bytes,
+                                    "pst_bytes": os.path.getsize(path) - empty_size, "seconds": seconds}
+            logging.info(f"Sample {SIZE_CLASSES[stratum][1]}: {len(indexes)} messages, "
+                         f"{mbox_bytes / 2**20:.2f} MB -> {calibration[stratum]['pst_bytes'] / 2**20:.2f} MB of PST "
+                         f"in {seconds:.2f}s")
+    return calibration
+
+
+def command_scan(argv):
+    """scan: Outlook-free manifest of an MBOX (counts, duplicates, labels, sizes, attachments) and projections."""
+    parser = argparse.ArgumentParser(prog="mbox_to_pst.py scan",
+                                     description="Analyse d'un MBOX sans Outlook : messages, doublons, libellés, "
+                                                 "tailles, pièces jointes, messages anormaux, et estimation de la "
+                                                 "taille du PST et de la durée de la migration")
+    parser.add_argument("mbox", help="Chemin du fichier .mbox")
+    parser.add_argument("--manifest", default=MANIFEST_FILE, metavar="FICHIER.json",
+                        help=f"Manifeste JSON écrit (défaut : {MANIFEST_FILE})")
+    parser.add_argument("--sample", type=int, default=0, metavar="N",
+                        help="Convertir un échantillon stratifié d'environ N messages (toutes les tranches de taille) "
+                             "dans un PST jetable pour étalonner les estimations")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du tirage de l'échantillon")
+    parser.add_argument("--outlook-rate", type=float, default=DEFAULT_OUTLOOK_RATE, metavar="MSGS/S",
+                        help=f"Débit d'Outlook utilisé pour l'estimation (défaut : {DEFAULT_OUTLOOK_RATE:g} msgs/s ; "
+                             f"voir les lignes \"Throughput\" d'une migration précédente)")
+    parser.add_argument("--top", type=int, default=TOP_LARGEST, help="Nombre de plus gros messages listés")
+    parser.add_argument("--rebuild-index", action="store_true", help="Reconstruire l'index des positions du MBOX")
+    add_filter_arguments(parser)
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.mbox):
+        logging.error(f"MBOX file not found: {args.mbox}")
+        return 1
+
+    message_filter = message_filter_from_args(args)
+    if message_filter is not None:
+        logging.info(f"Message filters: {message_filter.describe()}")
+    scan = MboxScan(decode_labels, decode_mime_header, top=args.top,
+                    message_filter=message_filter).run(args.mbox, rebuild_index=args.rebuild_index)
+    calibration = calibrate_sample(scan, args.sample, args.seed) if args.sample > 0 else None
+    projection = project(scan, calibration, args.outlook_rate)
+    labelled = {SIZE_CLASSES[stratum][1]: figures for stratum, figures in calibration.items()} if calibration else None
+    manifest = scan.manifest(projection, labelled)
+    tmp_path = args.manifest + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, args.manifest)
+
+    if scan.labels:
+        logging.info("Most frequent labels: " +
+                     ", ".join(f"{label} ({count})" for label, count in scan.labels.most_common(10)))
+    if message_filter is not None:
+        logging.info(f"Filtered out: {message_filter.summary()}")
+    if scan.malformed:
+        logging.info("Malformed messages: " + ", ".join(f"{reason} ({count})"
+                                                         for reason, count in scan.malformed.most_common()))
+    basis = (f"calibrated on {sum(c['messages'] for c in calibration.values())} sampled messages"
+             if calibration else "default rates")
+    logging.info(f"Projection ({basis}): PST ~{projection['pst_gb']:.2f} GB; "
+                 f"Outlook ~{format_duration(projection['seconds']['outlook'])} at {args.outlook_rate:g} msgs/sec, "
+                 f"--backend pst ~{format_duration(projection['seconds']['pst'])}")
+    logging.info(f"Manifest written to {args.manifest}")
+    return 0
+
+
+def verify_migration(mbox_path, pst_paths, folder_name="Gmail Archive", backend="outlook", outlook=None, workers=0,
+                     message_filter=None, rebuild_index=False, date_tolerance=DATE_TOLERANCE):
+    """
+    Compare the PST files of a migration (several with --shard-by) with the
+    MBOX: the items are read in bulk through folder tables, then the MBOX is
+    decoded once with the migration's own dedup and filters, and each message
+    it would have written is matched with its item (migration_verify).
+    Returns the MigrationVerifier, or None (logged).
+    """
+    verifier = MigrationVerifier(date_tolerance)
+    t0 = time.perf_counter()
+    if backend == "pst":
+        for path in pst_paths:
+            try:
+                verifier.add_items(pst_file_items(path, folder_name))
+            except (OSError, pst_file.PstError) as e:
+                logging.error(f"Could not read PST file {path}: {e}")
+                return None
+    else:
+        if outlook is None:
+            outlook = connect_outlook()
+            if outlook is None:
+                return None
+        namespace = outlook.GetNamespace("MAPI")
+        for path in pst_paths:
+            store = find_outlook_store(namespace, path)
+            if store is None:
+                logging.error(f"No Outlook store for {path}")
+                return None
+            try:
+                folder = store.GetRootFolder().Folders.Item(folder_name)
+            except Exception as e:
+                logging.error(f"Folder '{folder_name}' not found in {store.DisplayName}: {e}")
+                return None
+            verifier.add_items(outlook_items(namespace, folder, store.DisplayName))
+    logging.info(f"PST: {verifier.pst_items} items read in {time.perf_counter() - t0:.1f}s")
+
+    # The MBOX side goes through the migration's pipeline: same decoding, dedup and filters
+    t0 = time.perf_counter()
+    mbox_index = open_index(mbox_path, rebuild=rebuild_index)
+    dedup_store = DedupStore()
+    fast_path = HeaderFastPath(dedup_store, message_filter)
+    fast_path.start(mbox_index)
+    for i, prepared in iter_prepared_messages(mbox_index, 0, len(mbox_index), workers=workers, fast_path=fast_path):
+        if prepared is FILTERED:
+            continue
+        msg_hash = mbox_index.hashes[i]
+        if prepared is SKIPPED:
+            if msg_hash in dedup_store:
+                continue
+            try:
+                prepared = fast_path.prepare_skipped(i)
+            except Exception as e:
+                prepared = e
+        if isinstance(prepared, Exception):
+            verifier.unreadable_message()
+            continue
+        if msg_hash and msg_hash in dedup_store:
+            continue
+        dedup_store.add(msg_hash)
+        verifier.check(i, mbox_index.offset(i), prepared)
+        if (i + 1) % 1000 == 0:
+            logging.info(f"Verified {i + 1} / {len(mbox_index)} messages...")
+    verifier.finish()
+    logging.info(f"MBOX: {len(mbox_index)} messages decoded in {time.perf_counter() - t0:.1f}s")
+    logging.info(f"Verification: {verifier.summary()}")
+    return verifier
+
+
+def command_verify(argv, outlook=None):
+    """verify: missing, duplicated, truncated and misdated items of a PST against its MBOX."""
+    parser = argparse.ArgumentParser(prog="mbox_to_pst.py verify",
+                                     description="Vérification après migration : compare le PST au MBOX (messages "
+                                                 "manquants, en double, pièces jointes tronquées, dates erronées)")
+    parser.add_argument("mbox", help="Chemin du fichier .mbox migré")
+    parser.add_argument("pst", nargs="+",
+                        help="Fichier(s) .pst produits (plusieurs avec --shard-by ; motifs acceptés : \"sortie_*.pst\")")
+    parser.add_argument("--folder", default="Gmail Archive", help="Dossier racine de la migration dans le PST")
+    parser.add_argument("--backend", choices=BACKENDS, default="outlook",
+                        help="Lecture du PST par Outlook (défaut) ou directement dans le fichier (PST écrits avec "
+                             "--backend pst, sans Outlook)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Décoder les messages du MBOX dans N processus en parallèle")
+    parser.add_argument("--date-tolerance", type=int, default=DATE_TOLERANCE, metavar="SECONDES",
+                        help=f"Écart de date toléré entre le MBOX et le PST (défaut : {DATE_TOLERANCE} s)")
+    parser.add_argument("--report", default=VERIFY_REPORT_FILE, metavar="FICHIER.json",
+                        help=f"Rapport JSON écrit (défaut : {VERIFY_REPORT_FILE})")
+    parser.add_argument("--rebuild-index", action="store_true", help="Reconstruire l'index des positions du MBOX")
+    add_filter_arguments(parser)
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.mbox):
+        logging.error(f"MBOX file not found: {args.mbox}")
+        return 1
+    pst_paths = [path for pattern in args.pst for path in (sorted(glob.glob(pattern)) or [pattern])]
+
+    message_filter = message_filter_from_args(args)
+    if message_filter is not None:
+        logging.info(f"Message filters: {message_filter.describe()}")
+    verifier = verify_migration(args.mbox, pst_paths, args.folder, args.backend, outlook, args.workers,
+                                message_filter, args.rebuild_index, args.date_tolerance)
+    if verifier is None:
+        return 1
+    report = dict(verifier.report(), mbox=os.path.abspath(args.mbox), pst=[os.path.abspath(p) for p in pst_paths],
+                  verified_at=datetime.datetime.now().isoformat())
+    tmp_path = args.report + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, args.report)
+    for issue in ISSUES:
+        for entry in verifier.entries[issue][:5]:
+            logging.warning(f"{issue.capitalize()}: message {entry.get('index', '-')} "
+                            f"\"{entry.get('subject', '')}\" ({entry.get('message_id') or 'no Message-ID'})")
+    logging.info(f"Report written to {args.report}")
+    return 0 if verifier.ok else 1
+
+
+# Sub-commands: "mbox_to_pst.py <command> ..."; anything else is a migration
+COMMANDS = {
+    "report": command_report,
+    "scan": command_scan,
+    "sync-categories": command_sync_categories,
+    "clean-categories": command_clean_categories,
+    "batch": command_batch,
+    "verify": command_verify,
+}
 
 
 if __name__ == "__main__":
-    import argparse
+    multiprocessing.freeze_support()  # PyInstaller executable + --workers
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
     parser = argparse.ArgumentParser(description="Migration MBOX Gmail vers Outlook PST avec Catégories")
     parser.add_argument("mbox", help="Chemin du fichier .mbox")
     parser.add_argument("pst", help="Chemin du fichier .pst de sortie")
-    parser.add_argument("--folder", default="Gmail Archive", help="Nom du dossier cible dans Outlook")
-    parser.add_argument("--no-resume", action="store_false", dest="resume", help="Ne pas reprendre la migration précédente")
-    parser.add_argument("--limit", type=int, default=None, help="Limiter le nombre de messages à traiter (pour test)")
-    
+    add_migration_arguments(parser)
     args = parser.parse_args()
-    mbox_to_pst(args.mbox, args.pst, args.folder, args.resume, args.limit)
+    mbox_to_pst(args.mbox, args.pst, **migration_options(args))
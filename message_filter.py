@@ -0,0 +1,144 @@
+"""
+Message filters evaluated on header data, before any body is parsed.
+
+Takeout's "all mail including Spam and Trash" export carries messages
+nobody wants in the archive. The filters only look at what the MBOX index
+already holds for every message (Date, From, X-Gmail-Labels and the byte
+size of the message), so an excluded message costs a dictionary lookup and
+a few string tests: it is never read nor parsed.
+
+    message_filter = MessageFilter(decode_labels, after=datetime.date(2015, 1, 1),
+                                   exclude_labels=SPAM_TRASH_LABELS, max_bytes=20 * 2**20)
+    reason = message_filter.exclude(summary, size)   # None: import the message
+
+A filter can only exclude what it can judge: a message without a readable
+date is kept by a date range, one without a sender by sender patterns.
+"""
+import fnmatch
+import datetime
+from collections import Counter
+from email.utils import parseaddr, parsedate_to_datetime
+
+from mbox_index import SUMMARY_FIELDS
+
+
+# Gmail system labels of the messages in Spam / Trash (English and French exports)
+SPAM_TRASH_LABELS = ("Spam", "Trash", "Corbeille", "Pourriel")
+FILTER_REASONS = ("date", "label", "sender", "size")
+
+DATE_FIELD = SUMMARY_FIELDS.index("date")
+FROM_FIELD = SUMMARY_FIELDS.index("from")
+LABELS_FIELD = SUMMARY_FIELDS.index("labels")
+
+
+def parse_day(value):
+    """datetime.date of an ISO "YYYY-MM-DD" string; ValueError otherwise."""
+    return datetime.date.fromisoformat(value.strip())
+
+
+def sender_matches(address, pattern):
+    """
+    address (lower case) against one pattern: "*@news.example.com" style
+    wildcards, an exact address, or a bare domain ("example.com" also
+    matches its subdomains).
+    """
+    pattern = pattern.strip().lower()
+    if any(c in pattern for c in "*?["):
+        return fnmatch.fnmatchcase(address, pattern)
+    if "@" in pattern:
+        return address == pattern
+    domain = address.rpartition("@")[2]
+    return domain == pattern or domain.endswith("." + pattern)
+
+
+class MessageFilter:
+    """Include/exclude rules on the header summary of a message, with the count of each exclusion."""
+
+    def __init__(self, decode_labels, after=None, before=None, labels=(), exclude_labels=(),
+                 senders=(), exclude_senders=(), max_bytes=None):
+        self.decode_labels = decode_labels
+        utc = datetime.timezone.utc
+        # after is inclusive, before exclusive (whole days, UTC)
+        self.after = datetime.datetime.combine(after, datetime.time(), utc) if after else None
+        self.before = datetime.datetime.combine(before, datetime.time(), utc) if before else None
+        self.labels = {label.lower() for label in labels}
+        self.exclude_labels = {label.lower() for label in exclude_labels}
+        self.senders = list(senders)
+        self.exclude_senders = list(exclude_senders)
+        self.max_bytes = max_bytes
+        self.excluded = Counter()     # reason -> messages
+        self.excluded_bytes = 0
+        self._labels_cache = {}
+
+    def __bool__(self):
+        return bool(self.after or self.before or self.labels or self.exclude_labels or self.senders
+                    or self.exclude_senders or self.max_bytes)
+
+    def _message_labels(self, raw):
+        labels = self._labels_cache.get(raw)
+        if labels is None:
+            labels = self._labels_cache[raw] = {label.lower() for label in self.decode_labels(raw)}
+        return labels
+
+    def reason(self, summary, size):
+        """Why the message is excluded ("date", "label", "sender", "size"), or None to import it."""
+        if self.max_bytes and size > self.max_bytes:
+            return "size"
+        if self.labels or self.exclude_labels:
+            labels = self._message_labels(summary[LABELS_FIELD]) if summary[LABELS_FIELD] else set()
+            if labels & self.exclude_labels:
+                return "label"
+            if self.labels and not labels & self.labels:
+                return "label"
+        if self.after or self.before:
+            try:
+                date = parsedate_to_datetime(summary[DATE_FIELD]) if summary[DATE_FIELD] else None
+            except (TypeError, ValueError, IndexError):
+                date = None
+            if date is not None:
+                if date.tzinfo is None:
+                    date = date.replace(tzinfo=datetime.timezone.utc)
+                if (self.after and date < self.after) or (self.before and date >= self.before):
+                    return "date"
+        if self.senders or self.exclude_senders:
+            address = parseaddr(summary[FROM_FIELD])[1].lower()
+            if "@" in address:   # "From: Undisclosed" has no address to judge
+                if any(sender_matches(address, pattern) for pattern in self.exclude_senders):
+                    return "sender"
+                if self.senders and not any(sender_matches(address, pattern) for pattern in self.senders):
+                    return "sender"
+        return None
+
+    def exclude(self, summary, size):
+        """reason(), counting the exclusion."""
+        reason = self.reason(summary, size)
+        if reason:
+            self.excluded[reason] += 1
+            self.excluded_bytes += size
+        return reason
+
+    def describe(self):
+        """The active rules, for the log."""
+        rules = []
+        if self.after:
+            rules.append(f"from {self.after.date()}")
+        if self.before:
+            rules.append(f"before {self.before.date()}")
+        if self.labels:
+            rules.append(f"labels {', '.join(sorted(self.labels))}")
+        if self.exclude_labels:
+            rules.append(f"without labels {', '.join(sorted(self.exclude_labels))}")
+        if self.senders:
+            rules.append(f"senders {', '.join(self.senders)}")
+        if self.exclude_senders:
+            rules.append(f"not from {', '.join(self.exclude_senders)}")
+        if self.max_bytes:
+            rules.append(f"at most {self.max_bytes / 2**20:.3g} MB")
+        return "; ".join(rules)
+
+    def summary(self):
+        total = sum(self.excluded.values())
+        if not total:
+            return "no message excluded"
+        by_reason = ", ".join(f"{reason} {self.excluded[reason]}" for reason in FILTER_REASONS if self.excluded[reason])
+        return f"{total} messages excluded ({by_reason}), {self.excluded_bytes / 2**20:.1f} MB never parsed"
@@ -0,0 +1,387 @@
+"""
+Migration manifest: what an MBOX export holds, before anything is written.
+
+One streaming pass over the MBOX (no Outlook, no win32com: runs on Linux)
+counts the messages, the duplicates (same Message-ID hash as the migration's
+dedup store), the labels, the message sizes and the attachments, keeps the
+largest messages and lists the malformed entries. When the MBOX has no
+offset index yet, the same pass builds it, so the migration that follows
+starts without re-scanning the file.
+
+Duplicates, and the messages a MessageFilter excludes (same --after,
+--labels, --from... options as the migration), are only counted: labels,
+dates, sizes and attachments describe the messages the migration will
+actually import.
+
+The manifest (JSON) ends with a projection of the PST size and of the
+migration time. By default the projection uses fixed rates (DEFAULT_*); a
+stratified sample (--sample N: messages drawn from every size class, in
+proportion to its share of the export) is decoded and written to a
+throwaway PST to measure the actual PST bytes per MBOX byte and seconds per
+message of each size class, and the projection is scaled from those.
+
+    scan = MboxScan(decode_labels)
+    scan.run(mbox_path)
+    manifest = scan.manifest(project(scan, calibration))
+"""
+import time
+import heapq
+import random
+import logging
+import datetime
+from array import array
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import compat32
+from email.utils import parsedate_to_datetime
+
+from mbox_index import MboxIndex, summarize_headers, file_fingerprint, SUMMARY_FIELDS
+from mbox_scanner import MboxScanner
+from dedup_store import DedupStore
+
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = "scan_manifest.json"
+
+# Size classes (upper bounds in bytes): histograms and sampling strata
+SIZE_CLASSES = ((10 * 1024, "<10 KB"), (100 * 1024, "10-100 KB"), (1024 ** 2, "100 KB-1 MB"),
+                (5 * 1024 ** 2, "1-5 MB"), (25 * 1024 ** 2, "5-25 MB"), (None, ">=25 MB"))
+ATTACHMENT_COUNTS = ((1, "0"), (2, "1"), (3, "2"), (6, "3-5"), (11, "6-10"), (None, ">10"))
+OVERSIZED_BYTES = 25 * 1024 ** 2  # Gmail's own limit: anything above came from elsewhere and is slow to import
+TOP_LARGEST = 20
+MAX_MALFORMED = 200               # malformed entries listed (all are counted)
+PROGRESS_EVERY = 5000
+
+DATE_FIELD = SUMMARY_FIELDS.index("date")
+FROM_FIELD = SUMMARY_FIELDS.index("from")
+SUBJECT_FIELD = SUMMARY_FIELDS.index("subject")
+LABELS_FIELD = SUMMARY_FIELDS.index("labels")
+
+# Projection without a calibration sample
+DEFAULT_PST_RATIO = 0.95     # PST bytes per MBOX byte (base64 attachments are stored decoded)
+DEFAULT_OUTLOOK_RATE = 3.0   # msgs/sec through Outlook COM (2-5 observed)
+DEFAULT_PST_RATE = 250.0     # msgs/sec with --backend pst
+MIN_PER_STRATUM = 3          # sampled messages per non-empty size class
+
+
+def size_class(value, classes=SIZE_CLASSES):
+    """Position of a value in an ((exclusive upper bound, label), ...) table."""
+    for position, (bound, _) in enumerate(classes):
+        if bound is None or value < bound:
+            return position
+    return len(classes) - 1
+
+
+def message_parts(message):
+    """
+    message.walk() that does not descend into message/rfc822 parts: a
+    forwarded message is attached whole as an .eml, its own body and
+    attachments are not extracted a second time.
+    """
+    yield message
+    if message.is_multipart() and message.get_content_type() != "message/rfc822":
+        for part in message.get_payload():
+            yield from message_parts(part)
+
+
+def attachment_sizes(message):
+    """
+    Estimated decoded size of each attachment of a parsed message, with the
+    migration's rule (Content-Disposition attachment, a file name, or any
+    part that is not text/plain or text/html). Payloads are not decoded.
+    """
+    sizes = []
+    if not message.is_multipart():
+        return sizes
+    for part in message_parts(message):
+        if part.get_content_maintype() == "multipart":
+            continue
+        content_type = part.get_content_type()
+        if ("attachment" in str(part.get("Content-Disposition", "")) or part.get_filename()
+                or content_type not in ("text/plain", "text/html")):
+            payload = part.get_payload()
+            if isinstance(payload, list):
+                # Nested message: attached whole, at its own size
+                try:
+                    encoded = sum(len(nested.as_bytes()) for nested in payload)
+                except Exception:
+                    encoded = 0
+            else:
+                encoded = len(payload) if isinstance(payload, str) else 0
+            if str(part.get("Content-Transfer-Encoding", "")).strip().lower() == "base64":
+                encoded = encoded * 3 // 4
+            sizes.append(encoded)
+    return sizes
+
+
+def malformed_reasons(message, summary):
+    """Why a message would import badly or not at all (empty list if it looks fine)."""
+    reasons = []
+    if message.defects:
+        reasons.extend(sorted({type(defect).__name__ for defect in message.defects}))
+    if not message.get("Message-ID") and not message.get("Message-Id"):
+        reasons.append("no_message_id")
+    if not summary[FROM_FIELD]:
+        reasons.append("no_from")
+    if not summary[DATE_FIELD]:
+        reasons.append("no_date")
+    elif parse_date(summary[DATE_FIELD]) is None:
+        reasons.append("bad_date")
+    return reasons
+
+
+def parse_date(value):
+    try:
+        return parsedate_to_datetime(value) if value else None
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class MboxScan:
+    """Statistics of one streaming pass over an MBOX."""
+
+    def __init__(self, decode_labels, decode_header=str, top=TOP_LARGEST, message_filter=None):
+        self.decode_labels = decode_labels
+        self.decode_header = decode_header  # RFC 2047 decoding of the subjects and senders listed
+        self.top = top
+        self.message_filter = message_filter or None
+        self.mbox_path = None
+        self.index = None
+        self.index_built = False
+        self.fingerprint = None
+        self.seconds = 0.0
+        self.messages = 0
+        self.bytes = 0
+        self.duplicates = 0
+        self.duplicate_bytes = 0
+        self.filtered = 0
+        self.filtered_bytes = 0
+        self.without_message_id = 0
+        self.dedup = DedupStore()
+        self.labels = Counter()
+        self.years = Counter()
+        self.first_date = None
+        self.last_date = None
+        self.size_messages = [0] * len(SIZE_CLASSES)
+        self.size_bytes = [0] * len(SIZE_CLASSES)
+        self.attachment_counts = [0] * len(ATTACHMENT_COUNTS)
+        self.attachment_size_counts = [0] * len(SIZE_CLASSES)
+        self.attachments = 0
+        self.attachment_bytes = 0
+        self.oversized = 0
+        self.largest = []          # heap of (bytes, index, offset, summary)
+        self.malformed = Counter()     # reason -> messages
+        self.malformed_messages = 0
+        self.malformed_entries = []
+        # Messages to import (duplicates excluded), by size class: the sampling strata
+        self.strata = [array('I') for _ in SIZE_CLASSES]
+        self.stratum_bytes = [0] * len(SIZE_CLASSES)
+
+    def run(self, mbox_path, rebuild_index=False):
+        """Scan the MBOX; build and save its offset index on the way if it has none."""
+        self.mbox_path = mbox_path
+        self.fingerprint = file_fingerprint(mbox_path)
+        self.index = None if rebuild_index else MboxIndex.load(mbox_path)
+        self.index_built = self.index is None
+        if self.index_built:
+            self.index = MboxIndex(mbox_path, self.fingerprint["size"], self.fingerprint["mtime"])
+        parser = BytesParser(policy=compat32)
+        t0 = time.perf_counter()
+        with MboxScanner(mbox_path) as scanner:
+            spans = scanner.spans() if self.index_built else (self.index.span(i) for i in range(len(self.index)))
+            for i, (start, stop) in enumerate(spans):
+                if self.index_built:
+                    msg_hash, summary = summarize_headers(scanner.header_block(start, stop))
+                    self.index.starts.append(start)
+                    self.index.stops.append(stop)
+                    self.index.hashes.append(msg_hash)
+                    self.index.summaries.append(summary)
+                else:
+                    msg_hash, summary = self.index.hashes[i], self.index.summaries[i]
+                self._add(i, start, stop, msg_hash, summary, scanner, parser)
+                if (i + 1) % PROGRESS_EVERY == 0:
+                    elapsed = time.perf_counter() - t0
+                    logging.info(f"Scanned {i + 1} messages... ({start / 2**20 / elapsed:.1f} MB/s)")
+        self.seconds = time.perf_counter() - t0
+        if self.index_built:
+            try:
+                self.index.save()
+            except OSError as e:
+                logging.warning(f"Could not save MBOX index next to the MBOX: {e}")
+        logging.info(f"Scan: {self.summary()}")
+        return self
+
+    def _add(self, i, start, stop, msg_hash, summary, scanner, parser):
+        size = stop - start
+        self.messages += 1
+        self.bytes += size
+        if self.message_filter is not None and self.message_filter.exclude(summary, size):
+            # Excluded before the dedup check, as in the migration
+            self.filtered += 1
+            self.filtered_bytes += size
+            return
+        if not msg_hash:
+            self.without_message_id += 1
+        elif msg_hash in self.dedup:
+            # A duplicate is never imported: only counted
+            self.duplicates += 1
+            self.duplicate_bytes += size
+            return
+        else:
+            self.dedup.add(msg_hash)
+
+        stratum = size_class(size)
+        self.size_messages[stratum] += 1
+        self.size_bytes[stratum] += size
+        self.strata[stratum].append(i)
+        self.stratum_bytes[stratum] += size
+        if size >= OVERSIZED_BYTES:
+            self.oversized += 1
+        item = (size, i, start, summary)
+        if len(self.largest) < self.top:
+            heapq.heappush(self.largest, item)
+        elif size > self.largest[0][0]:
+            heapq.heapreplace(self.largest, item)
+
+        if summary[LABELS_FIELD]:
+            self.labels.update(set(self.decode_labels(summary[LABELS_FIELD])))
+        date = parse_date(summary[DATE_FIELD])
+        if date is not None:
+            self.years[date.year] += 1
+            naive = date.replace(tzinfo=None)
+            if self.first_date is None or naive < self.first_date:
+                self.first_date = naive
+            if self.last_date is None or naive > self.last_date:
+                self.last_date = naive
+
+        try:
+            message = parser.parsebytes(scanner.message_bytes(start, stop))
+            sizes = attachment_sizes(message)
+            reasons = malformed_reasons(message, summary)
+        except Exception as e:
+            sizes = []
+            reasons = [f"parse_error: {e}"]
+        self.attachments += len(sizes)
+        self.attachment_bytes += sum(sizes)
+        self.attachment_counts[size_class(len(sizes), ATTACHMENT_COUNTS)] += 1
+        for attachment_size in sizes:
+            self.attachment_size_counts[size_class(attachment_size)] += 1
+        if reasons:
+            self.malformed_messages += 1
+            self.malformed.update(reasons)
+            if len(self.malformed_entries) < MAX_MALFORMED:
+                self.malformed_entries.append({"index": i, "offset": start, "reasons": reasons,
+                                               "subject": self.decode_header(summary[SUBJECT_FIELD]),
+                                               "from": self.decode_header(summary[FROM_FIELD])})
+
+    @property
+    def unique(self):
+        return self.messages - self.duplicates - self.filtered
+
+    @property
+    def unique_bytes(self):
+        return self.bytes - self.duplicate_bytes - self.filtered_bytes
+
+    def summary(self):
+        filtered = f"{self.filtered} filtered out, " if self.message_filter is not None else ""
+        return (f"{self.messages} messages, {self.duplicates} duplicates, {filtered}{self.unique} to import "
+                f"({self.unique_bytes / 2**20:.1f} MB of {self.bytes / 2**20:.1f} MB), "
+                f"{self.attachments} attachments, {len(self.labels)} labels, "
+                f"{self.malformed_messages} malformed, {self.oversized} oversized "
+                f"({self.seconds:.1f}s, {self.bytes / 2**20 / self.seconds if self.seconds else 0:.1f} MB/s)")
+
+    def manifest(self, projection=None, calibration=None):
+        """The manifest as a JSON-ready dict."""
+        largest = sorted(self.largest, reverse=True)
+        return {
+            "version": MANIFEST_VERSION,
+            "mbox": dict(self.fingerprint, path=self.mbox_path),
+            "scanned_at": datetime.datetime.now().isoformat(),
+            "scan_seconds": round(self.seconds, 3),
+            "index_built": self.index_built,
+            "filters": self.message_filter.describe() if self.message_filter is not None else None,
+            "messages": {"total": self.messages, "to_import": self.unique, "duplicates": self.duplicates,
+                         "filtered": self.filtered, "without_message_id": self.without_message_id,
+                         "oversized": self.oversized},
+            "bytes": {"total": self.bytes, "to_import": self.unique_bytes,
+                      "duplicates": self.duplicate_bytes, "filtered": self.filtered_bytes},
+            "dates": {"first": self.first_date.isoformat() if self.first_date else None,
+                      "last": self.last_date.isoformat() if self.last_date else None,
+                      "by_year": {str(year): count for year, count in sorted(self.years.items())}},
+            "labels": dict(self.labels.most_common()),
+            "sizes": {label: {"messages": self.size_messages[n], "bytes": self.size_bytes[n]}
+                      for n, (_, label) in enumerate(SIZE_CLASSES)},
+            "attachments": {"total": self.attachments, "bytes": self.attachment_bytes,
+                            "per_message": {label: self.attachment_counts[n]
+                                            for n, (_, label) in enumerate(ATTACHMENT_COUNTS)},
+                            "sizes": {label: self.attachment_size_counts[n]
+                                      for n, (_, label) in enumerate(SIZE_CLASSES)}},
+            "largest": [{"index": i, "offset": offset, "bytes": size, "date": summary[DATE_FIELD],
+                         "from": self.decode_header(summary[FROM_FIELD]),
+                         "subject": self.decode_header(summary[SUBJECT_FIELD])}
+                        for size, i, offset, summary in largest],
+            "malformed": {"messages": self.malformed_messages, "reasons": dict(self.malformed.most_common()),
+                          "entries": self.malformed_entries},
+            "calibration": calibration,
+            "projection": projection,
+        }
+
+
+def stratified_sample(scan, size, seed=0):
+    """
+    Indexes of about `size` messages to import, drawn from every size class
+    in proportion to its share of the messages (at least MIN_PER_STRATUM
+    from each non-empty class). Returns {class: [indexes]}.
+    """
+    rng = random.Random(seed)
+    total = scan.unique or 1
+    sample = {}
+    for stratum, indexes in enumerate(scan.strata):
+        if not indexes:
+            continue
+        wanted = max(MIN_PER_STRATUM, round(size * len(indexes) / total))
+        sample[stratum] = sorted(rng.sample(list(indexes), min(wanted, len(indexes))))
+    return sample
+
+
+def project(scan, calibration=None, outlook_rate=DEFAULT_OUTLOOK_RATE):
+    """
+    PST size and migration time of the messages to import. calibration is
+    {class: {"messages", "mbox_bytes", "pst_bytes", "seconds"}} measured on
+    a stratified sample; size classes without one use the defaults.
+    """
+    pst_bytes = 0.0
+    pst_seconds = 0.0
+    calibrated = 0
+    for stratum, count in enumerate(scan.size_messages):
+        if not count:
+            continue
+        measured = (calibration or {}).get(stratum)
+        if measured and measured["messages"] and measured["mbox_bytes"]:
+            calibrated += count
+            pst_bytes += scan.stratum_bytes[stratum] * measured["pst_bytes"] / measured["mbox_bytes"]
+            pst_seconds += count * measured["seconds"] / measured["messages"]
+        else:
+            pst_bytes += scan.stratum_bytes[stratum] * DEFAULT_PST_RATIO
+            pst_seconds += count / DEFAULT_PST_RATE
+    outlook_seconds = scan.unique / outlook_rate if outlook_rate else None
+    return {
+        "pst_bytes": int(pst_bytes),
+        "pst_gb": round(pst_bytes / 2**30, 3),
+        "seconds": {"outlook": round(outlook_seconds, 1) if outlook_seconds is not None else None,
+                    "pst": round(pst_seconds, 1)},
+        "outlook_rate": outlook_rate,
+        "calibrated_messages": calibrated,
+        "basis": "sample" if calibrated else "defaults",
+    }
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}min{seconds % 60:02d}"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}"
@@ -0,0 +1,208 @@
+"""
+Post-migration check (`verify`): does the PST hold what the MBOX holds?
+
+Checking a migration used to mean opening messages in Outlook one by one
+(debug_image_issue.py / test_attachment.py were written to chase inline
+images that came out truncated). Here the PST side is read in bulk: the
+Message-ID, subject, date and attachment flag of every item come from the
+folder contents tables, without opening the items; only the items that
+carry attachments have their attachment table read (PstReader) or are
+opened for their attachment sizes (Outlook). The MBOX side is one streaming
+pass decoding each message exactly as the migration does (same dedup, same
+filters), and every message the migration would have written is matched to
+its item:
+
+    missing      no item with its Message-ID (or, without one, its subject
+                 and date)
+    duplicated   more than one item for the same message
+    truncated    fewer attachments than the message has, or an attachment
+                 smaller than its decoded payload
+    misdated     no date, or a date more than DATE_TOLERANCE seconds away
+                 from the message's
+
+Items matching no message of the MBOX (another import, a filtered run) are
+only counted.
+
+    verifier = MigrationVerifier()
+    verifier.add_items(pst_file_items("out.pst", "Gmail Archive"))
+    for i, start, prepared in messages:
+        verifier.check(i, start, prepared)
+    report = verifier.report()
+"""
+import logging
+from collections import Counter
+
+import pst_file
+from mbox_index import header_message_id_hash
+from outlook_categories import iter_table_rows
+
+
+VERIFY_REPORT_FILE = "verify_report.json"
+ISSUES = ("missing", "duplicated", "truncated", "misdated")
+DATE_TOLERANCE = 60   # seconds
+MAX_LISTED = 200      # entries listed per issue (all are counted)
+
+# DASL names of the Outlook table columns (values in UTC)
+PR_INTERNET_MESSAGE_ID = "http://schemas.microsoft.com/mapi/proptag/0x1035001F"
+PR_CLIENT_SUBMIT_TIME = "http://schemas.microsoft.com/mapi/proptag/0x00390040"
+PR_HASATTACH = "http://schemas.microsoft.com/mapi/proptag/0x0E1B000B"
+
+
+class PstItem:
+    """What the verification needs of one PST item."""
+    __slots__ = ('location', 'message_id', 'subject', 'timestamp', 'attachments')
+
+    def __init__(self, location, message_id, subject, date, attachments=()):
+        self.location = location            # PST file / folder path
+        self.message_id = message_id or ""
+        self.subject = subject or ""
+        self.timestamp = date.timestamp() if date is not None else None
+        self.attachments = list(attachments)  # sizes in bytes
+
+    def to_dict(self):
+        return {"location": self.location, "message_id": self.message_id, "subject": self.subject,
+                "attachments": self.attachments}
+
+
+def item_key(message_id, subject, timestamp):
+    """Match key: the Message-ID hash, or (subject, date to the second) for a message without one."""
+    msg_hash = header_message_id_hash(message_id) if message_id else 0
+    if msg_hash:
+        return msg_hash
+    return (" ".join((subject or "").split()), round(timestamp) if timestamp is not None else None)
+
+
+def pst_file_items(path, folder_name):
+    """PstItems of every message below folder_name in a PST file (PstReader: contents and attachment tables)."""
+    with pst_file.PstReader(path) as reader:
+        prefix = ["Top of Personal Folders", folder_name]
+        for folder in reader.folders():
+            if folder['path'][:2] != prefix:
+                continue
+            location = f"{path}: {'/'.join(folder['path'][1:])}"
+            for row in reader.contents_rows(folder['nid']):
+                attachments = ()
+                if (row.get(pst_file.PR_MESSAGE_FLAGS) or 0) & pst_file.MSGFLAG_HASATTACH:
+                    attachments = [attachment.get(pst_file.PR_ATTACH_SIZE) or 0
+                                   for attachment in reader.attachment_rows(row[pst_file.PR_LTP_ROW_ID])]
+                yield PstItem(location, row.get(pst_file.PR_INTERNET_MESSAGE_ID), row.get(pst_file.PR_SUBJECT),
+                              row.get(pst_file.PR_CLIENT_SUBMIT_TIME), attachments)
+
+
+def _walk_folders(folder, path):
+    yield folder, path
+    for subfolder in folder.Folders:
+        yield from _walk_folders(subfolder, f"{path}/{subfolder.Name}")
+
+
+def outlook_items(namespace, root_folder, store_name=""):
+    """
+    PstItems of every item below root_folder, read through folder tables;
+    only the items with attachments are opened (GetItemFromID), for the
+    attachment sizes.
+    """
+    columns = ("EntryID", PR_INTERNET_MESSAGE_ID, "Subject", PR_CLIENT_SUBMIT_TIME, PR_HASATTACH)
+    for folder, path in _walk_folders(root_folder, root_folder.Name):
+        store_id = folder.StoreID
+        location = f"{store_name}: {path}" if store_name else path
+        for entry_id, message_id, subject, date, has_attachments in iter_table_rows(folder, columns):
+            attachments = ()
+            if has_attachments:
+                try:
+                    item = namespace.GetItemFromID(entry_id, store_id)
+                    attachments = [attachment.Size for attachment in item.Attachments]
+                except Exception as e:
+                    logging.warning(f"Could not open item {entry_id} in {location}: {e}")
+            yield PstItem(location, message_id, subject, date if hasattr(date, "timestamp") else None, attachments)
+
+
+class MigrationVerifier:
+    """Items of the PST, matched one by one against the messages of the MBOX."""
+
+    def __init__(self, date_tolerance=DATE_TOLERANCE, max_listed=MAX_LISTED):
+        self.date_tolerance = date_tolerance
+        self.max_listed = max_listed
+        self.items = {}          # key -> [PstItem] not matched yet
+        self.pst_items = 0
+        self.expected = 0        # messages the migration would have written
+        self.matched = 0
+        self.unreadable = 0      # messages the migration could not decode either
+        self.unexpected = 0
+        self.issues = Counter()
+        self.entries = {issue: [] for issue in ISSUES}
+        self._matched_keys = set()
+
+    def add_items(self, items):
+        for item in items:
+            self.pst_items += 1
+            self.items.setdefault(item_key(item.message_id, item.subject, item.timestamp), []).append(item)
+        return self
+
+    def _record(self, issue, entry):
+        self.issues[issue] += 1
+        if len(self.entries[issue]) < self.max_listed:
+            self.entries[issue].append(entry)
+
+    def check(self, index, offset, prepared):
+        """Match one message the migration writes (a PreparedMessage) with its item."""
+        self.expected += 1
+        timestamp = prepared.date.timestamp() if prepared.date else None
+        key = item_key(prepared.message_id, prepared.subject, timestamp)
+        entry = {"index": index, "offset": offset, "message_id": prepared.message_id, "subject": prepared.subject,
+                 "date": prepared.date.isoformat() if prepared.date else None}
+        candidates = self.items.get(key)
+        if not candidates:
+            self._record("missing", entry)
+            return
+        item = candidates.pop(0)
+        self._matched_keys.add(key)
+        self.matched += 1
+        entry["location"] = item.location
+
+        if timestamp is not None and (item.timestamp is None or abs(item.timestamp - timestamp) > self.date_tolerance):
+            self._record("misdated", dict(entry, pst_date=item.timestamp,
+                                          offset_seconds=round(item.timestamp - timestamp)
+                                          if item.timestamp is not None else None))
+
+        # Empty attachments are never written: only the payloads count
+        expected = sorted((len(payload) for _, payload, _, _ in prepared.attachments if payload), reverse=True)
+        found = sorted(item.attachments, reverse=True)
+        if len(found) < len(expected) or any(size < wanted for size, wanted in zip(found, expected)):
+            self._record("truncated", dict(entry, attachments=expected, pst_attachments=found))
+
+    def unreadable_message(self):
+        """A message that does not decode: the migration could not write it either."""
+        self.unreadable += 1
+
+    def finish(self):
+        """Items left once every message is matched: copies of a matched message, or foreign items."""
+        for key, items in self.items.items():
+            for item in items:
+                if key in self._matched_keys:
+                    self._record("duplicated", item.to_dict())
+                else:
+                    self.unexpected += 1
+        self.items = {}
+        return self
+
+    @property
+    def ok(self):
+        return not any(self.issues[issue] for issue in ISSUES)
+
+    def report(self):
+        """The report as a JSON-ready dict."""
+        return {
+            "pst_items": self.pst_items,
+            "expected": self.expected,
+            "matched": self.matched,
+            "unreadable": self.unreadable,
+            "unexpected": self.unexpected,
+            "issues": {issue: self.issues[issue] for issue in ISSUES},
+            "date_tolerance": self.date_tolerance,
+            "entries": self.entries,
+        }
+
+    def summary(self):
+        issues = ", ".join(f"{self.issues[issue]} {issue}" for issue in ISSUES)
+        return (f"{self.expected} messages expected, {self.pst_items} items in the PST, {self.matched} matched; "
+                f"{issues}; {self.unexpected} items not from this MBOX, {self.unreadable} unreadable messages")
@@ -0,0 +1,295 @@
+"""
+Category maintenance on an Outlook store, without opening every item.
+
+sync_categories.ps1 walks `foreach ($item in $folder.Items)` and reads
+$item.Categories through late-bound COM: every message is opened from the
+store, which takes minutes on a 16k-item archive. Here each folder is read
+with Folder.GetTable(), restricted to two columns (EntryID and the Keywords
+property behind Categories): the store returns the rows in bulk, and no item
+is opened to find out what it carries. Only the items whose categories need
+rewriting (labels merged into one entry, stray spaces, duplicates) are then
+opened with Namespace.GetItemFromID(), fixed and saved.
+
+    sync = CategorySync(namespace)
+    sync.scan(root_folder)
+    sync.add_missing(colors)
+    sync.repair()
+
+The cleanup (manage_categories.ps1's "Nettoyage Complet") removes category
+names from the items the same way: instead of inspecting every message of
+every folder, Items.Restrict() with a DASL filter on the Keywords property
+returns only the items that may carry one of the names, and only those are
+rewritten (each Save() is its own store write; progress is logged every
+progress_every items checked):
+
+    cleanup = CategoryCleanup(["Spam", "Forums"])
+    cleanup.clean(root_folder)
+    remove_master_categories(namespace, cleanup.names)
+"""
+import re
+import time
+import logging
+from collections import Counter
+
+
+# Keywords: the multi-valued named property behind MailItem.Categories
+PR_KEYWORDS = "http://schemas.microsoft.com/mapi/string/{00020329-0000-0000-C000-000000000046}/Keywords"
+DASL_KEYWORDS = "urn:schemas-microsoft-com:office:office#Keywords"
+OL_USER_ITEMS = 0  # OlTableContents.olUserItems
+CATEGORY_SEPARATORS = re.compile(r"[;,]")
+
+FILTER_NAMES = 20  # category names per Restrict() filter (keeps the DASL query short)
+PROGRESS_EVERY = 50  # items checked between two progress lines
+REMOVE_ATTEMPTS = 5
+
+
+def category_entries(value):
+    """Keyword entries of a Categories column value (tuple from the store, or a "; " string)."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [entry.strip() for entry in value.split(";") if entry.strip()]
+    return [str(entry) for entry in value]
+
+
+def clean_categories(entries):
+    """
+    The entries as they should be stored: merged labels ("A, B" or "A; B" in
+    one entry) split apart, blanks trimmed, empty entries and duplicates dropped.
+    """
+    clean = []
+    seen = set()
+    for entry in entries:
+        for name in CATEGORY_SEPARATORS.split(entry):
+            name = name.strip()
+            if name and name.lower() not in seen:
+                seen.add(name.lower())
+                clean.append(name)
+    return clean
+
+
+def provision_master_categories(namespace, names, colors=None):
+    """
+    Add the missing names to the master category list (Outlook compares them
+    case-insensitively) and give new and existing categories the colour of
+    colors (name -> olCategoryColor), if any.
+
+    Returns (created, recolored, failed names).
+    """
+    colors = colors or {}
+    existing = {}
+    try:
+        for cat in namespace.Categories:
+            existing[cat.Name.lower()] = cat
+    except: pass
+    created = recolored = 0
+    failed = []
+    for name in sorted(names):
+        color = colors.get(name)
+        category = existing.get(name.lower())
+        try:
+            if category is None:
+                if color is None:
+                    namespace.Categories.Add(name)
+                else:
+                    namespace.Categories.Add(name, color)
+                created += 1
+                logging.debug(f"Master category added: {name}")
+            elif color is not None and category.Color != color:
+                category.Color = color
+                recolored += 1
+        except Exception as e:
+            failed.append(name)
+            logging.warning(f"Could not add category '{name}': {e}")
+    return created, recolored, failed
+
+
+def iter_folders(folder):
+    """folder and all its subfolders, depth first."""
+    yield folder
+    for subfolder in folder.Folders:
+        yield from iter_folders(subfolder)
+
+
+def iter_table_rows(folder, columns):
+    """Values of `columns` for every item of the folder, read through Folder.GetTable()."""
+    table = folder.GetTable("", OL_USER_ITEMS)
+    table.Columns.RemoveAll()
+    for column in columns:
+        table.Columns.Add(column)
+    while not table.EndOfTable:
+        yield table.GetNextRow().GetValues()
+
+
+class CategorySync:
+    """
+    Distinct categories of a folder tree, read through tables, and the items
+    whose category entries need rewriting.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.frequencies = Counter()  # category -> items carrying it
+        self.repairs = []             # (entry_id, store_id, clean entries)
+        self.folders = 0
+        self.scanned = 0
+        self.created = 0
+        self.recolored = 0
+        self.repaired = 0
+        self.errors = 0
+
+    def scan(self, root_folder):
+        """Read the categories of every item below root_folder (no item is opened)."""
+        t0 = time.perf_counter()
+        for folder in iter_folders(root_folder):
+            self.folders += 1
+            try:
+                store_id = folder.StoreID
+                for entry_id, value in iter_table_rows(folder, ("EntryID", PR_KEYWORDS)):
+                    self.scanned += 1
+                    entries = category_entries(value)
+                    if not entries:
+                        continue
+                    clean = clean_categories(entries)
+                    self.frequencies.update(clean)
+                    if clean != entries:
+                        self.repairs.append((entry_id, store_id, clean))
+            except Exception as e:
+                self.errors += 1
+                logging.warning(f"Could not read the item table of folder '{folder.Name}': {e}")
+        logging.info(f"Category scan: {self.scanned} items in {self.folders} folders, "
+                     f"{len(self.frequencies)} distinct categories, {len(self.repairs)} items to repair "
+                     f"({time.perf_counter() - t0:.2f}s)")
+
+    def add_missing(self, colors=None):
+        """Add the categories missing from the master list; colors (name -> olCategoryColor) also recolors."""
+        self.created, self.recolored, failed = provision_master_categories(self.namespace, self.frequencies, colors)
+        self.errors += len(failed)
+
+    def repair(self):
+        """Open and rewrite only the items found by scan() with merged or untidy entries."""
+        for entry_id, store_id, clean in self.repairs:
+            try:
+                item = self.namespace.GetItemFromID(entry_id, store_id)
+                item.Categories = "; ".join(clean)
+                item.Save()
+                self.repaired += 1
+                if self.repaired % 50 == 0:
+                    logging.info(f"  > {self.repaired} items repaired...")
+            except Exception as e:
+                self.errors += 1
+                logging.warning(f"Could not repair the categories of item {entry_id}: {e}")
+
+    def summary(self):
+        return (f"{self.scanned} items scanned in {self.folders} folders, {len(self.frequencies)} distinct "
+                f"categories, {self.created} added to the master list, {self.recolored} recolored, "
+                f"{self.repaired}/{len(self.repairs)} items repaired, {self.errors} errors")
+
+
+def keywords_filter(names):
+    """
+    DASL filter matching the items whose Keywords contain one of the names.
+    LIKE (substring, case-insensitive) also catches names merged into one
+    entry ("A, B"); the exact match is made on the items returned.
+    """
+    clauses = []
+    for name in names:
+        quoted = name.replace("'", "''")
+        clauses.append(f"\"{DASL_KEYWORDS}\" LIKE '%{quoted}%'")
+    return "@SQL=" + " OR ".join(clauses)
+
+
+class CategoryCleanup:
+    """
+    Remove category names from the items of a folder tree, touching only the
+    items a Restrict() filter returns.
+    """
+
+    def __init__(self, names, progress_every=PROGRESS_EVERY, dry_run=False):
+        self.names = sorted(set(names), key=str.lower)
+        self._remove = {name.lower() for name in self.names}
+        self.progress_every = progress_every
+        self.dry_run = dry_run
+        self.folders = 0
+        self.items = 0     # items in the folders cleaned
+        self.scanned = 0   # items returned by the filters (opened)
+        self.changed = 0   # items rewritten
+        self.errors = 0
+
+    def _matching_items(self, folder):
+        """Items of the folder that may carry one of the names, each once."""
+        matches = {}
+        for i in range(0, len(self.names), FILTER_NAMES):
+            for item in folder.Items.Restrict(keywords_filter(self.names[i:i + FILTER_NAMES])):
+                matches.setdefault(item.EntryID, item)
+        return list(matches.values())
+
+    def clean_folder(self, folder):
+        try:
+            self.items += folder.Items.Count
+            # Collect first: rewriting an item drops it from a live restricted collection
+            matches = self._matching_items(folder)
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"Could not filter the items of folder '{folder.Name}': {e}")
+            return
+        self.scanned += len(matches)
+        changed = 0
+        for checked, item in enumerate(matches, 1):
+            try:
+                clean = clean_categories(category_entries(item.Categories))
+                kept = [name for name in clean if name.lower() not in self._remove]
+                if len(kept) < len(clean):  # otherwise a substring match only (e.g. "Spammy" for "Spam")
+                    if not self.dry_run:
+                        item.Categories = "; ".join(kept)
+                        item.Save()
+                    changed += 1
+            except Exception as e:
+                self.errors += 1
+                logging.warning(f"Could not clean the categories of an item in '{folder.Name}': {e}")
+            if checked % self.progress_every == 0 and checked < len(matches):
+                logging.info(f"  {folder.Name}: {checked}/{len(matches)} items checked")
+        self.changed += changed
+        if changed:
+            verb = "to clean" if self.dry_run else "cleaned"
+            logging.info(f"  {folder.Name}: {changed} items {verb} ({len(matches)} matched the filter)")
+
+    def clean(self, root_folder):
+        """Clean root_folder and all its subfolders."""
+        t0 = time.perf_counter()
+        items, scanned, changed = self.items, self.scanned, self.changed
+        for folder in iter_folders(root_folder):
+            self.folders += 1
+            self.clean_folder(folder)
+        logging.info(f"Category cleanup of '{root_folder.Name}': {self.items - items} items, "
+                     f"{self.scanned - scanned} scanned, {self.changed - changed} changed "
+                     f"({time.perf_counter() - t0:.2f}s)")
+
+    def summary(self):
+        verb = "would be changed" if self.dry_run else "changed"
+        return (f"{self.items} items in {self.folders} folders, {self.scanned} scanned (filter matches), "
+                f"{self.changed} {verb}, {self.errors} errors")
+
+
+def remove_master_categories(namespace, names, attempts=REMOVE_ATTEMPTS):
+    """
+    Remove names from the master category list, retrying the ones Outlook
+    refuses at first. Returns the names still present.
+    """
+    remaining = {name.lower() for name in names}
+    for attempt in range(attempts):
+        present = [cat.Name for cat in namespace.Categories if cat.Name.lower() in remaining]
+        if not present:
+            return []
+        if attempt:
+            time.sleep(0.2)  # Outlook sometimes refuses a removal right after an item save
+        for name in present:
+            try:
+                namespace.Categories.Remove(name)
+                logging.info(f"Master category removed: {name}")
+            except Exception as e:
+                logging.debug(f"Could not remove category '{name}' (attempt {attempt + 1}): {e}")
+    left = [cat.Name for cat in namespace.Categories if cat.Name.lower() in remaining]
+    if left:
+        logging.warning(f"Could not remove from the master list after {attempts} attempts: {', '.join(left)}")
+    return left
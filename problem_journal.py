@@ -0,0 +1,110 @@
+"""
+Append-only journal of problem messages (JSON Lines).
+
+Each problem is one JSON object on its own line, appended to
+"problem_messages.jsonl": logging a problem never re-reads or rewrites the
+file, so the cost stays constant on archives with thousands of errors.
+Writes are buffered and flushed every FLUSH_EVERY records, at every
+checkpoint and on close.
+
+Crash-safe framing: a record is written with a single write() ending in a
+newline. If a crash left a torn last line, the journal starts a new line
+before appending, and readers skip lines that are not valid JSON.
+"""
+import os
+import json
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+
+FLUSH_EVERY = 50  # records buffered before they are written out
+
+REPORT_KEYS = ("type", "sender", "date")
+
+
+class ProblemJournal:
+    """Buffered, append-only JSONL writer."""
+
+    def __init__(self, path, flush_every=FLUSH_EVERY):
+        self.path = path
+        self.flush_every = flush_every
+        self._pending = []
+        self._framed = False
+
+    def _ensure_framing(self, f):
+        """Terminate a torn last line (crash during a previous write)."""
+        if self._framed:
+            return
+        self._framed = True
+        if f.tell() > 0:
+            with open(self.path, 'rb') as check:
+                check.seek(-1, os.SEEK_END)
+                if check.read(1) != b'\n':
+                    f.write("\n")
+
+    def append(self, record):
+        self._pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            self._ensure_framing(f)
+            f.write("".join(self._pending))
+        self._pending = []
+
+    def close(self):
+        self.flush()
+
+
+def iter_problems(path):
+    """Yield the records of a journal one by one, skipping torn or invalid lines."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def _month(date_str):
+    try:
+        return parsedate_to_datetime(date_str).strftime("%Y-%m")
+    except Exception:
+        return "(unknown date)"
+
+
+def report_key(record, by):
+    if by == "type":
+        return record.get("error_type") or "(unknown)"
+    if by == "sender":
+        return record.get("sender") or "(unknown sender)"
+    return _month(record.get("date") or "")
+
+
+def aggregate(path, by="type"):
+    """Stream the journal and return (total, Counter of report_key values)."""
+    counts = Counter()
+    total = 0
+    for record in iter_problems(path):
+        counts[report_key(record, by)] += 1
+        total += 1
+    return total, counts
+
+
+def print_report(path, by="type", top=20):
+    total, counts = aggregate(path, by)
+    print(f"{path}: {total} problem(s), {len(counts)} distinct by {by}")
+    items = sorted(counts.items()) if by == "date" else counts.most_common(top)
+    for key, count in items:
+        print(f"  {count:8d}  {100.0 * count / total:5.1f}%  {key}")
+    if by != "date" and len(counts) > top:
+        print(f"  ... {len(counts) - top} more")
+    return total
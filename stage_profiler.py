@@ -0,0 +1,266 @@
+"""
+Hot-path instrumentation for mbox_to_pst.py (--profile).
+
+Two kinds of measurements:
+
+- stage latencies: every stage of the pipeline (MBOX framing + MIME parse,
+  header decoding, body and attachment decoding, attachment staging,
+  Items.Add, property sets, Save, Move...) is timed with
+  `with profiler.stage(name):` into a log-scale histogram;
+- COM call counts: the Outlook application object is wrapped in a proxy
+  that counts every method call, property read and property write made
+  through it (and through every object obtained from it), e.g.
+  "MailItem.Save()", "MailItem.Subject=", "PropertyAccessor.SetProperties()".
+
+The summary is written as JSON, plus a CSV next to it, at the end of the run
+and as periodic snapshots during long runs. A disabled profiler (the
+default) costs one attribute test per stage.
+"""
+import os
+import csv
+import json
+import time
+import types
+import bisect
+import logging
+import datetime
+from collections import Counter
+from contextlib import nullcontext
+
+
+# Histogram bucket upper bounds, in seconds (the last bucket is open-ended)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SNAPSHOT_SECONDS = 60
+
+_NO_STAGE = nullcontext()
+
+
+class LatencyHistogram:
+    """Count, total, min/max and log-scale buckets of a stage's latencies."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of the samples."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self):
+        buckets = {f"<={1000 * bound:g}ms": count for bound, count in zip(BUCKETS, self.buckets) if count}
+        if self.buckets[-1]:
+            buckets[f">{1000 * BUCKETS[-1]:g}ms"] = self.buckets[-1]
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 6),
+            "mean_ms": round(1000 * self.total / self.count, 3) if self.count else 0.0,
+            "min_ms": round(1000 * (self.min or 0.0), 3),
+            "p50_ms": round(1000 * self.percentile(0.50), 3),
+            "p95_ms": round(1000 * self.percentile(0.95), 3),
+            "p99_ms": round(1000 * self.percentile(0.99), 3),
+            "max_ms": round(1000 * self.max, 3),
+            "buckets": buckets,
+        }
+
+
+class _Stage:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self.started)
+        return False
+
+
+# Objects obtained from a COM collection, and from methods/properties whose
+# name does not tell what they return
+COLLECTION_ITEMS = {"Items": "MailItem", "Folders": "Folder", "Stores": "Store",
+                    "Attachments": "Attachment", "Categories": "Category"}
+RETURN_LABELS = {"GetNamespace": "Namespace", "Session": "Namespace", "GetRootFolder": "Folder",
+                 "GetDefaultFolder": "Folder", "Parent": "Folder", "OpenSharedItem": "MailItem",
+                 "Move": "MailItem", "Copy": "MailItem"}
+_PLAIN_TYPES = (str, bytes, bool, int, float, tuple, list, dict, datetime.datetime, datetime.date)
+_METHOD_TYPES = (types.MethodType, types.FunctionType, types.BuiltinFunctionType)
+
+
+def _child_label(label, name):
+    if name in ("Add", "Item"):
+        return COLLECTION_ITEMS.get(label, name)
+    return RETURN_LABELS.get(name, name)
+
+
+def _unwrap(value):
+    return value._com_object if isinstance(value, ComCallCounter) else value
+
+
+class ComCallCounter:
+    """
+    Transparent proxy counting the calls and property accesses made on a COM
+    object. Objects it returns are wrapped as well; proxies passed back as
+    arguments are unwrapped, so COM only ever sees its own objects.
+    """
+    __slots__ = ("_com_object", "_com_label", "_com_calls")
+
+    def __init__(self, com_object, label, calls):
+        object.__setattr__(self, "_com_object", com_object)
+        object.__setattr__(self, "_com_label", label)
+        object.__setattr__(self, "_com_calls", calls)
+
+    def _wrap(self, value, label):
+        if value is None or isinstance(value, _PLAIN_TYPES) or isinstance(value, ComCallCounter):
+            return value
+        return ComCallCounter(value, label, self._com_calls)
+
+    def __getattr__(self, name):
+        value = getattr(self._com_object, name)
+        if isinstance(value, _METHOD_TYPES):
+            key = f"{self._com_label}.{name}()"
+            label = _child_label(self._com_label, name)
+            calls = self._com_calls
+
+            def method(*args, **kwargs):
+                calls[key] += 1
+                result = value(*[_unwrap(a) for a in args], **{k: _unwrap(v) for k, v in kwargs.items()})
+                return self._wrap(result, label)
+            return method
+        self._com_calls[f"{self._com_label}.{name}"] += 1
+        return self._wrap(value, _child_label(self._com_label, name))
+
+    def __setattr__(self, name, value):
+        self._com_calls[f"{self._com_label}.{name}="] += 1
+        setattr(self._com_object, name, _unwrap(value))
+
+    def __iter__(self):
+        label = COLLECTION_ITEMS.get(self._com_label, self._com_label)
+        for value in self._com_object:
+            yield self._wrap(value, label)
+
+    def __len__(self):
+        return len(self._com_object)
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        return self._com_object == _unwrap(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._com_object)
+
+
+class StageProfiler:
+    """Stage histograms + COM call counts, written as JSON/CSV when enabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.snapshot_seconds = SNAPSHOT_SECONDS
+        self.stages = {}
+        self.com_calls = Counter()
+        self.started = None
+        self._last_snapshot = 0.0
+
+    def start(self, path, snapshot_seconds=SNAPSHOT_SECONDS):
+        """Enable profiling; the summary goes to path (JSON) and path's .csv sibling."""
+        self.enabled = True
+        self.path = path
+        self.snapshot_seconds = snapshot_seconds
+        self.stages = {}
+        self.com_calls = Counter()
+        self.started = time.time()
+        self._last_snapshot = time.monotonic()
+        logging.info(f"Profiling enabled: {path} (snapshots every {snapshot_seconds:g}s)")
+
+    def stage(self, name):
+        """Context manager timing one occurrence of a stage."""
+        if not self.enabled:
+            return _NO_STAGE
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = self.stages[name] = LatencyHistogram()
+        return _Stage(histogram)
+
+    def wrap_com(self, com_object, label="Application"):
+        """Count the COM calls made through com_object (returned unchanged when disabled)."""
+        if not self.enabled or com_object is None:
+            return com_object
+        return ComCallCounter(com_object, label, self.com_calls)
+
+    def summary(self, **extra):
+        elapsed = time.time() - self.started if self.started else 0.0
+        return {
+            "started_at": datetime.datetime.fromtimestamp(self.started).isoformat() if self.started else None,
+            "elapsed_s": round(elapsed, 3),
+            **extra,
+            "stages": {name: histogram.to_dict()
+                       for name, histogram in sorted(self.stages.items(), key=lambda kv: -kv[1].total)},
+            "com_calls_total": sum(self.com_calls.values()),
+            "com_calls": dict(self.com_calls.most_common()),
+        }
+
+    def write(self, **extra):
+        """Write the JSON summary and the CSV (atomically, so snapshots can be read mid-run)."""
+        if not self.enabled:
+            return
+        summary = self.summary(**extra)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+        csv_path = os.path.splitext(self.path)[0] + ".csv"
+        with open(csv_path + ".tmp", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["kind", "name", "count", "total_s", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+            for name, stats in summary["stages"].items():
+                writer.writerow(["stage", name, stats["count"], stats["total_s"], stats["mean_ms"],
+                                 stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["max_ms"]])
+            for name, count in summary["com_calls"].items():
+                writer.writerow(["com", name, count, "", "", "", "", "", ""])
+        os.replace(csv_path + ".tmp", csv_path)
+        self._last_snapshot = time.monotonic()
+
+    def maybe_snapshot(self, **extra):
+        """Write a snapshot if snapshot_seconds have passed since the last one."""
+        if self.enabled and time.monotonic() - self._last_snapshot >= self.snapshot_seconds:
+            self.write(snapshot=True, **extra)
+
+    def log_summary(self, top=12):
+        if not self.enabled:
+            return
+        stages = sorted(self.stages.items(), key=lambda kv: -kv[1].total)[:top]
+        for name, histogram in stages:
+            stats = histogram.to_dict()
+            logging.info(f"Profile: {name:<24} {stats['count']:8d} x  mean {stats['mean_ms']:8.2f} ms  "
+                         f"p95 {stats['p95_ms']:8.2f} ms  total {stats['total_s']:8.1f}s")
+        logging.info(f"Profile: {sum(self.com_calls.values())} COM calls, written to {self.path}")
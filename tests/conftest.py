@@ -0,0 +1,27 @@
+"""
+Shared fixtures. The modules live at the repository root; the tests run on
+Linux against fake_outlook and small generated Takeout corpora.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from make_takeout_corpus import write_corpus
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in a temporary directory: checkpoints and journals are written to the current directory."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def corpus(workdir):
+    """A small synthetic Takeout MBOX (60 messages, duplicates, attachments, forwarded messages)."""
+    path = str(workdir / "corpus.mbox")
+    write_corpus(path, messages=60, seed=3, attachment_kb=(1, 8))
+    return path
@@ -0,0 +1,86 @@
+"""Back-pressure: busy errors slow the writer down and the refused write is retried."""
+import mbox_to_pst
+from backpressure import BUSY_RETRIES, BackPressure, busy_error_name
+from fake_outlook import RPC_E_CALL_REJECTED, FakeComError, FakeMailItem, FakeOutlookApplication
+
+
+def mbox(workdir, messages):
+    (workdir / "in.mbox").write_text("".join(
+        f"From {n}@xxx Mon Jan 01 00:00:00 +0000 2018\nMessage-ID: <{n}@example.com>\n"
+        f"From: a@example.com\nTo: b@example.com\nSubject: Message {n}\n"
+        f"Date: Mon, 01 Jan 2018 00:00:00 +0000\n\nBody\n\n" for n in range(messages)))
+    return "in.mbox"
+
+
+def saving_with(monkeypatch, errors):
+    """Make FakeMailItem.Save raise the given errors first; returns the list of attempts."""
+    save = FakeMailItem.Save
+    attempts = []
+
+    def failing_save(item):
+        attempts.append(item.Subject)
+        if len(attempts) <= len(errors):
+            raise errors[len(attempts) - 1]
+        save(item)
+
+    monkeypatch.setattr(FakeMailItem, "Save", failing_save)
+    return attempts
+
+
+def saved_subjects(outlook):
+    return [item.Subject for item in outlook.store("out.pst").folder("Gmail Archive").Items if item.Saved]
+
+
+def busy():
+    return FakeComError("Call was rejected by callee.", RPC_E_CALL_REJECTED)
+
+
+def test_busy_errors_are_recognised():
+    assert busy_error_name(busy()) == "RPC_E_CALL_REJECTED"
+    assert busy_error_name(FakeComError("x", 0x8001010A)) == "RPC_E_SERVERCALL_RETRYLATER"
+    assert busy_error_name(Exception(-2147352567, "Exception occurred.", (0, None, None, None, 0, -2147024882), None)) \
+        == "E_OUTOFMEMORY"
+    assert busy_error_name(FakeComError("The server is busy")) == "server is busy"
+    assert busy_error_name(FakeComError("The operation failed.", -2147467259)) is None
+
+
+def test_a_busy_error_backs_off_then_clears():
+    slept = []
+    pressure = BackPressure(sleep=slept.append)
+    pressure.record(0.01, busy())
+    pressure.pause()
+    assert slept == [pressure.initial_delay] and pressure.busy_errors == 1
+    assert pressure.should_retry(busy(), 0)
+    assert not pressure.should_retry(busy(), BUSY_RETRIES)
+    assert not pressure.should_retry(FakeComError("The operation failed."), 0)
+    assert pressure.retries == 1
+
+
+def test_a_write_refused_as_busy_is_retried(workdir, monkeypatch):
+    attempts = saving_with(monkeypatch, [busy(), busy()])
+    outlook = FakeOutlookApplication()
+    run = mbox_to_pst.mbox_to_pst(mbox(workdir, 2), "out.pst", outlook=outlook, resume=False)
+
+    assert run.errors == 0 and run.messages_processed == 2
+    assert attempts == ["Message 0"] * 3 + ["Message 1"]
+    assert saved_subjects(outlook) == ["Message 0", "Message 1"]
+    assert run.pressure.busy_errors == 2 and run.pressure.retries == 2
+
+
+def test_the_error_is_recorded_once_the_retries_run_out(workdir, monkeypatch):
+    attempts = saving_with(monkeypatch, [busy()] * (BUSY_RETRIES + 1))
+    outlook = FakeOutlookApplication()
+    run = mbox_to_pst.mbox_to_pst(mbox(workdir, 2), "out.pst", outlook=outlook, resume=False)
+
+    assert run.errors == 1 and run.messages_processed == 1
+    assert attempts == ["Message 0"] * (BUSY_RETRIES + 1) + ["Message 1"]
+    assert saved_subjects(outlook) == ["Message 1"]
+
+
+def test_ordinary_errors_are_not_retried(workdir, monkeypatch):
+    attempts = saving_with(monkeypatch, [FakeComError("The operation failed.")])
+    outlook = FakeOutlookApplication()
+    run = mbox_to_pst.mbox_to_pst(mbox(workdir, 2), "out.pst", outlook=outlook, resume=False)
+
+    assert run.errors == 1 and attempts == ["Message 0", "Message 1"]
+    assert run.pressure.retries == 0
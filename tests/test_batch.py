@@ -0,0 +1,68 @@
+"""batch: several MBOX parts into one PST, deduplicated against each other, resumed file by file."""
+import json
+import multiprocessing
+
+import pytest
+
+import mbox_to_pst
+from fake_outlook import FakeOutlookApplication
+
+
+def write_part(path, numbers):
+    path.write_text("".join(
+        f"From {n}@xxx Mon Jan 01 00:00:00 +0000 2018\nMessage-ID: <{n}@example.com>\n"
+        f"From: a@example.com\nTo: b@example.com\nSubject: Message {n}\n"
+        f"Date: Mon, 01 Jan 2018 00:00:00 +0000\n\nBody {n}\n\n" for n in numbers))
+    return str(path)
+
+
+@pytest.fixture
+def parts(workdir):
+    # Takeout parts overlap: messages 5-9 are in both
+    return [write_part(workdir / "part1.mbox", range(0, 10)), write_part(workdir / "part2.mbox", range(5, 15))]
+
+
+def subjects(outlook):
+    return [item.Subject for item in outlook.store("out.pst").folder("Gmail Archive").Items]
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_a_message_in_two_parts_is_imported_once(parts, monkeypatch, workers):
+    pools = []
+    pool = multiprocessing.Pool
+
+    def counting_pool(*args, **kwargs):
+        pools.append(args)
+        return pool(*args, **kwargs)
+
+    monkeypatch.setattr(multiprocessing, "Pool", counting_pool)
+    outlook = FakeOutlookApplication()
+    run = mbox_to_pst.mbox_to_pst_batch(parts, "out.pst", outlook=outlook, resume=False, workers=workers)
+
+    assert run.errors == 0 and run.messages_processed == 15 and run.duplicates_skipped == 5
+    assert subjects(outlook) == [f"Message {n}" for n in range(15)]
+    # One pool of worker processes indexes and decodes every file of the batch
+    assert len(pools) == (1 if workers else 0)
+
+
+def test_an_interrupted_batch_resumes_each_file_where_it_stopped(parts):
+    outlook = FakeOutlookApplication()
+    first = mbox_to_pst.mbox_to_pst_batch(parts, "out.pst", outlook=outlook, resume=False, limit=13)
+    # limit counts MBOX positions: part1, then the first 3 messages of part2 (copies of part1's)
+    assert first.messages_processed == 10 and first.duplicates_skipped == 3
+    with open(mbox_to_pst.BATCH_STATE_FILE, encoding="utf-8") as f:
+        files = json.load(f)["files"]
+    assert [files[path]["last_count"] for path in sorted(files)] == [10, 3]
+
+    resumed = mbox_to_pst.mbox_to_pst_batch(parts, "out.pst", outlook=outlook, resume=True)
+    assert resumed.errors == 0
+    # Part1 is skipped; part2 goes on at its 4th message, still deduplicated against part1
+    assert resumed.messages_processed == 5 and resumed.duplicates_skipped == 2
+    assert subjects(outlook) == [f"Message {n}" for n in range(15)]
+    with open(mbox_to_pst.BATCH_STATE_FILE, encoding="utf-8") as f:
+        files = json.load(f)["files"]
+    assert [files[path]["last_count"] for path in sorted(files)] == [10, 10]
+
+    # Everything imported: a third run writes nothing
+    again = mbox_to_pst.mbox_to_pst_batch(parts, "out.pst", outlook=outlook, resume=True)
+    assert again.messages_processed == 0 and len(subjects(outlook)) == 15
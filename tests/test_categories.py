@@ -0,0 +1,98 @@
+"""CategorySync and CategoryCleanup on the fake Outlook: only the items that need it are rewritten."""
+import logging
+
+from fake_outlook import FakeOutlookApplication
+from outlook_categories import CategoryCleanup, CategorySync
+
+
+def add_item(folder, categories):
+    item = folder.Items.Add()
+    item.Categories = categories
+    item.Save()
+    return item
+
+
+def archive_folders():
+    namespace = FakeOutlookApplication().GetNamespace("MAPI")
+    namespace.AddStore("archive.pst")
+    root = namespace.Stores.Item(1).GetRootFolder()
+    archive = root.Folders.Add("Gmail Archive")
+    return namespace, archive, archive.Folders.Add("2019")
+
+
+def test_category_sync_scans_adds_and_repairs_only_untidy_items():
+    namespace, archive, year = archive_folders()
+    namespace.Categories.Add("travail")   # already in the master list (names compare case-insensitively)
+
+    tidy = [add_item(archive, "Travail; Factures"), add_item(year, "Famille"), add_item(year, "")]
+    merged = add_item(archive, "Travail, Voyages")   # labels merged into one entry
+    untidy = add_item(year, "Famille;  Famille ; Impôts")
+
+    sync = CategorySync(namespace)
+    sync.scan(archive)
+
+    assert sync.scanned == 5 and sync.folders == 2
+    assert dict(sync.frequencies) == {"Travail": 2, "Factures": 1, "Voyages": 1, "Famille": 2, "Impôts": 1}
+    assert {entry_id for entry_id, _, _ in sync.repairs} == {merged.EntryID, untidy.EntryID}
+
+    sync.add_missing()
+    assert sorted(category.Name for category in namespace.Categories) == [
+        "Factures", "Famille", "Impôts", "Voyages", "travail"]
+    assert sync.created == 4
+
+    sync.repair()
+    assert sync.repaired == 2 and sync.errors == 0
+    assert merged.Categories == "Travail; Voyages"
+    assert untidy.Categories == "Famille; Impôts"
+    assert [item.save_count for item in tidy] == [1, 1, 1]
+    assert merged.save_count == untidy.save_count == 2
+
+
+def cleanup_items():
+    _, archive, year = archive_folders()
+    items = {
+        "spam": add_item(archive, "Spam; Travail"),
+        "merged": add_item(year, "Spam, Voyages"),       # labels merged into one entry
+        "case": add_item(year, "SPAM"),
+        "spammy": add_item(archive, "Spammy; Travail"),  # matched by LIKE '%spam%' only
+        "other": add_item(archive, "Travail"),
+    }
+    return archive, items
+
+
+def test_category_cleanup_rewrites_only_items_carrying_the_name():
+    archive, items = cleanup_items()
+    cleanup = CategoryCleanup(["Spam"])
+    cleanup.clean(archive)
+
+    assert cleanup.folders == 2 and cleanup.items == 5
+    assert cleanup.scanned == 4 and cleanup.changed == 3 and cleanup.errors == 0
+    assert items["spam"].Categories == "Travail"
+    assert items["merged"].Categories == "Voyages"
+    assert items["case"].Categories == ""
+    assert items["spammy"].Categories == "Spammy; Travail"
+    assert [items[key].save_count for key in ("spam", "merged", "case", "spammy", "other")] == [2, 2, 2, 1, 1]
+
+
+def test_category_cleanup_dry_run_changes_nothing():
+    archive, items = cleanup_items()
+    cleanup = CategoryCleanup(["spam"], dry_run=True)
+    cleanup.clean(archive)
+
+    assert cleanup.scanned == 4 and cleanup.changed == 3
+    assert "3 would be changed" in cleanup.summary()
+    assert items["merged"].Categories == "Spam, Voyages"
+    assert all(item.save_count == 1 for item in items.values())
+
+
+def test_category_cleanup_logs_progress_every_n_items(caplog):
+    _, archive, _ = archive_folders()
+    for n in range(7):
+        add_item(archive, "Spam" if n % 2 else "Spammy")
+    cleanup = CategoryCleanup(["Spam"], progress_every=3)
+    with caplog.at_level(logging.INFO):
+        cleanup.clean_folder(archive)
+
+    assert cleanup.changed == 3
+    assert [r.getMessage() for r in caplog.records if "checked" in r.getMessage()] == [
+        "  Gmail Archive: 3/7 items checked", "  Gmail Archive: 6/7 items checked"]
@@ -0,0 +1,120 @@
+"""Checkpoints: when they are taken, which MBOX they resume, and how they are written."""
+import json
+import os
+
+import pytest
+
+import mbox_to_pst
+from fake_outlook import FakeOutlookApplication
+from mbox_index import file_fingerprint
+from message_filter import MessageFilter
+
+
+def message(n, message_id, labels="Inbox", body_kb=4):
+    return (f"From {n}@xxx Mon Jan 01 00:00:00 +0000 2018\n"
+            f"X-Gmail-Labels: {labels}\nMessage-ID: <{message_id}@example.com>\n"
+            f"From: a@example.com\nTo: b@example.com\nSubject: Message {n}\n"
+            f"Date: Mon, 01 Jan 2018 00:00:00 +0000\n\n" + "x" * 1023 * body_kb + "\n\n")
+
+
+@pytest.fixture
+def saved_states(monkeypatch):
+    """The last_count of every checkpoint written."""
+    states = []
+    save_state = mbox_to_pst.save_state
+
+    def recording_save_state(state, path=mbox_to_pst.STATE_FILE):
+        states.append(state["last_count"])
+        save_state(state, path)
+
+    monkeypatch.setattr(mbox_to_pst, "save_state", recording_save_state)
+    return states
+
+
+def test_runs_of_duplicates_are_checkpointed(workdir, saved_states):
+    (workdir / "copies.mbox").write_text(message(0, "same") * 40)
+    run = mbox_to_pst.mbox_to_pst("copies.mbox", "copies.pst", outlook=FakeOutlookApplication(),
+                                  resume=False, checkpoint_mb=0.02)
+
+    assert run.messages_processed == 1 and run.duplicates_skipped == 39
+    # A checkpoint every 5 copies (20 KB), though only the first message was written
+    assert saved_states[:3] == [5, 10, 15] and saved_states[-1] == 40
+
+
+def test_runs_of_filtered_messages_are_checkpointed(workdir, saved_states):
+    messages = [message(0, "kept")] + [message(n, f"spam{n}", labels="Spam") for n in range(1, 40)]
+    (workdir / "spam.mbox").write_text("".join(messages))
+    spam = MessageFilter(mbox_to_pst.decode_labels, exclude_labels=["Spam"])
+    run = mbox_to_pst.mbox_to_pst("spam.mbox", "spam.pst", outlook=FakeOutlookApplication(),
+                                  resume=False, checkpoint_mb=0.02, message_filter=spam)
+
+    assert run.messages_processed == 1 and spam.excluded["label"] == 39
+    assert saved_states[:3] == [5, 10, 15] and saved_states[-1] == 40
+
+
+def test_resume_position_refuses_another_mbox(workdir):
+    (workdir / "a.mbox").write_text(message(0, "a") * 3)
+    (workdir / "b.mbox").write_text(message(1, "b") * 4)
+    pst = str(workdir / "out.pst")
+    state = {"last_count": 2, "mbox": dict(file_fingerprint("a.mbox"), path="a.mbox")}
+
+    assert mbox_to_pst.resume_position(state, "a.mbox", file_fingerprint("a.mbox"), pst) == 2
+    assert mbox_to_pst.resume_position(state, "b.mbox", file_fingerprint("b.mbox"), pst) is None
+    # --delta: the checkpoint of the previous import, the new file starts at its first message
+    assert mbox_to_pst.resume_position(state, "b.mbox", file_fingerprint("b.mbox"), pst, delta=True) == 0
+    assert mbox_to_pst.resume_position({}, "b.mbox", file_fingerprint("b.mbox"), pst) == 0
+
+
+def test_a_modified_mbox_is_not_resumed(workdir):
+    (workdir / "in.mbox").write_text(message(0, "a") + message(1, "b"))
+    outlook = FakeOutlookApplication()
+    assert mbox_to_pst.mbox_to_pst("in.mbox", "out.pst", outlook=outlook, resume=False, limit=1)
+
+    with open("in.mbox", "a") as f:
+        f.write(message(2, "c"))
+    assert mbox_to_pst.mbox_to_pst("in.mbox", "out.pst", outlook=outlook, resume=True) is None
+    assert len(outlook.store("out.pst").folder("Gmail Archive").Items) == 1
+
+
+def test_the_checkpoint_offset_must_match_the_index(workdir):
+    (workdir / "in.mbox").write_text(message(0, "a") + message(1, "b") + message(2, "c"))
+    outlook = FakeOutlookApplication()
+    assert mbox_to_pst.mbox_to_pst("in.mbox", "out.pst", outlook=outlook, resume=False, limit=1)
+    state = mbox_to_pst.load_state()
+    assert state["last_count"] == 1 and state["byte_offset"] == len(message(0, "a"))
+
+    state["byte_offset"] += 1
+    mbox_to_pst.save_state(state)
+    assert mbox_to_pst.mbox_to_pst("in.mbox", "out.pst", outlook=outlook, resume=True) is None
+    assert len(outlook.store("out.pst").folder("Gmail Archive").Items) == 1
+
+    state["byte_offset"] -= 1
+    mbox_to_pst.save_state(state)
+    run = mbox_to_pst.mbox_to_pst("in.mbox", "out.pst", outlook=outlook, resume=True)
+    assert run.messages_processed == 2
+    assert len(outlook.store("out.pst").folder("Gmail Archive").Items) == 3
+
+
+def test_save_state_is_atomic(workdir, monkeypatch):
+    mbox_to_pst.save_state({"last_count": 1})
+
+    def failing_dump(state, f, **kwargs):
+        f.write('{"last_count": ')
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(json, "dump", failing_dump)
+        with pytest.raises(OSError):
+            mbox_to_pst.save_state({"last_count": 2})
+
+    # The previous checkpoint is untouched; only the temp file holds the partial write
+    assert mbox_to_pst.load_state() == {"last_count": 1}
+    assert os.path.exists(mbox_to_pst.STATE_FILE + ".tmp")
+    mbox_to_pst.save_state({"last_count": 2})
+    assert mbox_to_pst.load_state() == {"last_count": 2}
+    assert not os.path.exists(mbox_to_pst.STATE_FILE + ".tmp")
+
+
+def test_an_unreadable_checkpoint_is_ignored(workdir):
+    (workdir / mbox_to_pst.STATE_FILE).write_text('{"last_count": ')
+    assert mbox_to_pst.load_state() == {}
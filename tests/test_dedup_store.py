@@ -0,0 +1,95 @@
+"""DedupStore: Message-ID hashes kept across checkpoints and resumes."""
+import os
+
+import dedup_store
+import mbox_to_pst
+import pst_file
+from dedup_store import DEDUP_MAGIC, DEDUP_VERSION, DEDUP_VERSION_SHARDS, DedupStore, _HEADER
+from mbox_index import open_index
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "out.pst.dedup")
+    store = DedupStore(path)
+    for msg_hash in (5, 2**64 - 1, 123456789, 42):
+        store.add(msg_hash)
+    store.add(0)   # no Message-ID: ignored
+    store.save()
+
+    loaded = DedupStore.load(path)
+    assert len(loaded) == 4
+    assert all(msg_hash in loaded for msg_hash in (5, 2**64 - 1, 123456789, 42))
+    assert 0 not in loaded and 6 not in loaded
+    assert loaded.shard_of(42) == 0 and loaded.shard_of(6) is None
+    assert os.listdir(tmp_path) == ["out.pst.dedup"]   # written through a temp file, renamed
+
+
+def test_shards_survive_a_round_trip(tmp_path):
+    path = str(tmp_path / "out.pst.dedup")
+    store = DedupStore(path)
+    store.add(10, 1)
+    store.add(20, 3)
+    store.add(30)
+    store.save()
+
+    loaded = DedupStore.load(path)
+    assert [loaded.shard_of(h) for h in (10, 20, 30)] == [1, 3, 0]
+    with open(path, "rb") as f:
+        assert _HEADER.unpack(f.read(_HEADER.size)) == (DEDUP_MAGIC, DEDUP_VERSION_SHARDS, 3)
+
+
+def test_recent_hashes_merge_into_the_sorted_array(monkeypatch):
+    monkeypatch.setattr(dedup_store, "MERGE_THRESHOLD", 4)
+    store = DedupStore()
+    hashes = [97, 3, 55, 21, 8, 1000, 64, 2]
+    for i, msg_hash in enumerate(hashes):
+        store.add(msg_hash, shard=i % 3)
+    store.add(55, shard=9)   # already there: the first shard is kept
+
+    assert list(store._sorted) == sorted(hashes)   # two merges of 4
+    assert len(store._recent) == 0 and len(store) == len(hashes)
+    assert all(msg_hash in store for msg_hash in hashes)
+    assert [store.shard_of(msg_hash) for msg_hash in hashes] == [i % 3 for i in range(len(hashes))]
+
+
+def test_version_1_files_still_load(tmp_path):
+    path = str(tmp_path / "old.pst.dedup")
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(DEDUP_MAGIC, DEDUP_VERSION, 3))
+        for msg_hash in (7, 11, 13):
+            f.write(msg_hash.to_bytes(8, "little"))
+
+    store = DedupStore.load(path)
+    assert len(store) == 3 and 11 in store and store.shard_of(13) == 0
+
+    # Sharding an old store upgrades it: the old hashes stay in shard 0
+    store.add(17, shard=2)
+    store.save()
+    upgraded = DedupStore.load(path)
+    assert [upgraded.shard_of(h) for h in (7, 11, 13, 17)] == [0, 0, 0, 2]
+
+
+def test_unreadable_file_gives_an_empty_store(tmp_path):
+    path = tmp_path / "bad.pst.dedup"
+    path.write_bytes(b"not a dedup store")
+    assert len(DedupStore.load(str(path))) == 0
+
+
+def test_resumed_run_skips_copies_of_messages_imported_before_the_checkpoint(corpus):
+    hashes = open_index(corpus).hashes
+    first_part = 30
+    before = set(hashes[:first_part]) - {0}
+    copies = sum(1 for msg_hash in hashes[first_part:] if msg_hash in before)
+    assert copies, "the corpus repeats messages of its first part"
+
+    first = mbox_to_pst.mbox_to_pst(corpus, "out.pst", backend="pst", resume=False, limit=first_part)
+    # A new process: only the checkpoint and the .dedup file carry what was imported
+    resumed = mbox_to_pst.mbox_to_pst(corpus, "out.pst", backend="pst", resume=True)
+
+    assert resumed.duplicates_skipped >= copies
+    with pst_file.PstReader("out.pst") as reader:
+        ids = [row.get(pst_file.PR_INTERNET_MESSAGE_ID)
+               for row in reader.contents_rows(reader.find_folder(["Gmail Archive"]))]
+    with_id = [message_id for message_id in ids if message_id]
+    assert len(with_id) == len(set(with_id))
+    assert len(ids) == first.messages_processed + resumed.messages_processed
@@ -0,0 +1,79 @@
+"""--delta: the messages already in the PST are read from the store tables and not written again."""
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+
+import mbox_to_pst
+from dedup_store import DedupStore
+from delta_import import PR_INTERNET_MESSAGE_ID, DeltaSeed, outlook_messages
+from fake_outlook import FakeOutlookApplication
+from mbox_index import header_message_id_hash
+from migration_verify import PR_CLIENT_SUBMIT_TIME
+
+
+def archive_items(outlook, pst_path="out.pst"):
+    return list(outlook.store(pst_path).folder("Gmail Archive").Items)
+
+
+def import_twice(corpus, first_limit, forget_message_ids=False):
+    """A first import of the start of the MBOX, then a delta import of all of it (fresh dedup store)."""
+    outlook = FakeOutlookApplication()
+    mbox_to_pst.mbox_to_pst(corpus, "out.pst", outlook=outlook, resume=False, limit=first_limit)
+    first = archive_items(outlook)
+    if forget_message_ids:
+        # A PST written by a version that did not set PR_INTERNET_MESSAGE_ID
+        for item in first:
+            item.PropertyAccessor.properties.pop(PR_INTERNET_MESSAGE_ID, None)
+    run = mbox_to_pst.mbox_to_pst(corpus, "out.pst", outlook=outlook, resume=False, delta=True)
+    return outlook, first, run
+
+
+def reference_items(corpus):
+    outlook = FakeOutlookApplication()
+    mbox_to_pst.mbox_to_pst(corpus, "reference.pst", outlook=outlook, resume=False)
+    return archive_items(outlook, "reference.pst")
+
+
+def test_seed_reads_message_ids_from_the_store_table():
+    namespace = FakeOutlookApplication().GetNamespace("MAPI")
+    folder = namespace.GetDefaultFolder(6)
+    date = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    for message_id in ("<a@example.com>", "<b@example.com>", None):
+        item = folder.Items.Add()
+        item.Subject = "Facture"
+        if message_id:
+            item.PropertyAccessor.properties[PR_INTERNET_MESSAGE_ID] = message_id
+        item.PropertyAccessor.properties[PR_CLIENT_SUBMIT_TIME] = date
+        item.Save()
+
+    dedup_store = DedupStore()
+    seed = DeltaSeed(dedup_store).add((*row, 0) for row in outlook_messages(folder))
+
+    assert (seed.items, seed.added, seed.without_message_id) == (3, 2, 1)
+    assert header_message_id_hash("<a@example.com>") in dedup_store
+    assert header_message_id_hash("<b@example.com>") in dedup_store
+    assert list(seed.fallback) == [("Facture", round(date.timestamp()))]
+
+
+def test_delta_import_writes_only_the_new_messages(corpus):
+    outlook, first, run = import_twice(corpus, first_limit=30)
+    items = archive_items(outlook)
+
+    assert 0 < len(first) < len(items)
+    with_id = sum(1 for item in first if item.PropertyAccessor.properties.get(PR_INTERNET_MESSAGE_ID))
+    assert run.delta.added == with_id
+    assert run.delta.matched == run.delta.without_message_id == len(first) - with_id
+    assert run.messages_processed == len(items) - len(first)
+    assert len(items) == len(reference_items(corpus))
+    ids = Counter(item.PropertyAccessor.properties.get(PR_INTERNET_MESSAGE_ID) for item in items)
+    assert [message_id for message_id, copies in ids.items() if message_id and copies > 1] == []
+
+
+def test_items_without_message_id_are_matched_on_subject_and_date(corpus, caplog):
+    with caplog.at_level(logging.WARNING):
+        outlook, first, run = import_twice(corpus, first_limit=30, forget_message_ids=True)
+
+    assert run.delta.without_message_id == len(first)
+    assert run.delta.matched == len(first)
+    assert "have no Message-ID" in caplog.text
+    assert len(archive_items(outlook)) == len(reference_items(corpus))
@@ -0,0 +1,81 @@
+"""HeaderFastPath: duplicates are dropped on the index's header data, without changing the result."""
+import pytest
+
+import mbox_to_pst
+from fake_outlook import FakeOutlookApplication
+from mbox_index import open_index
+from mbox_scanner import MboxScanner
+
+
+def duplicates(mbox_path):
+    """Indexes of the messages whose Message-ID was seen earlier in the MBOX."""
+    seen, copies = set(), set()
+    for i, msg_hash in enumerate(open_index(mbox_path).hashes):
+        if msg_hash in seen:
+            copies.add(i)
+        elif msg_hash:
+            seen.add(msg_hash)
+    return copies
+
+
+def snapshot(item):
+    return (item.Subject, item.SentOnBehalfOfName, item.To, item.Categories, item.Body, item.Sent,
+            [(attachment.FileName.rsplit(".", 1)[-1], attachment.data) for attachment in item.Attachments],
+            sorted((tag, repr(value)) for tag, value in item.PropertyAccessor.properties.items()))
+
+
+def migrate(mbox_path, pst_path, workers=0):
+    outlook = FakeOutlookApplication()
+    run = mbox_to_pst.mbox_to_pst(mbox_path, pst_path, outlook=outlook, resume=False, workers=workers)
+    assert run is not None and run.errors == 0
+    return run, [snapshot(item) for item in outlook.store(pst_path).folder("Gmail Archive").Items]
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """Start offsets of the messages read and parsed on this process."""
+    starts = []
+    message = MboxScanner.message
+
+    def recording_message(scanner, start, stop):
+        starts.append(start)
+        return message(scanner, start, stop)
+
+    monkeypatch.setattr(MboxScanner, "message", recording_message)
+    return starts
+
+
+def test_duplicates_are_never_parsed(corpus, parsed):
+    copies = duplicates(corpus)
+    assert copies, "the corpus has duplicates"
+    run, _ = migrate(corpus, "out.pst")
+
+    index = open_index(corpus)
+    parsed_messages = {i for i in range(len(index)) if index.span(i)[0] in parsed}
+    assert len(parsed) == len(parsed_messages) == len(index) - len(copies)
+    assert not parsed_messages & copies
+    assert run.fast_path.skipped == run.duplicates_skipped == len(copies)
+    assert run.fast_path.parsed == len(parsed)
+
+
+def test_the_result_matches_the_full_parse_path(corpus, monkeypatch, parsed):
+    _, fast = migrate(corpus, "fast.pst")
+    fast_parses = len(parsed)
+
+    # Full-parse path: every message is read and parsed, the writer alone drops the duplicates
+    monkeypatch.setattr(mbox_to_pst.HeaderFastPath, "skip", lambda fast_path, i: None)
+    full_run, full = migrate(corpus, "full.pst")
+
+    assert len(parsed) - fast_parses == len(open_index(corpus))
+    assert full_run.duplicates_skipped == len(duplicates(corpus))
+    assert fast == full
+
+
+def test_copies_in_flight_to_the_workers_are_not_decoded(corpus):
+    copies = duplicates(corpus)
+    run, items = migrate(corpus, "parallel.pst", workers=2)
+    _, single = migrate(corpus, "single.pst")
+
+    assert run.fast_path.skipped == run.duplicates_skipped == len(copies)
+    assert run.fast_path.parsed == len(open_index(corpus)) - len(copies)
+    assert items == single
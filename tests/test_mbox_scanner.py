@@ -0,0 +1,55 @@
+"""MboxScanner framing: spans and message bytes identical to mailbox.mbox."""
+import mailbox
+
+import pytest
+
+from make_takeout_corpus import write_corpus
+from mbox_scanner import MboxScanner
+
+
+def variants(corpus_bytes):
+    """The generated corpus as Takeout writes it, and the framing edge cases around it."""
+    return {
+        "takeout": corpus_bytes,
+        "crlf": corpus_bytes.replace(b"\n", b"\r\n"),
+        "trailing-blank-line": corpus_bytes.rstrip(b"\n") + b"\n\n\n",
+        "no-final-newline": corpus_bytes.rstrip(b"\n"),
+        "empty": b"",
+    }
+
+
+@pytest.fixture(scope="module")
+def corpus_bytes(tmp_path_factory):
+    path = tmp_path_factory.mktemp("scanner") / "corpus.mbox"
+    write_corpus(str(path), messages=40, seed=7, attachment_kb=(1, 4))
+    data = path.read_bytes()
+    assert b"\n>From " in data, "the corpus escapes body lines starting with From"
+    return data
+
+
+@pytest.mark.parametrize("variant", ["takeout", "crlf", "trailing-blank-line", "no-final-newline", "empty"])
+def test_spans_and_bytes_match_mailbox(tmp_path, corpus_bytes, variant):
+    path = tmp_path / f"{variant}.mbox"
+    path.write_bytes(variants(corpus_bytes)[variant])
+
+    mbox = mailbox.mbox(str(path), create=False)
+    try:
+        keys = mbox.keys()
+        expected = [mbox._lookup(key) for key in keys]
+        with MboxScanner(str(path)) as scanner:
+            spans = list(scanner.spans())
+            assert spans == expected
+            for key, (start, stop) in zip(keys, spans):
+                assert scanner.message_bytes(start, stop) == mbox.get_bytes(key)
+                assert scanner.message(start, stop).get_from() == mbox.get_message(key).get_from()
+    finally:
+        mbox.close()
+    assert len(spans) == (0 if variant == "empty" else 40)
+
+
+def test_spans_resume_from_a_message_offset(tmp_path, corpus_bytes):
+    path = tmp_path / "corpus.mbox"
+    path.write_bytes(corpus_bytes)
+    with MboxScanner(str(path)) as scanner:
+        spans = list(scanner.spans())
+        assert list(scanner.spans(spans[10][0])) == spans[10:]
@@ -0,0 +1,108 @@
+"""MessageFilter.reason on index summaries: date, label, sender and size rules and their edge cases."""
+import datetime
+
+import pytest
+
+from mbox_to_pst import decode_labels
+from message_filter import SPAM_TRASH_LABELS, MessageFilter, parse_day, sender_matches
+
+
+def summary(date="Mon, 01 Jan 2018 00:00:00 +0000", sender="Alice <alice@example.com>", labels="Inbox"):
+    return (date, sender, "Subject", labels)
+
+
+def message_filter(**rules):
+    return MessageFilter(decode_labels, **rules)
+
+
+@pytest.mark.parametrize("date, reason", [
+    ("Sun, 31 Dec 2017 23:59:59 +0000", "date"),
+    ("Mon, 01 Jan 2018 00:00:00 +0000", None),      # after is inclusive
+    ("Mon, 01 Jan 2018 00:30:00 +0100", "date"),    # 2017-12-31 23:30 UTC
+    ("Mon, 31 Dec 2018 23:59:59 +0000", None),
+    ("Tue, 01 Jan 2019 00:00:00 +0000", "date"),    # before is exclusive
+    ("Mon, 31 Dec 2018 20:00:00 -0500", "date"),    # 2019-01-01 01:00 UTC
+    ("Mon, 01 Jan 2018 12:00:00", None),            # no zone: taken as UTC
+])
+def test_date_bounds(date, reason):
+    in_2018 = message_filter(after=datetime.date(2018, 1, 1), before=datetime.date(2019, 1, 1))
+    assert in_2018.reason(summary(date=date), 100) == reason
+
+
+@pytest.mark.parametrize("date", ["", "not a date", "Mon, 99 Foo 2018"])
+def test_messages_without_a_readable_date_are_kept(date):
+    assert message_filter(after=datetime.date(2018, 1, 1)).reason(summary(date=date), 100) is None
+    assert message_filter(before=datetime.date(2000, 1, 1)).reason(summary(date=date), 100) is None
+
+
+def test_one_sided_date_ranges():
+    assert message_filter(after=datetime.date(2019, 1, 1)).reason(summary(), 100) == "date"
+    assert message_filter(before=datetime.date(2019, 1, 1)).reason(summary(), 100) is None
+    assert message_filter(before=datetime.date(2018, 1, 1)).reason(summary(), 100) == "date"
+
+
+def test_labels_compare_case_insensitively():
+    spam_trash = message_filter(exclude_labels=SPAM_TRASH_LABELS)
+    assert spam_trash.reason(summary(labels="Spam"), 100) == "label"
+    assert spam_trash.reason(summary(labels="Archived,TRASH"), 100) == "label"
+    assert spam_trash.reason(summary(labels="Ouvert,Corbeille"), 100) == "label"
+    assert spam_trash.reason(summary(labels='Inbox,"Spammy, old"'), 100) is None   # whole labels only
+    assert spam_trash.reason(summary(labels=""), 100) is None
+
+    work = message_filter(labels=["travail"])
+    assert work.reason(summary(labels="Inbox,Travail"), 100) is None
+    assert work.reason(summary(labels="Inbox"), 100) == "label"
+    assert work.reason(summary(labels=""), 100) == "label"   # an unlabelled message has none of them
+
+
+def test_excluded_labels_win_over_included_ones():
+    work = message_filter(labels=["Travail"], exclude_labels=["Spam"])
+    assert work.reason(summary(labels="Travail,Spam"), 100) == "label"
+
+
+@pytest.mark.parametrize("address, pattern, matches", [
+    ("news@example.com", "*@example.com", True),
+    ("news@mail.example.com", "*@example.com", False),
+    ("news@mail.example.com", "example.com", True),     # a bare domain covers its subdomains
+    ("news@badexample.com", "example.com", False),
+    ("news@example.com", "NEWS@Example.com", True),
+    ("news@example.com", "new@example.com", False),
+    ("no-reply@example.com", "no-reply@*", True),
+])
+def test_sender_patterns(address, pattern, matches):
+    assert sender_matches(address, pattern) is matches
+
+
+def test_sender_rules():
+    no_news = message_filter(exclude_senders=["*@news.example.com"])
+    assert no_news.reason(summary(sender="News <info@NEWS.example.com>"), 100) == "sender"
+    assert no_news.reason(summary(), 100) is None
+
+    only_example = message_filter(senders=["example.com"])
+    assert only_example.reason(summary(), 100) is None
+    assert only_example.reason(summary(sender="bob@other.org"), 100) == "sender"
+    assert only_example.reason(summary(sender=""), 100) is None             # no sender: kept
+    assert only_example.reason(summary(sender="Undisclosed"), 100) is None
+
+
+def test_size_limit():
+    small = message_filter(max_bytes=1000)
+    assert small.reason(summary(), 1000) is None
+    assert small.reason(summary(), 1001) == "size"
+    # The size is checked first
+    assert message_filter(max_bytes=10, exclude_labels=["Spam"]).reason(summary(labels="Spam"), 11) == "size"
+
+
+def test_exclusions_are_counted():
+    rules = message_filter(exclude_labels=["Spam"], max_bytes=1000)
+    assert not message_filter() and rules
+    for labels, size in (("Spam", 10), ("Inbox", 5000), ("Inbox", 10), ("Spam", 20)):
+        rules.exclude(summary(labels=labels), size)
+    assert dict(rules.excluded) == {"label": 2, "size": 1} and rules.excluded_bytes == 5030
+    assert rules.summary().startswith("3 messages excluded (label 2, size 1)")
+
+
+def test_parse_day():
+    assert parse_day(" 2018-01-31 ") == datetime.date(2018, 1, 31)
+    with pytest.raises(ValueError):
+        parse_day("31/01/2018")
@@ -0,0 +1,57 @@
+"""Multi-process decode pipeline (--workers): same items, same order as the single-thread path."""
+import os
+import re
+
+import mbox_to_pst
+from fake_outlook import FakeComError, FakeMailItem, FakeOutlookApplication
+
+
+def migrate(mbox_path, pst_path, workers):
+    outlook = FakeOutlookApplication()
+    run = mbox_to_pst.mbox_to_pst(mbox_path, pst_path, outlook=outlook, resume=False, workers=workers)
+    assert run is not None and run.errors == 0
+    return outlook.store(pst_path).folder("Gmail Archive").Items
+
+
+def attachment_name(filename):
+    """Unnamed attachments get a random name (attachment_<8 hex>.ext): only the extension is compared."""
+    return re.sub(r"^attachment_[0-9a-f]{8}", "attachment_*", filename)
+
+
+def snapshot(item):
+    return (item.Subject, item.SentOnBehalfOfName, item.To, item.Categories, item.Body, item.HTMLBody, item.Sent,
+            [(attachment_name(a.FileName), a.data) for a in item.Attachments],
+            sorted((tag, repr(value)) for tag, value in item.PropertyAccessor.properties.items()))
+
+
+def test_workers_write_the_same_items_in_the_same_order(corpus):
+    single = migrate(corpus, "single.pst", workers=0)
+    os.remove(mbox_to_pst.STATE_FILE)
+    parallel = migrate(corpus, "parallel.pst", workers=2)
+
+    assert len(single) > 0
+    assert [snapshot(item) for item in parallel] == [snapshot(item) for item in single]
+
+
+def test_a_message_whose_write_fails_does_not_hide_its_later_copy(workdir, monkeypatch):
+    copy = ("From 1@xxx Mon Jan 01 00:00:00 +0000 2018\n"
+            "Message-ID: <same@example.com>\nFrom: a@example.com\nTo: b@example.com\n"
+            "Subject: Copy\nDate: Mon, 01 Jan 2018 00:00:00 +0000\n\nBody\n\n")
+    (workdir / "copies.mbox").write_text(copy + copy)
+
+    save = FakeMailItem.Save
+    failures = []
+
+    def save_failing_once(item):
+        if not failures:
+            failures.append(item)
+            raise FakeComError("The operation failed.")
+        save(item)
+
+    monkeypatch.setattr(FakeMailItem, "Save", save_failing_once)
+    outlook = FakeOutlookApplication()
+    run = mbox_to_pst.mbox_to_pst("copies.mbox", "copies.pst", outlook=outlook, resume=False)
+
+    assert run.errors == 1 and run.duplicates_skipped == 0
+    saved = [item for item in outlook.store("copies.pst").folder("Gmail Archive").Items if item.Saved]
+    assert [item.Subject for item in saved] == ["Copy"]
@@ -0,0 +1,56 @@
+"""prepare_message: bodies and attachments decoded from the MIME tree."""
+from email import message_from_bytes
+
+import mbox_to_pst
+from migration_scan import attachment_sizes
+
+FORWARDED = b"""\
+From: a@example.com
+To: b@example.com
+Subject: Fwd: Contrat
+Message-ID: <outer@example.com>
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="outer"
+
+--outer
+Content-Type: text/plain; charset="utf-8"
+
+Voir ci-dessous.
+--outer
+Content-Type: message/rfc822
+Content-Disposition: attachment; filename="contrat.eml"
+
+From: c@example.com
+Subject: Contrat
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="inner"
+
+--inner
+Content-Type: text/plain; charset="utf-8"
+
+Le contrat est joint.
+--inner
+Content-Type: application/pdf; name="contrat.pdf"
+Content-Disposition: attachment; filename="contrat.pdf"
+Content-Transfer-Encoding: base64
+
+JVBERi0xLjQK
+--inner--
+--outer--
+"""
+
+
+def test_forwarded_message_is_attached_whole_and_not_walked_into():
+    prepared = mbox_to_pst.prepare_message(message_from_bytes(FORWARDED))
+
+    assert prepared.body_text == "Voir ci-dessous."
+    assert [filename for filename, _, _, _ in prepared.attachments] == ["contrat.eml"]
+    _, payload, _, content_type = prepared.attachments[0]
+    assert content_type == "message/rfc822"
+    assert b"Le contrat est joint." in payload and b"JVBERi0xLjQK" in payload
+
+
+def test_scan_counts_the_forwarded_message_as_one_attachment():
+    sizes = attachment_sizes(message_from_bytes(FORWARDED))
+
+    assert len(sizes) == 1 and sizes[0] > len(b"JVBERi0xLjQK")
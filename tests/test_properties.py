@@ -0,0 +1,63 @@
+"""PropertyBatch: the MAPI properties of an item (or attachment) in one SetProperties round trip."""
+from datetime import datetime, timezone
+
+import mbox_to_pst
+from fake_outlook import FakeMailItem, FakeOutlookApplication, FakePropertyAccessor
+
+PR_MESSAGE_FLAGS = "http://schemas.microsoft.com/mapi/proptag/0x0E070003"
+PR_ICON_INDEX = "http://schemas.microsoft.com/mapi/proptag/0x10800003"
+PR_SENDER_NAME = "http://schemas.microsoft.com/mapi/proptag/0x0C1A001F"
+PR_ATTACH_CONTENT_ID = "http://schemas.microsoft.com/mapi/proptag/0x3712001F"
+
+
+def new_item():
+    folder = FakeOutlookApplication().GetNamespace("MAPI").GetDefaultFolder(6)
+    return FakeMailItem(folder)
+
+
+def test_set_item_properties_is_one_round_trip():
+    item = new_item()
+    failures = mbox_to_pst.set_item_properties(item, datetime(2019, 5, 4, 12, 0, tzinfo=timezone.utc),
+                                               "Léa Garcia", "lea@example.com", message_id="<a@example.com>")
+
+    assert failures == {}
+    assert item.PropertyAccessor.round_trips == 1
+    properties = item.PropertyAccessor.properties
+    assert properties[PR_MESSAGE_FLAGS] == 1
+    assert properties[PR_SENDER_NAME] == "Léa Garcia"
+
+
+def test_rejected_tags_fall_back_to_set_property(monkeypatch):
+    monkeypatch.setattr(FakePropertyAccessor, "rejected_tags", {PR_ICON_INDEX})
+    item = new_item()
+    failures = mbox_to_pst.set_item_properties(item, None, "Léa Garcia", "lea@example.com")
+
+    # The batch, then one SetProperty() for the tag it reported as failed (which fails again)
+    assert list(failures) == [PR_ICON_INDEX]
+    assert item.PropertyAccessor.round_trips == 2
+    assert PR_ICON_INDEX not in item.PropertyAccessor.properties
+    assert item.PropertyAccessor.properties[PR_SENDER_NAME] == "Léa Garcia"
+
+
+def test_property_batch_retries_every_tag_when_set_properties_fails():
+    accessor = FakePropertyAccessor()
+    batch = mbox_to_pst.PropertyBatch()
+    batch.set(PR_MESSAGE_FLAGS, 1)
+    batch.set(PR_ICON_INDEX, 256)
+    batch.values.append("one value too many")   # SetProperties rejects the whole call
+
+    assert batch.apply(accessor) == {}
+    assert accessor.round_trips == 3
+    assert accessor.properties == {PR_MESSAGE_FLAGS: 1, PR_ICON_INDEX: 256}
+
+
+def test_migration_makes_one_round_trip_per_message_and_content_id(corpus):
+    outlook = FakeOutlookApplication()
+    mbox_to_pst.mbox_to_pst(corpus, "out.pst", outlook=outlook, resume=False)
+
+    items = list(outlook.store("out.pst").folder("Gmail Archive").Items)
+    inline = [attachment for item in items for attachment in item.Attachments
+              if PR_ATTACH_CONTENT_ID in attachment.PropertyAccessor.properties]
+    assert inline, "the corpus has CID inline images"
+    assert all(item.PropertyAccessor.round_trips == 1 for item in items)
+    assert outlook.property_round_trips() == len(items) + len(inline)
@@ -0,0 +1,217 @@
+"""PstWriter / PstReader round trip: what the pst backend writes is what a reader gets back."""
+from datetime import datetime, timezone
+from email import message_from_bytes
+
+import pytest
+
+import mbox_to_pst
+import pst_file
+
+MESSAGE = b"""\
+From: =?utf-8?q?L=C3=A9a_Garcia?= <lea.garcia@example.com>
+To: Paul Martin <paul.martin@example.org>, julie@example.net
+Subject: =?utf-8?q?R=C3=A9union_de_lundi?=
+Date: Sat, 04 May 2019 12:30:15 +0000
+Message-ID: <reunion-1@example.com>
+References: <thread-0@example.com> <thread-1@example.com>
+In-Reply-To: <thread-1@example.com>
+X-Gmail-Labels: Important,Travail
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="mixed"
+
+--mixed
+Content-Type: multipart/related; boundary="related"
+
+--related
+Content-Type: text/html; charset="utf-8"
+
+<p>Ordre du jour <img src="cid:logo@example.com"></p>
+--related
+Content-Type: image/gif; name="logo.gif"
+Content-ID: <logo@example.com>
+Content-Disposition: inline; filename="logo.gif"
+Content-Transfer-Encoding: base64
+
+R0lGODlhAQABAAAAACw=
+--related--
+--mixed
+Content-Type: application/pdf; name="ordre.pdf"
+Content-Disposition: attachment; filename="ordre.pdf"
+Content-Transfer-Encoding: base64
+
+JVBERi0xLjQKJeLjz9MK
+--mixed--
+"""
+
+DATE = datetime(2019, 5, 4, 12, 30, 15, tzinfo=timezone.utc)
+
+
+def prepared(subject=None, message=MESSAGE):
+    prepared = mbox_to_pst.prepare_message(message_from_bytes(message))
+    if subject:
+        prepared.subject = subject
+    return prepared
+
+
+def add(writer, folder_nid, prepared_message):
+    return writer.add_message(folder_nid, *mbox_to_pst.prepared_to_pst_properties(prepared_message))
+
+
+def read_folder(path, folder=("Gmail Archive",)):
+    with pst_file.PstReader(path) as reader:
+        folder_nid = reader.find_folder(list(folder))
+        assert folder_nid is not None
+        return list(reader.messages(folder_nid)), reader.named_property_tag(pst_file.NAME_KEYWORDS,
+                                                                              pst_file.PT_MV_UNICODE)
+
+
+def test_round_trip_of_a_prepared_message(tmp_path):
+    path = str(tmp_path / "out.pst")
+    with pst_file.PstWriter(path) as writer:
+        add(writer, writer.get_folder(["Gmail Archive"]), prepared())
+
+    (message,), keywords = read_folder(path)
+    properties = message["properties"]
+    assert properties[pst_file.PR_SUBJECT] == "Réunion de lundi"
+    assert properties[pst_file.PR_MESSAGE_FLAGS] == pst_file.MSGFLAG_READ | pst_file.MSGFLAG_HASATTACH
+    assert properties[pst_file.PR_CLIENT_SUBMIT_TIME] == DATE
+    assert properties[pst_file.PR_MESSAGE_DELIVERY_TIME] == DATE
+    assert properties[pst_file.PR_SENDER_NAME] == "Léa Garcia"
+    assert properties[pst_file.PR_SENDER_EMAIL_ADDRESS] == "lea.garcia@example.com"
+    assert properties[pst_file.PR_SENT_REPRESENTING_ADDRTYPE] == "SMTP"
+    assert properties[pst_file.PR_INTERNET_MESSAGE_ID] == "<reunion-1@example.com>"
+    assert properties[pst_file.PR_INTERNET_REFERENCES] == "<thread-0@example.com> <thread-1@example.com>"
+    assert properties[pst_file.PR_IN_REPLY_TO_ID] == "thread-1@example.com"
+    assert b"Ordre du jour" in properties[pst_file.PR_HTML]
+    assert sorted(properties[keywords]) == ["Important", "Travail"]
+
+    assert [(r[pst_file.PR_DISPLAY_NAME], r[pst_file.PR_SMTP_ADDRESS]) for r in message["recipients"]] == [
+        ("Paul Martin", "paul.martin@example.org"), ("julie@example.net", "julie@example.net")]
+
+    attachments = {a[pst_file.PR_ATTACH_LONG_FILENAME]: a for a in message["attachments"]}
+    assert attachments["logo.gif"][pst_file.PR_ATTACH_DATA_BIN] == b"GIF89a\x01\x00\x01\x00\x00\x00\x00,"
+    assert attachments["logo.gif"][pst_file.PR_ATTACH_CONTENT_ID] == "logo@example.com"
+    assert attachments["ordre.pdf"][pst_file.PR_ATTACH_DATA_BIN] == b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    assert pst_file.PR_ATTACH_CONTENT_ID not in attachments["ordre.pdf"]
+
+
+def test_large_attachment_and_body_span_several_blocks(tmp_path):
+    path = str(tmp_path / "out.pst")
+    message = prepared()
+    payload = bytes(range(256)) * 2000   # ~500 KB: an XBLOCK data tree
+    message.attachments = [("big.bin", payload, None, "application/octet-stream")]
+    message.body_html = "<p>" + "corps " * 20000 + "</p>"
+    with pst_file.PstWriter(path) as writer:
+        add(writer, writer.get_folder(["Gmail Archive"]), message)
+
+    (read,), _ = read_folder(path)
+    assert read["attachments"][0][pst_file.PR_ATTACH_DATA_BIN] == payload
+    assert read["properties"][pst_file.PR_HTML] == message.body_html.encode("utf-8")
+
+
+def test_commit_then_reopen_and_append(tmp_path):
+    path = str(tmp_path / "out.pst")
+    writer = pst_file.PstWriter(path).open()
+    archive = writer.get_folder(["Gmail Archive"])
+    add(writer, archive, prepared("Premier"))
+    writer.commit()
+
+    # The committed file is complete while the writer is still open
+    messages, _ = read_folder(path)
+    assert [m["properties"][pst_file.PR_SUBJECT] for m in messages] == ["Premier"]
+
+    add(writer, archive, prepared("Deuxième"))
+    writer.close()
+
+    # Appending to an existing file (PstWriter.open -> _load_existing)
+    with pst_file.PstWriter(path) as writer:
+        assert writer.message_count == 2
+        archive = writer.get_folder(["Gmail Archive"])
+        assert [row[pst_file.PR_SUBJECT] for row in writer.contents_rows(archive)] == ["Premier", "Deuxième"]
+        add(writer, archive, prepared("Troisième"))
+        add(writer, writer.get_folder(["2019"], archive), prepared("Rangé"))
+
+    messages, keywords = read_folder(path)
+    assert [m["properties"][pst_file.PR_SUBJECT] for m in messages] == ["Premier", "Deuxième", "Troisième"]
+    assert all(sorted(m["properties"][keywords]) == ["Important", "Travail"] for m in messages)
+    (filed,), _ = read_folder(path, ("Gmail Archive", "2019"))
+    assert filed["properties"][pst_file.PR_SUBJECT] == "Rangé"
+    with pst_file.PstReader(path) as reader:
+        counts = {tuple(f["path"]): f["count"] for f in reader.folders()}
+    assert counts[("Top of Personal Folders", "Gmail Archive")] == 3
+    assert counts[("Top of Personal Folders", "Gmail Archive", "2019")] == 1
+
+
+def test_many_commits_reuse_space_and_stay_readable(tmp_path):
+    path = str(tmp_path / "out.pst")
+    with pst_file.PstWriter(path) as writer:
+        archive = writer.get_folder(["Gmail Archive"])
+        for i in range(60):
+            add(writer, archive, prepared(f"Message {i}"))
+            if i % 5 == 4:
+                writer.commit()
+
+    messages, _ = read_folder(path)
+    assert [m["properties"][pst_file.PR_SUBJECT] for m in messages] == [f"Message {i}" for i in range(60)]
+    assert all(len(m["attachments"]) == 2 for m in messages)
+
+
+def test_libpff_reads_the_file(tmp_path):
+    """Cross-check with an independent reader (optional test dependency: pip install libpff-python)."""
+    pypff = pytest.importorskip("pypff")
+    path = str(tmp_path / "out.pst")
+    with pst_file.PstWriter(path) as writer:
+        archive = writer.get_folder(["Gmail Archive"])
+        for i in range(3):
+            add(writer, archive, prepared(f"Message {i}"))
+
+    pst = pypff.file()
+    pst.open(path)
+    try:
+        top = pst.get_root_folder().get_sub_folder(0)
+        archive = next(top.get_sub_folder(i) for i in range(top.number_of_sub_folders)
+                       if top.get_sub_folder(i).name == "Gmail Archive")
+        subjects = []
+        for i in range(archive.number_of_sub_messages):
+            message = archive.get_sub_message(i)
+            subjects.append(message.subject)
+            assert message.sender_name == "Léa Garcia"
+            assert message.client_submit_time == DATE.replace(tzinfo=None)
+            sizes = sorted(message.get_attachment(j).size for j in range(message.number_of_attachments))
+            assert sizes == [14, 15]
+        assert subjects == ["Message 0", "Message 1", "Message 2"]
+    finally:
+        pst.close()
+
+
+def test_commits_are_measured(tmp_path):
+    path = str(tmp_path / "out.pst")
+    with pst_file.PstWriter(path) as writer:
+        archive = writer.get_folder(["Gmail Archive"])
+        for i in range(10):
+            add(writer, archive, prepared(f"Message {i}"))
+            writer.commit()
+        # Each commit rewrites the whole contents table of the folder
+        assert writer.commits == 10
+        assert writer.rows_rewritten == sum(range(1, 11))
+        assert writer.commit_seconds >= writer.last_commit_seconds > 0
+
+
+def pst_commits(corpus, monkeypatch, commit_share):
+    monkeypatch.setattr(mbox_to_pst.PstFileBackend, "commit_share", commit_share)
+    commits = []
+    commit = pst_file.PstWriter.commit
+    monkeypatch.setattr(pst_file.PstWriter, "commit", lambda writer: commits.append(1) or commit(writer))
+    # A byte budget small enough to ask for a checkpoint after every message
+    run = mbox_to_pst.mbox_to_pst(corpus, "out.pst", backend="pst", resume=False, checkpoint_mb=0.000001)
+    assert run.errors == 0
+    return len(commits), run.messages_processed
+
+
+def test_checkpoints_are_spaced_by_the_commit_cost(corpus, monkeypatch):
+    every_message, written = pst_commits(corpus, monkeypatch, commit_share=1e9)
+    assert every_message > written
+
+    # A commit may only take a tiny share of the run: the budget alone no longer commits
+    spaced, written = pst_commits(corpus, monkeypatch, commit_share=1e-9)
+    assert spaced < 5
@@ -0,0 +1,123 @@
+"""scan: MboxScan counts and the projection of its manifest, on an MBOX whose contents are known."""
+import base64
+
+import pytest
+
+from mbox_scanner import MboxScanner
+from mbox_to_pst import decode_labels
+from message_filter import MessageFilter
+from migration_scan import (DEFAULT_OUTLOOK_RATE, DEFAULT_PST_RATE, DEFAULT_PST_RATIO, MboxScan, project,
+                            size_class)
+
+PDF = base64.b64encode(b"%PDF" + bytes(2996)).decode()   # 3000 bytes, one line
+
+
+def message(n, headers, body):
+    return f"From {n}@xxx Mon Jan 01 00:00:00 +0000 2018\n" + "".join(f"{h}\n" for h in headers) + "\n" + body + "\n\n"
+
+
+def multipart(parts):
+    return "".join(f"--b\n{part}\n" for part in parts) + "--b--"
+
+
+TRAVAIL = message("a", ["Message-ID: <a@example.com>", "From: Alice <alice@example.com>", "Subject: Facture",
+                        "Date: Mon, 15 Jan 2018 10:00:00 +0000", "X-Gmail-Labels: Inbox,Travail",
+                        'Content-Type: multipart/mixed; boundary="b"'],
+                  multipart(["Content-Type: text/plain\n\nVoici la facture.",
+                             "Content-Type: application/pdf; name=facture.pdf\n"
+                             "Content-Disposition: attachment; filename=facture.pdf\n"
+                             "Content-Transfer-Encoding: base64\n\n" + PDF]))
+PLAIN = message("b", ["Message-ID: <b@example.com>", "From: bob@example.com", "Subject: Salut",
+                      "Date: Tue, 10 Dec 2019 08:00:00 +0000", "X-Gmail-Labels: Inbox"], "Salut !")
+SPAM = message("d", ["From: promo@spam.example", "Subject: Gagnez", "X-Gmail-Labels: Spam",
+                     'Content-Type: multipart/mixed; boundary="b"'],
+               multipart(["Content-Type: text/plain\n\nPromo",
+                          "Content-Type: image/gif\n\nGIF89a",
+                          "Content-Type: text/plain; name=conditions.txt\n\nConditions"]))
+FORWARD = message("e", ["Message-ID: <e@example.com>", "From: carol@example.com", "Subject: Fwd: rapport",
+                        "Date: Wed, 01 Jul 2020 12:00:00 +0200", "X-Gmail-Labels: Travail",
+                        'Content-Type: multipart/mixed; boundary="b"'],
+                  multipart(["Content-Type: text/plain\n\n" + "Rapport annuel.\n" * 8000,
+                             "Content-Type: message/rfc822\n\nSubject: rapport\n\nLe rapport"]))
+# A copy of the first message (same Message-ID), then a message without Message-ID or Date
+MESSAGES = [TRAVAIL, PLAIN, TRAVAIL, SPAM, FORWARD]
+
+
+@pytest.fixture
+def mbox(workdir):
+    path = workdir / "known.mbox"
+    path.write_text("".join(MESSAGES))
+    with MboxScanner(str(path)) as scanner:
+        sizes = [stop - start for start, stop in scanner.spans()]
+    assert len(sizes) == len(MESSAGES)
+    return str(path), sizes
+
+
+def test_manifest_counts(mbox):
+    path, sizes = mbox
+    scan = MboxScan(decode_labels).run(path)
+    manifest = scan.manifest()
+
+    assert manifest["index_built"] is True
+    assert manifest["messages"] == {"total": 5, "to_import": 4, "duplicates": 1, "filtered": 0,
+                                    "without_message_id": 1, "oversized": 0}
+    assert manifest["bytes"] == {"total": sum(sizes), "to_import": sum(sizes) - sizes[2],
+                                 "duplicates": sizes[2], "filtered": 0}
+    assert manifest["dates"] == {"first": "2018-01-15T10:00:00", "last": "2020-07-01T12:00:00",
+                                 "by_year": {"2018": 1, "2019": 1, "2020": 1}}
+    assert manifest["labels"] == {"Inbox": 2, "Travail": 2, "Spam": 1}
+
+    assert size_class(sizes[4]) == 2 and all(size_class(size) == 0 for size in sizes[:4])
+    assert manifest["sizes"]["<10 KB"] == {"messages": 3, "bytes": sizes[0] + sizes[1] + sizes[3]}
+    assert manifest["sizes"]["100 KB-1 MB"] == {"messages": 1, "bytes": sizes[4]}
+    assert manifest["sizes"]["10-100 KB"] == {"messages": 0, "bytes": 0}
+
+    attachments = manifest["attachments"]
+    # facture.pdf (decoded size), the GIF and conditions.txt, the forwarded message (whole)
+    assert attachments["total"] == 4
+    assert attachments["per_message"] == {"0": 1, "1": 2, "2": 1, "3-5": 0, "6-10": 0, ">10": 0}
+    assert attachments["bytes"] == 3000 + len("GIF89a") + len("Conditions") + len("Subject: rapport\n\nLe rapport")
+    assert attachments["sizes"]["<10 KB"] == 4
+
+    assert [entry["index"] for entry in manifest["largest"]] == [4, 0, 3, 1]
+    assert manifest["largest"][0]["bytes"] == sizes[4] and manifest["largest"][0]["subject"] == "Fwd: rapport"
+    assert manifest["malformed"]["messages"] == 1
+    assert manifest["malformed"]["reasons"] == {"no_message_id": 1, "no_date": 1}
+    assert manifest["malformed"]["entries"][0]["index"] == 3
+
+    # Second scan: the index saved by the first one is used, the figures are the same
+    again = MboxScan(decode_labels).run(path).manifest()
+    assert again["index_built"] is False
+    for key in ("messages", "bytes", "dates", "labels", "sizes", "attachments", "largest", "malformed"):
+        assert again[key] == manifest[key]
+
+
+def test_filtered_messages_are_only_counted(mbox):
+    path, sizes = mbox
+    no_spam = MessageFilter(decode_labels, exclude_labels=["Spam"])
+    manifest = MboxScan(decode_labels, message_filter=no_spam).run(path).manifest()
+
+    assert manifest["filters"] == "without labels spam"
+    assert manifest["messages"]["to_import"] == 3 and manifest["messages"]["filtered"] == 1
+    assert manifest["bytes"]["filtered"] == sizes[3]
+    assert manifest["labels"] == {"Inbox": 2, "Travail": 2}
+    assert manifest["malformed"]["messages"] == 0 and manifest["attachments"]["total"] == 2
+
+
+def test_projection(mbox):
+    path, sizes = mbox
+    scan = MboxScan(decode_labels).run(path)
+    small = sizes[0] + sizes[1] + sizes[3]
+
+    defaults = project(scan)
+    assert defaults["basis"] == "defaults" and defaults["calibrated_messages"] == 0
+    assert defaults["pst_bytes"] == int(small * DEFAULT_PST_RATIO + sizes[4] * DEFAULT_PST_RATIO)
+    assert defaults["seconds"] == {"outlook": round(4 / DEFAULT_OUTLOOK_RATE, 1), "pst": round(4 / DEFAULT_PST_RATE, 1)}
+
+    # The sample measured the small messages only: the large one keeps the default rates
+    calibration = {0: {"messages": 2, "mbox_bytes": 1000, "pst_bytes": 3000, "seconds": 4.0}}
+    sampled = project(scan, calibration, outlook_rate=2.0)
+    assert sampled["basis"] == "sample" and sampled["calibrated_messages"] == 3
+    assert sampled["pst_bytes"] == int(small * 3 + sizes[4] * DEFAULT_PST_RATIO)
+    assert sampled["seconds"] == {"outlook": 2.0, "pst": round(3 * 2.0 + 1 / DEFAULT_PST_RATE, 1)}
+    assert scan.manifest(sampled, calibration)["projection"] == sampled
@@ -0,0 +1,117 @@
+"""Sharded output (--shard-by size/year) with the pst backend: routing, rollover and resume."""
+import email.utils
+import json
+import mailbox
+import os
+
+import mbox_to_pst
+import pst_file
+from dedup_store import DedupStore, dedup_path_for
+from mbox_index import message_id_hash
+
+SHARD_GB = 0.0001   # ~105 KB: the 60-message corpus spreads over a few shards
+
+
+def shard_contents(path):
+    """Message-IDs of the items of a shard, in order."""
+    with pst_file.PstReader(path) as reader:
+        return [row.get(pst_file.PR_INTERNET_MESSAGE_ID)
+                for row in reader.contents_rows(reader.find_folder(["Gmail Archive"]))]
+
+
+def shard_files(workdir, stem):
+    return sorted(name for name in os.listdir(workdir) if name.startswith(stem + "_") and name.endswith(".pst"))
+
+
+def test_size_shards_roll_over_at_the_size_limit(corpus, workdir):
+    run = mbox_to_pst.mbox_to_pst(corpus, "out.pst", backend="pst", resume=False, shard_size_gb=SHARD_GB)
+
+    names = shard_files(workdir, "out")
+    assert names == [f"out_{n:03d}.pst" for n in range(1, len(names) + 1)] and len(names) >= 3
+    max_bytes = int(SHARD_GB * 2**30)
+    # Every shard but the last was full when the next one started
+    assert all(os.path.getsize(workdir / name) >= max_bytes for name in names[:-1])
+    contents = {n: shard_contents(workdir / name) for n, name in enumerate(names, 1)}
+    assert sum(len(ids) for ids in contents.values()) == run.messages_processed
+
+    # The dedup store knows the shard of every message
+    store = DedupStore.load(dedup_path_for(os.path.abspath("out.pst")))
+    for shard, ids in contents.items():
+        assert {store.shard_of(message_id_hash(message_id)) for message_id in ids if message_id} == {shard}
+
+
+def test_year_shards_hold_the_messages_of_their_year(corpus, workdir):
+    undated = ("From x@xxx Thu Jan 01 00:00:00 +0000 1970\nMessage-ID: <undated@example.com>\n"
+               "From: a@example.com\nTo: b@example.com\nSubject: No date\n\nBody\n\n")
+    with open(corpus, "a") as f:
+        f.write(undated)
+    years = {}
+    for message in mailbox.mbox(corpus):
+        if message["Message-ID"]:
+            date = message["Date"]
+            years[message["Message-ID"].strip()] = email.utils.parsedate_to_datetime(date).year if date else "undated"
+
+    mbox_to_pst.mbox_to_pst(corpus, "out.pst", backend="pst", resume=False, shard_by="year")
+
+    names = shard_files(workdir, "out")
+    assert "out_undated.pst" in names and len(names) > 5
+    for name in names:
+        year = name[len("out_"):-len(".pst")]
+        ids = [message_id for message_id in shard_contents(workdir / name) if message_id]
+        assert ids and {str(years[message_id]) for message_id in ids} == {year}
+    with open(mbox_to_pst.STATE_FILE, encoding="utf-8") as f:
+        state = json.load(f)
+    assert state["shards"]["mode"] == "year" and len(state["shards"]["paths"]) == len(names)
+
+
+def test_a_resumed_run_carries_on_with_the_current_shard(corpus, workdir):
+    first = mbox_to_pst.mbox_to_pst(corpus, "out.pst", backend="pst", resume=False, shard_size_gb=SHARD_GB,
+                                    limit=30)
+    with open(mbox_to_pst.STATE_FILE, encoding="utf-8") as f:
+        saved = json.load(f)["shards"]
+    before = {name: shard_contents(workdir / name) for name in shard_files(workdir, "out")}
+    assert saved["current"] == len(before) and len(saved["paths"]) == len(before)
+
+    resumed = mbox_to_pst.mbox_to_pst(corpus, "out.pst", backend="pst", resume=True, shard_size_gb=SHARD_GB)
+
+    after = {name: shard_contents(workdir / name) for name in shard_files(workdir, "out")}
+    # The full shards are untouched, the current one received the next messages
+    for name, ids in before.items():
+        assert after[name][:len(ids)] == ids
+    last = sorted(before)[-1]
+    assert len(after[last]) > len(before[last])
+    written = [message_id for ids in after.values() for message_id in ids]
+    assert len(written) == first.messages_processed + resumed.messages_processed
+    ids = [message_id for message_id in written if message_id]
+    assert len(ids) == len(set(ids))
+
+
+def test_restore_shards_ignores_a_checkpoint_of_another_mode(workdir):
+    sharded = mbox_to_pst.ShardedBackend("out.pst", mbox_to_pst.PstFileBackend, "size", 1000,
+                                         folder_name="Gmail Archive")
+    saved = {"mode": "size", "max_bytes": 1000, "current": 3,
+             "paths": {"1": "/archive/out_001.pst", "3": "/archive/out_003.pst"}}
+    sharded.restore_shards(saved)
+    assert sharded.current == 3 and sharded.paths == {1: "/archive/out_001.pst", 3: "/archive/out_003.pst"}
+    assert sharded.shards() == dict(saved, paths={"1": "/archive/out_001.pst", "3": "/archive/out_003.pst"})
+
+    by_year = mbox_to_pst.ShardedBackend("out.pst", mbox_to_pst.PstFileBackend, "year",
+                                         folder_name="Gmail Archive")
+    by_year.restore_shards(saved)
+    assert by_year.paths == {} and by_year.current is None
+    by_year.restore_shards(None)
+    assert by_year.paths == {}
+
+
+def test_existing_shards_are_found_by_name(workdir):
+    for name in ("out_001.pst", "out_002.pst", "out_2019.pst", "out_undated.pst", "out_x.pst", "outer_001.pst",
+                 "out.pst", "other_003.pst", "out_001.pst.dedup"):
+        (workdir / name).write_bytes(b"")
+
+    def existing(mode):
+        sharded = mbox_to_pst.ShardedBackend("out.pst", mbox_to_pst.PstFileBackend, mode, folder_name="Gmail Archive")
+        return [(shard, os.path.basename(path)) for shard, path in sharded._existing_shards()]
+
+    # "size" names are 3-digit numbers; "year" names are years or "undated" (an "out_001.pst" is not year 1)
+    assert existing("size") == [(1, "out_001.pst"), (2, "out_002.pst"), (2019, "out_2019.pst")]
+    assert existing("year") == [(mbox_to_pst.UNDATED_SHARD, "out_undated.pst"), (2019, "out_2019.pst")]
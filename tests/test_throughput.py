@@ -0,0 +1,37 @@
+"""ThroughputTimeline: per-window rates and the end-of-run summary."""
+from throughput import ThroughputTimeline
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(messages, window=500, seconds_per_message=0.01):
+    clock = Clock()
+    timeline = ThroughputTimeline(window=window, clock=clock)
+    timeline.begin()
+    for _ in range(messages):
+        clock.now += seconds_per_message
+        timeline.record()
+    timeline.finish()
+    return timeline
+
+
+def test_summary_reports_the_messages_written_and_the_partial_window():
+    summary = run(386).summary()
+    assert summary.startswith("386 messages in a partial window of 386, first 100.00 msgs/sec")
+
+
+def test_summary_counts_complete_windows_and_the_trailing_partial_one():
+    timeline = run(1100)
+    assert [messages for _, messages, _ in timeline.windows] == [500, 500, 100]
+    assert timeline.summary().startswith("1100 messages in 2 windows of 500 and a partial window of 100, ")
+
+
+def test_summary_of_complete_windows_only():
+    assert run(500).summary().startswith("500 messages in 1 window of 500, ")
+    assert run(0).summary() == "no message written"
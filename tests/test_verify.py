@@ -0,0 +1,127 @@
+"""verify: a PST checked against its MBOX, item by item."""
+import datetime
+
+import pytest
+
+import mbox_to_pst
+import pst_file
+from mbox_index import header_message_id_hash, open_index
+from mbox_scanner import MboxScanner
+from migration_verify import MigrationVerifier, PstItem, item_key
+
+
+def prepared_messages(mbox_path):
+    """(index, PreparedMessage) of the messages a migration writes: the first copy of each Message-ID."""
+    index = open_index(mbox_path)
+    seen = set()
+    with MboxScanner(mbox_path) as scanner:
+        for i in range(len(index)):
+            msg_hash = index.hashes[i]
+            if msg_hash and msg_hash in seen:
+                continue
+            seen.add(msg_hash)
+            start, stop = index.span(i)
+            yield i, mbox_to_pst.prepare_message(scanner.message(start, stop), i, stop)
+
+
+def write_pst(path, prepared_list):
+    writer = pst_file.PstWriter(path).open()
+    folder = writer.get_folder(["Gmail Archive"])
+    for prepared in prepared_list:
+        writer.add_message(folder, *mbox_to_pst.prepared_to_pst_properties(prepared))
+    writer.close()
+
+
+def verify(mbox_path, pst_path):
+    verifier = mbox_to_pst.verify_migration(mbox_path, [pst_path], backend="pst")
+    assert verifier is not None
+    return verifier
+
+
+def test_a_clean_migration_verifies(corpus):
+    run = mbox_to_pst.mbox_to_pst(corpus, "out.pst", backend="pst", resume=False)
+    verifier = verify(corpus, "out.pst")
+
+    assert verifier.ok, verifier.summary()
+    assert verifier.expected == verifier.matched == verifier.pst_items == run.messages_processed
+    assert verifier.unexpected == verifier.unreadable == 0
+
+
+def test_a_doctored_pst_reports_each_issue(corpus):
+    messages = list(prepared_messages(corpus))
+    with_id = [(i, prepared) for i, prepared in messages if prepared.message_id]
+    with_attachments = [(i, prepared) for i, prepared in with_id if any(p for _, p, _, _ in prepared.attachments)]
+    assert len(with_id) < len(messages), "the corpus has messages without Message-ID"
+    missing, duplicated, misdated = with_id[0], with_id[1], with_id[2]
+    dropped, halved = with_attachments[-1], with_attachments[-2]
+
+    doctored = []
+    for i, prepared in messages:
+        if i == missing[0]:
+            continue
+        if i == duplicated[0]:
+            doctored.append(prepared)
+        if i == misdated[0]:
+            prepared.date += datetime.timedelta(hours=2)
+        if i == dropped[0]:
+            prepared.attachments = []
+        if i == halved[0]:
+            prepared.attachments = [(name, payload[:len(payload) // 2], cid, content_type)
+                                    for name, payload, cid, content_type in prepared.attachments]
+        doctored.append(prepared)
+    foreign = mbox_to_pst.prepare_message(mbox_to_pst.message_from_bytes(
+        b"Message-ID: <foreign@example.com>\nSubject: Another import\n\nBody\n"))
+    doctored.append(foreign)
+    write_pst("doctored.pst", doctored)
+
+    verifier = verify(corpus, "doctored.pst")
+    report = verifier.report()
+    assert not verifier.ok
+    assert report["issues"] == {"missing": 1, "duplicated": 1, "truncated": 2, "misdated": 1}
+    assert report["pst_items"] == len(messages) + 1
+    assert report["expected"] == len(messages) and report["matched"] == len(messages) - 1
+    assert report["unexpected"] == 1
+
+    entries = report["entries"]
+    assert [entry["index"] for entry in entries["missing"]] == [missing[0]]
+    assert [entry["message_id"] for entry in entries["duplicated"]] == [duplicated[1].message_id]
+    assert entries["misdated"][0]["index"] == misdated[0] and entries["misdated"][0]["offset_seconds"] == 7200
+    truncated = {entry["index"]: entry for entry in entries["truncated"]}
+    assert set(truncated) == {dropped[0], halved[0]}
+    assert truncated[dropped[0]]["pst_attachments"] == []
+    assert sum(truncated[halved[0]]["pst_attachments"]) < sum(truncated[halved[0]]["attachments"])
+
+
+def test_messages_without_message_id_match_on_subject_and_date():
+    date = datetime.datetime(2018, 3, 1, 9, 30, 0, 400000, tzinfo=datetime.timezone.utc)
+    assert item_key("", "  Compte   rendu ", date.timestamp()) == ("Compte rendu", round(date.timestamp()))
+    assert item_key(None, "Sans date", None) == ("Sans date", None)
+    assert item_key("<a@example.com>", "Compte rendu", date.timestamp()) == header_message_id_hash("<a@example.com>")
+
+    def prepared(subject, when):
+        message = mbox_to_pst.PreparedMessage()
+        message.subject, message.date, message.message_id = subject, when, ""
+        return message
+
+    verifier = MigrationVerifier().add_items([
+        PstItem("out.pst: Gmail Archive", "", "Compte  rendu", date),
+        PstItem("out.pst: Gmail Archive", "", "Compte rendu", date + datetime.timedelta(hours=1)),
+    ])
+    verifier.check(0, 0, prepared("Compte rendu", date))          # same subject (blanks aside) and second
+    verifier.check(1, 100, prepared("Compte rendu", date - datetime.timedelta(days=1)))
+    verifier.finish()
+
+    assert verifier.matched == 1 and verifier.issues["missing"] == 1 and verifier.issues["misdated"] == 0
+    # The item an hour later is another message as far as the key is concerned
+    assert verifier.unexpected == 1
+
+
+@pytest.mark.parametrize("tolerance, misdated", [(60, 0), (10, 1)])
+def test_date_tolerance(tolerance, misdated):
+    date = datetime.datetime(2018, 3, 1, 9, 30, tzinfo=datetime.timezone.utc)
+    message = mbox_to_pst.PreparedMessage()
+    message.subject, message.date, message.message_id = "Compte rendu", date, "<a@example.com>"
+    verifier = MigrationVerifier(date_tolerance=tolerance).add_items([
+        PstItem("out.pst: Gmail Archive", "<a@example.com>", "Compte rendu", date + datetime.timedelta(seconds=30))])
+    verifier.check(0, 0, message)
+    assert verifier.issues["misdated"] == misdated
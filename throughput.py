@@ -0,0 +1,89 @@
+"""
+Write throughput over the course of a run.
+
+The "Processed N messages... (x msgs/sec)" progress line is an average since
+the start of the session: a writer that slows down as its target folder
+fills up hides behind the fast first thousands of messages. The timeline
+measures each window of WINDOW_MESSAGES written messages separately, logs
+every window, and sums them up at the end (first vs last window), so a flat
+run, or a drift, shows directly in migration.log and in the --profile JSON.
+"""
+import time
+import logging
+
+
+WINDOW_MESSAGES = 500
+
+
+class ThroughputTimeline:
+    """Messages per second of each window of `window` written messages."""
+
+    def __init__(self, window=WINDOW_MESSAGES, clock=time.perf_counter):
+        self.window = window
+        self._clock = clock
+        self.windows = []      # (first message, messages, seconds)
+        self.written = 0
+        self._window_start = None
+        self._window_first = 0
+        self._window_seconds = 0.0
+
+    def begin(self):
+        """(Re)start the clock, e.g. at the start of each MBOX: time spent between files is not counted."""
+        self._window_start = self._clock()
+
+    def pause(self):
+        """Stop the clock (end of an MBOX) without closing the current window."""
+        if self._window_start is not None:
+            self._window_seconds += self._clock() - self._window_start
+            self._window_start = None
+
+    def record(self):
+        """One more message written."""
+        if self._window_start is None:
+            self.begin()
+        self.written += 1
+        if self.written - self._window_first >= self.window:
+            self._close_window()
+            rate = self.rate(self.windows[-1])
+            logging.info(f"Throughput: messages {self._window_first - self.window + 1}-{self._window_first}: "
+                         f"{rate:.2f} msgs/sec")
+
+    def _close_window(self):
+        now = self._clock()
+        seconds = self._window_seconds + (now - self._window_start if self._window_start is not None else 0.0)
+        self.windows.append((self._window_first, self.written - self._window_first, seconds))
+        self._window_first = self.written
+        self._window_seconds = 0.0
+        if self._window_start is not None:
+            self._window_start = now
+
+    def finish(self):
+        """Close the last, partial window."""
+        self.pause()
+        if self.written > self._window_first:
+            self._close_window()
+
+    @staticmethod
+    def rate(window):
+        _, messages, seconds = window
+        return messages / seconds if seconds > 0 else 0.0
+
+    def to_list(self):
+        """Windows for the --profile JSON."""
+        return [{"first": first + 1, "messages": messages, "seconds": round(seconds, 3),
+                 "rate": round(self.rate((first, messages, seconds)), 3)}
+                for first, messages, seconds in self.windows]
+
+    def summary(self):
+        if not self.windows:
+            return "no message written"
+        rates = [self.rate(window) for window in self.windows]
+        # The last window is usually partial: compare it only when it is large enough to mean something
+        full = rates if self.windows[-1][1] * 2 >= self.window or len(rates) == 1 else rates[:-1]
+        change = 100.0 * (full[-1] - full[0]) / full[0] if full[0] else 0.0
+        complete = sum(1 for _, messages, _ in self.windows if messages >= self.window)
+        windows = [f"{complete} window{'s' if complete > 1 else ''} of {self.window}"] if complete else []
+        if self.windows[-1][1] < self.window:
+            windows.append(f"a partial window of {self.windows[-1][1]}")
+        return (f"{self.written} messages in {' and '.join(windows)}, first {full[0]:.2f} msgs/sec, "
+                f"last {full[-1]:.2f} msgs/sec ({change:+.0f}%), min {min(full):.2f}, max {max(full):.2f}")